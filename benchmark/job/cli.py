@@ -8,6 +8,12 @@ from gymlib.infra_paths import (
     get_workload_dirname,
     get_workload_suffix,
 )
+from gymlib.workload import WORKLOAD_BUNDLE_FNAME, write_workload_bundle
+from gymlib.workload_templates import (
+    WORKLOAD_TEMPLATES_FNAME,
+    group_by_template,
+    write_workload_templates,
+)
 from gymlib.workspace import DBGymWorkspace, fully_resolve_path, name_to_linkname
 
 from util.shell import subprocess_run
@@ -272,6 +278,7 @@ def _generate_job_workload(
     else:
         assert False
 
+    queries = []
     with open(workload_path / "order.txt", "w") as f:
         queries_parent_path = dbgym_workspace.dbgym_cur_symlinks_path / (
             name_to_linkname(JOB_QUERIES_DNAME)
@@ -280,6 +287,16 @@ def _generate_job_workload(
         for qname in query_names:
             sql_path = fully_resolve_path(queries_parent_path / f"{qname}.sql")
             f.write(f"Q{qname},{sql_path}\n")
+            with open(sql_path, "r") as qf:
+                queries.append((f"Q{qname}", qf.read()))
+    # Workload loads the bundle instead of order.txt since it only has to open one file.
+    write_workload_bundle(workload_path / WORKLOAD_BUNDLE_FNAME, queries)
+    # JOB's queries of the same template (e.g. 1a to 1d) have very different runtimes, so the
+    #   templates are marked as unsafe for time_workload_by_template().
+    write_workload_templates(
+        workload_path / WORKLOAD_TEMPLATES_FNAME,
+        group_by_template(queries, is_template_safe=False),
+    )
 
     workload_symlink_path = dbgym_workspace.link_result(workload_path)
     assert workload_symlink_path == expected_workload_symlink_path
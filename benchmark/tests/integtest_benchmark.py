@@ -8,16 +8,25 @@ from gymlib.infra_paths import (
     get_workload_suffix,
     get_workload_symlink_path,
 )
+from gymlib.workload import WORKLOAD_BUNDLE_FNAME
+from gymlib.workload_templates import WORKLOAD_TEMPLATES_FNAME
 from gymlib.workspace import (
     DBGymWorkspace,
     fully_resolve_path,
     get_workspace_path_from_config,
+    name_to_linkname,
 )
 
 # It's ok to import private functions from the benchmark module because this is an integration test.
 from benchmark.job.cli import _job_tables, _job_workload
-from benchmark.tpch.cli import _tpch_tables, _tpch_workload
+from benchmark.tpch.cli import (
+    TPCH_KIT_DIRNAME,
+    _clone_tpch_kit,
+    _tpch_tables,
+    _tpch_workload,
+)
 from benchmark.tpch.constants import DEFAULT_TPCH_SEED
+from benchmark.tpch.qgen import TpchQueryGenerator, verify_qgen
 
 
 class BenchmarkTests(unittest.TestCase):
@@ -78,6 +87,29 @@ class BenchmarkTests(unittest.TestCase):
         )
         self.assertTrue(workload_path.exists())
         self.assertTrue(fully_resolve_path(workload_path).exists())
+        self.assertTrue(
+            (fully_resolve_path(workload_path) / WORKLOAD_BUNDLE_FNAME).exists()
+        )
+        self.assertTrue(
+            (fully_resolve_path(workload_path) / WORKLOAD_TEMPLATES_FNAME).exists()
+        )
+
+    def test_tpch_qgen(self) -> None:
+        _clone_tpch_kit(self.workspace)
+        dbgen_path = (
+            self.workspace.dbgym_cur_symlinks_path
+            / name_to_linkname(TPCH_KIT_DIRNAME)
+            / "dbgen"
+        )
+        for scale_factor in [0.01, 1, 10]:
+            mismatches = verify_qgen(
+                TpchQueryGenerator(dbgen_path),
+                dbgen_path,
+                [DEFAULT_TPCH_SEED, 1, 2, 3],
+                scale_factor,
+                self.workspace.dbgym_tmp_path,
+            )
+            self.assertEqual(mismatches, [])
 
     def test_job_workload(self) -> None:
         workload_path = get_workload_symlink_path(
@@ -93,6 +125,12 @@ class BenchmarkTests(unittest.TestCase):
         _job_workload(self.workspace, "all", DEFAULT_SCALE_FACTOR)
         self.assertTrue(workload_path.exists())
         self.assertTrue(fully_resolve_path(workload_path).exists())
+        self.assertTrue(
+            (fully_resolve_path(workload_path) / WORKLOAD_BUNDLE_FNAME).exists()
+        )
+        self.assertTrue(
+            (fully_resolve_path(workload_path) / WORKLOAD_TEMPLATES_FNAME).exists()
+        )
 
 
 if __name__ == "__main__":
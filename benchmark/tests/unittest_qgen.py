@@ -0,0 +1,195 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from benchmark.tpch.constants import NUM_TPCH_QUERIES
+from benchmark.tpch.qgen import (
+    QgenRandom,
+    TpchQueryGenerator,
+    get_query_params,
+    get_verify_seeds,
+    next_rand,
+    parse_dists,
+    parse_tpcd_defines,
+    substitute_template,
+)
+
+DISTS_TEXT = """\
+# A comment.
+BEGIN colors
+COUNT|3
+red|1
+green|2 # Another comment.
+blue|3
+END colors
+begin Regions
+COUNT|2
+AFRICA|1
+ASIA|1
+end Regions
+"""
+
+TPCD_TEXT = """\
+#ifdef SQLSERVER
+#define GEN_QUERY_PLAN  "set showplan on"
+#define START_TRAN      "begin transaction"
+#define END_TRAN        "commit transaction"
+#define SET_OUTPUT      ""
+#define SET_ROWCOUNT    "set rowcount %d\\n"
+#define SET_DBASE       "use %s;\\n"
+#endif
+
+#ifdef POSTGRESQL
+#define GEN_QUERY_PLAN  "explain"
+#define START_TRAN      "start transaction"
+#define END_TRAN        "commit;"
+#define SET_OUTPUT      ""
+#define SET_ROWCOUNT    "limit %d;\\n"
+#define SET_DBASE       ""
+#endif
+"""
+
+
+class QgenTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = Path.cwd() / "benchmark/tests/test_qgen_scratchspace/"
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_next_rand(self) -> None:
+        # This is the standard check for the Lehmer generator with this multiplier and modulus.
+        seed = 1
+        for _ in range(10000):
+            seed = next_rand(seed)
+        self.assertEqual(seed, 1043618065)
+
+    def test_unif_int_streams(self) -> None:
+        rng = QgenRandom(1)
+        self.assertEqual(rng.streams[:3], [1, 16807, 282475249])
+        value = rng.unif_int(1, 10, 2)
+        self.assertEqual(value, 1 + int(next_rand(282475249) / 2147483647 * 10))
+        # The other streams aren't advanced.
+        self.assertEqual(rng.streams[1], 16807)
+
+    def test_unif_int_is_in_range(self) -> None:
+        rng = QgenRandom(15721)
+        values = {rng.unif_int(3, 7, 1) for _ in range(1000)}
+        self.assertEqual(values, {3, 4, 5, 6, 7})
+
+    def test_parse_dists(self) -> None:
+        distributions = parse_dists(DISTS_TEXT)
+        self.assertEqual(
+            distributions,
+            {
+                "colors": [("red", 1), ("green", 3), ("blue", 6)],
+                "regions": [("AFRICA", 1), ("ASIA", 2)],
+            },
+        )
+
+    def test_pick_str_is_weighted(self) -> None:
+        distributions = parse_dists(DISTS_TEXT)
+        rng = QgenRandom(15721)
+        counts = {"red": 0, "green": 0, "blue": 0}
+        for _ in range(6000):
+            counts[rng.pick_str(distributions["colors"], 1)[1]] += 1
+        self.assertLess(counts["red"], counts["green"])
+        self.assertLess(counts["green"], counts["blue"])
+
+    def test_parse_tpcd_defines(self) -> None:
+        defines = parse_tpcd_defines(TPCD_TEXT, "POSTGRESQL")
+        self.assertEqual(defines["SET_ROWCOUNT"], "limit %d;\n")
+        self.assertEqual(defines["END_TRAN"], "commit;")
+
+    def test_substitute_template(self) -> None:
+        defines = parse_tpcd_defines(TPCD_TEXT, "POSTGRESQL")
+        template = (
+            "-- A comment which stays.\n"
+            "/* A comment\nwhich is removed. */:x\n"
+            ":o\n"
+            "select * from t where a = ':1' and b = :10 -- q:q\n"
+            ":n 100\n"
+        )
+        query = substitute_template(
+            template, 3, {1: "abc", 10: "42"}, defines, stream=0
+        )
+        self.assertEqual(
+            query,
+            "-- A comment which stays.\n"
+            "\n"
+            "\n"
+            "select * from t where a = 'abc' and b = 42 -- q3\n"
+            "limit 100;\n",
+        )
+
+    def test_q8_region_is_cumulative_nation_weight(self) -> None:
+        # Like in dists.dss, the weights of nations are deltas between the indexes of their regions.
+        distributions = parse_dists(
+            "BEGIN nations\nCOUNT|3\nALGERIA|0\nCHINA|2\nEGYPT|-1\nEND nations\n"
+            "BEGIN nations2\nCOUNT|3\nALGERIA|1\nCHINA|1\nEGYPT|1\nEND nations2\n"
+            "BEGIN regions\nCOUNT|3\nAFRICA|0\nAMERICA|0\nASIA|0\nEND regions\n"
+            "BEGIN p_types\nCOUNT|1\nSMALL BRUSHED TIN|1\nEND p_types\n"
+        )
+        expected_regions = {"ALGERIA": "AFRICA", "CHINA": "ASIA", "EGYPT": "AMERICA"}
+        for seed in range(100):
+            params = get_query_params(8, QgenRandom(seed), distributions, 1)
+            self.assertEqual(params[2], expected_regions[params[1]])
+
+    def test_get_verify_seeds(self) -> None:
+        seeds = list(range(100, 200))
+        self.assertEqual(get_verify_seeds(seeds, 0), [])
+        self.assertEqual(get_verify_seeds(seeds, 1), [100])
+        verify_seeds = get_verify_seeds(seeds, 5)
+        self.assertEqual(len(set(verify_seeds)), 5)
+        self.assertEqual(verify_seeds[:2], [100, 199])
+        self.assertTrue(set(verify_seeds) <= set(seeds))
+        # The same seeds are always checked.
+        self.assertEqual(get_verify_seeds(seeds, 5), verify_seeds)
+        self.assertEqual(get_verify_seeds([1, 2], 5), [1, 2])
+
+    def test_generator(self) -> None:
+        dbgen_path = self.scratchspace_path / "dbgen"
+        (dbgen_path / "queries").mkdir(parents=True)
+        with open(dbgen_path / "dists.dss", "w") as f:
+            f.write(
+                DISTS_TEXT
+                + "BEGIN nations\nCOUNT|2\nnations a|0\nnations b|1\nEND nations\n"
+                + "".join(
+                    f"BEGIN {name}\nCOUNT|2\n{name} a x|1\n{name} b y|1\nEND {name}\n"
+                    for name in [
+                        "nations2",
+                        "p_types",
+                        "msegmnt",
+                        "smode",
+                        "q13a",
+                        "q13b",
+                        "p_cntr",
+                    ]
+                )
+            )
+        with open(dbgen_path / "tpcd.h", "w") as f:
+            f.write(TPCD_TEXT)
+        for qnum in range(1, NUM_TPCH_QUERIES + 1):
+            with open(dbgen_path / "queries" / f"{qnum}.sql", "w") as f:
+                f.write("select :q, ':1', ':2';\n")
+
+        generator = TpchQueryGenerator(dbgen_path)
+        queries = generator.generate(15721, 1)
+        self.assertEqual(len(queries), NUM_TPCH_QUERIES)
+        self.assertTrue(
+            queries[0].startswith("-- using 15721 as a seed to the RNG\nselect 1, '")
+        )
+        self.assertEqual(queries, generator.generate(15721, 1))
+        self.assertNotEqual(queries, generator.generate(15722, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import click
 from gymlib.infra_paths import (
@@ -9,6 +10,12 @@ from gymlib.infra_paths import (
     get_workload_suffix,
     get_workload_symlink_path,
 )
+from gymlib.workload import WORKLOAD_BUNDLE_FNAME, write_workload_bundle
+from gymlib.workload_templates import (
+    WORKLOAD_TEMPLATES_FNAME,
+    group_by_template,
+    write_workload_templates,
+)
 from gymlib.workspace import (
     DBGymWorkspace,
     fully_resolve_path,
@@ -18,9 +25,20 @@ from gymlib.workspace import (
 )
 
 from benchmark.tpch.constants import DEFAULT_TPCH_SEED, NUM_TPCH_QUERIES
+from benchmark.tpch.qgen import (
+    TpchQueryGenerator,
+    get_verify_seeds,
+    run_qgen,
+    verify_qgen,
+)
 from util.shell import subprocess_run
 
 TPCH_KIT_DIRNAME = "tpch-kit"
+QGEN_MODES = ["in-process", "subprocess"]
+# We use tpch-kit's qgen by default until the in-process generator has been checked against it by
+#   test_tpch_qgen in benchmark/tests/integtest_benchmark.py.
+DEFAULT_QGEN_MODE = "subprocess"
+DEFAULT_NUM_QGEN_VERIFY_SEEDS = 3
 
 
 @click.group(name="tpch")
@@ -65,6 +83,18 @@ def _tpch_tables(dbgym_workspace: DBGymWorkspace, scale_factor: float) -> None:
     default="all",
 )
 @click.option("--scale-factor", type=float, default=DEFAULT_SCALE_FACTOR)
+@click.option(
+    "--qgen-mode",
+    type=click.Choice(QGEN_MODES),
+    default=DEFAULT_QGEN_MODE,
+    help="Whether to generate the queries in-process (see benchmark/tpch/qgen.py) or with tpch-kit's qgen. In-process generation falls back to qgen if it doesn't match qgen on the verification seeds.",
+)
+@click.option(
+    "--num-qgen-verify-seeds",
+    type=int,
+    default=DEFAULT_NUM_QGEN_VERIFY_SEEDS,
+    help="The number of seeds for which the in-process queries are compared against qgen's. These are the first and last seeds plus a sample of the others which is the same for the same seeds.",
+)
 @click.pass_obj
 def tpch_workload(
     dbgym_workspace: DBGymWorkspace,
@@ -72,8 +102,18 @@ def tpch_workload(
     seed_end: int,
     query_subset: str,
     scale_factor: float,
+    qgen_mode: str,
+    num_qgen_verify_seeds: int,
 ) -> None:
-    _tpch_workload(dbgym_workspace, seed_start, seed_end, query_subset, scale_factor)
+    _tpch_workload(
+        dbgym_workspace,
+        seed_start,
+        seed_end,
+        query_subset,
+        scale_factor,
+        qgen_mode,
+        num_qgen_verify_seeds,
+    )
 
 
 def _tpch_workload(
@@ -82,6 +122,8 @@ def _tpch_workload(
     seed_end: int,
     query_subset: str,
     scale_factor: float,
+    qgen_mode: str = DEFAULT_QGEN_MODE,
+    num_qgen_verify_seeds: int = DEFAULT_NUM_QGEN_VERIFY_SEEDS,
 ) -> None:
     """
     This function exists as a hook for integration tests.
@@ -90,7 +132,14 @@ def _tpch_workload(
         seed_start <= seed_end
     ), f"seed_start ({seed_start}) must be <= seed_end ({seed_end})"
     _clone_tpch_kit(dbgym_workspace)
-    _generate_tpch_queries(dbgym_workspace, seed_start, seed_end, scale_factor)
+    _generate_tpch_queries(
+        dbgym_workspace,
+        seed_start,
+        seed_end,
+        scale_factor,
+        qgen_mode,
+        num_qgen_verify_seeds,
+    )
     _generate_tpch_workload(
         dbgym_workspace, seed_start, seed_end, query_subset, scale_factor
     )
@@ -121,33 +170,76 @@ def _clone_tpch_kit(dbgym_workspace: DBGymWorkspace) -> None:
 
 
 def _generate_tpch_queries(
-    dbgym_workspace: DBGymWorkspace, seed_start: int, seed_end: int, scale_factor: float
+    dbgym_workspace: DBGymWorkspace,
+    seed_start: int,
+    seed_end: int,
+    scale_factor: float,
+    qgen_mode: str = DEFAULT_QGEN_MODE,
+    num_qgen_verify_seeds: int = DEFAULT_NUM_QGEN_VERIFY_SEEDS,
 ) -> None:
-    tpch_kit_path = dbgym_workspace.dbgym_cur_symlinks_path / (
-        name_to_linkname(TPCH_KIT_DIRNAME)
+    assert qgen_mode in QGEN_MODES, f"qgen_mode ({qgen_mode}) must be in {QGEN_MODES}."
+    dbgen_path = (
+        dbgym_workspace.dbgym_cur_symlinks_path
+        / name_to_linkname(TPCH_KIT_DIRNAME)
+        / "dbgen"
+    )
+    seeds = [
+        seed
+        for seed in range(seed_start, seed_end + 1)
+        if not (
+            dbgym_workspace.dbgym_cur_symlinks_path
+            / name_to_linkname(_get_queries_dirname(seed, scale_factor))
+        ).exists()
+    ]
+    logging.info(
+        f"Generating queries: [{seed_start}, {seed_end}] ({len(seeds)} seeds not generated yet)"
     )
-    logging.info(f"Generating queries: [{seed_start}, {seed_end}]")
-    for seed in range(seed_start, seed_end + 1):
-        expected_queries_symlink_path = dbgym_workspace.dbgym_cur_symlinks_path / (
-            name_to_linkname(_get_queries_dirname(seed, scale_factor))
+    if len(seeds) == 0:
+        return
+
+    generator = None
+    if qgen_mode == "in-process":
+        generator = TpchQueryGenerator(dbgen_path)
+        verify_seeds = get_verify_seeds(seeds, num_qgen_verify_seeds)
+        mismatches = verify_qgen(
+            generator,
+            dbgen_path,
+            verify_seeds,
+            scale_factor,
+            dbgym_workspace.dbgym_tmp_path,
         )
-        if expected_queries_symlink_path.exists():
-            continue
+        if len(mismatches) > 0:
+            logging.warning(
+                f"Falling back to qgen since {len(mismatches)} queries of seeds {verify_seeds} differ from qgen's"
+            )
+            generator = None
 
+    def generate_seed(seed: int) -> None:
         queries_parent_path = (
             dbgym_workspace.dbgym_this_run_path
             / _get_queries_dirname(seed, scale_factor)
         )
         queries_parent_path.mkdir(parents=False, exist_ok=False)
-        for i in range(1, NUM_TPCH_QUERIES + 1):
-            target_sql = (queries_parent_path / f"{i}.sql").resolve()
-            subprocess_run(
-                f"DSS_QUERY=./queries ./qgen {i} -r {seed} -s {scale_factor} > {target_sql}",
-                cwd=tpch_kit_path / "dbgen",
-                verbose=False,
-            )
-        queries_symlink_path = dbgym_workspace.link_result(queries_parent_path)
-        assert queries_symlink_path.samefile(expected_queries_symlink_path)
+        if generator is None:
+            run_qgen(dbgen_path, seed, scale_factor, queries_parent_path)
+            return
+        for i, query in enumerate(generator.generate(seed, scale_factor), 1):
+            with open(queries_parent_path / f"{i}.sql", "w") as f:
+                f.write(query)
+
+    # The seeds are independent so we generate them in parallel. We link them afterwards since
+    #   link_result() isn't thread-safe.
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(generate_seed, seeds))
+    for seed in seeds:
+        queries_symlink_path = dbgym_workspace.link_result(
+            dbgym_workspace.dbgym_this_run_path
+            / _get_queries_dirname(seed, scale_factor)
+        )
+        assert queries_symlink_path.samefile(
+            dbgym_workspace.dbgym_cur_symlinks_path
+            / name_to_linkname(_get_queries_dirname(seed, scale_factor))
+        )
     logging.info(f"Generated queries: [{seed_start}, {seed_end}]")
 
 
@@ -210,6 +302,7 @@ def _generate_tpch_workload(
     else:
         assert False
 
+    queries = []
     with open(workload_path / "order.txt", "w") as f:
         for seed in range(seed_start, seed_end + 1):
             queries_parent_path = dbgym_workspace.dbgym_cur_symlinks_path / (
@@ -222,6 +315,13 @@ def _generate_tpch_workload(
                     sql_path
                 ), "We should only write existent real absolute paths to a file"
                 f.write(f"S{seed}-Q{qname},{sql_path}\n")
+                with open(sql_path, "r") as qf:
+                    queries.append((f"S{seed}-Q{qname}", qf.read()))
+    # Workload loads the bundle instead of order.txt, which is much faster for many seeds.
+    write_workload_bundle(workload_path / WORKLOAD_BUNDLE_FNAME, queries)
+    write_workload_templates(
+        workload_path / WORKLOAD_TEMPLATES_FNAME, group_by_template(queries)
+    )
 
     workload_symlink_path = dbgym_workspace.link_result(workload_path)
     assert workload_symlink_path == expected_workload_symlink_path
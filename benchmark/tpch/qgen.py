@@ -0,0 +1,402 @@
+"""
+An in-process replacement for tpch-kit's qgen. Running qgen once per query and seed means thousands
+of shell launches for workloads with many seeds, so this file instead parses the query templates,
+dists.dss, and the DBMS-specific strings of tpcd.h once and then applies qgen's substitution rules
+(varsub.c) with the same random number generator (rnd.c), which makes generating a query take
+microseconds.
+
+This is a reimplementation rather than a wrapper, so its output should be checked against the real
+qgen (see verify_qgen()). _generate_tpch_queries() does that for a sample of seeds every time and
+falls back to the real qgen if they differ. It is opt-in (--qgen-mode in-process) until it has been
+checked against the real qgen by test_tpch_qgen in benchmark/tests/integtest_benchmark.py.
+"""
+
+import datetime
+import difflib
+import logging
+import random
+import re
+from pathlib import Path
+
+from benchmark.tpch.constants import NUM_TPCH_QUERIES
+from util.shell import subprocess_run
+
+# These are the constants of the Lehmer generator in rnd.c.
+RNG_MODULUS = 2147483647
+RNG_MULTIPLIER = 16807
+# tpcd.h has a block of these for each DBMS. The default is the one tpch-kit is built with (see
+#   clone_tpch_kit.sh).
+TPCD_DEFINES = [
+    "GEN_QUERY_PLAN",
+    "START_TRAN",
+    "END_TRAN",
+    "SET_OUTPUT",
+    "SET_ROWCOUNT",
+    "SET_DBASE",
+]
+DEFAULT_TPCD_DATABASE = "POSTGRESQL"
+# asc_date in varsub.c is indexed by the number of days since this date.
+ASC_DATE_START = (1992, 1, 1)
+# This is the fraction of the value of all stock in Q11 at scale factor 1.
+Q11_FRACTION = 0.0001
+# The template tag (":") and the 10 parameters of varsub.c.
+TEMPLATE_TAG = ":"
+MAX_PARAM = 10
+
+# A distribution is a list of (text, cumulative weight) pairs, as read_dist() in bm_utils.c builds.
+Distribution = list[tuple[str, int]]
+
+
+def next_rand(seed: int) -> int:
+    return (seed * RNG_MULTIPLIER) % RNG_MODULUS
+
+
+class QgenRandom:
+    """
+    The random number streams of qgen. Like qgen, stream i is used by query i.
+    """
+
+    def __init__(self, seed: int) -> None:
+        # This is how qgen's main() seeds the streams of the queries from the -r seed.
+        if seed < 0:
+            seed += RNG_MODULUS
+        self.streams = [seed]
+        for _ in range(NUM_TPCH_QUERIES):
+            self.streams.append(next_rand(self.streams[-1]))
+
+    def unif_int(self, low: int, high: int, stream: int) -> int:
+        """
+        Returns a random integer in [low, high], like UnifInt() in rnd.c.
+        """
+        self.streams[stream] = next_rand(self.streams[stream])
+        return low + int(self.streams[stream] / RNG_MODULUS * (high - low + 1))
+
+    def pick_str(self, distribution: Distribution, stream: int) -> tuple[int, str]:
+        """
+        Returns the index and the text of a random member of distribution, weighted by the weights
+        of its members, like pick_str() in bm_utils.c.
+        """
+        target_weight = self.unif_int(1, distribution[-1][1], stream)
+        index = 0
+        while distribution[index][1] < target_weight:
+            index += 1
+        return index, distribution[index][0]
+
+
+def parse_dists(dists_text: str) -> dict[str, Distribution]:
+    """
+    Parses dists.dss into its distributions, keyed by their lowercase name. The weights are made
+    cumulative like read_dist() in bm_utils.c does.
+    """
+    distributions: dict[str, Distribution] = {}
+    name = None
+    for line in dists_text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line == "":
+            continue
+        tokens = line.split("|")
+        if len(tokens) == 1:
+            keyword, _, arg = line.partition(" ")
+            if keyword.lower() == "begin":
+                name = arg.strip().lower()
+                distributions[name] = []
+            elif keyword.lower() == "end":
+                name = None
+            continue
+        assert name is not None, f"{line} is outside of a distribution."
+        text, weight = tokens[0], int(tokens[1])
+        if text.lower() == "count":
+            continue
+        cumulative_weight = weight + (
+            distributions[name][-1][1] if distributions[name] else 0
+        )
+        distributions[name].append((text, cumulative_weight))
+    return distributions
+
+
+def parse_tpcd_defines(tpcd_text: str, database: str) -> dict[str, str]:
+    """
+    Returns the strings in TPCD_DEFINES for database from tpcd.h.
+    """
+    match = re.search(rf"#ifdef\s+{database}\b(.*?)#endif", tpcd_text, flags=re.DOTALL)
+    assert match is not None, f"tpcd.h has no block for {database}."
+    defines = {}
+    for name, value in re.findall(
+        r'#define\s+(\w+)\s+"((?:[^"\\]|\\.)*)"', match.group(1)
+    ):
+        defines[name] = value.encode().decode("unicode_escape")
+    for name in TPCD_DEFINES:
+        assert name in defines, f"The {database} block of tpcd.h has no {name}."
+    return defines
+
+
+def _get_asc_date(day_offset: int) -> str:
+    # We format the fields ourselves since strftime() is locale-dependent.
+    date = datetime.date(*ASC_DATE_START) + datetime.timedelta(days=day_offset)
+    return f"{date.year:04d}-{date.month:02d}-{date.day:02d}"
+
+
+def _get_month_start(month_offset: int) -> str:
+    return f"19{93 + month_offset // 12:02d}-{month_offset % 12 + 1:02d}-01"
+
+
+def _get_brand(rng: QgenRandom, qnum: int) -> str:
+    manufacturer = rng.unif_int(1, 5, qnum)
+    brand = rng.unif_int(1, 5, qnum)
+    return f"Brand#{manufacturer}{brand}"
+
+
+def _get_distinct_ints(
+    rng: QgenRandom, low: int, high: int, num: int, qnum: int
+) -> list[int]:
+    # Like varsub.c, we redraw a value until it's different from the ones drawn so far.
+    values: list[int] = []
+    while len(values) < num:
+        value = rng.unif_int(low, high, qnum)
+        if value not in values:
+            values.append(value)
+    return values
+
+
+def get_query_params(
+    qnum: int,
+    rng: QgenRandom,
+    distributions: dict[str, Distribution],
+    scale_factor: float,
+) -> dict[int, str]:
+    """
+    Returns the substitution parameters of query qnum (1-indexed, like in the templates). The
+    order of the random draws is the same as in varsub.c.
+    """
+    assert (
+        1 <= qnum <= NUM_TPCH_QUERIES
+    ), f"qnum ({qnum}) must be between 1 and {NUM_TPCH_QUERIES}."
+    params: list[str] = []
+    if qnum == 1:
+        params = [str(rng.unif_int(60, 120, qnum))]
+    elif qnum == 2:
+        size = rng.unif_int(1, 50, qnum)
+        _, part_type = rng.pick_str(distributions["p_types"], qnum)
+        _, region = rng.pick_str(distributions["regions"], qnum)
+        params = [str(size), part_type.rsplit(" ", 1)[-1], region]
+    elif qnum == 3:
+        _, segment = rng.pick_str(distributions["msegmnt"], qnum)
+        params = [segment, _get_asc_date(rng.unif_int(0, 30, qnum) + 1155)]
+    elif qnum in [4, 15]:
+        params = [_get_month_start(rng.unif_int(1, 58, qnum))]
+    elif qnum == 5:
+        _, region = rng.pick_str(distributions["regions"], qnum)
+        params = [region, f"19{rng.unif_int(93, 97, qnum)}-01-01"]
+    elif qnum == 6:
+        year = rng.unif_int(93, 97, qnum)
+        discount = rng.unif_int(2, 9, qnum)
+        quantity = rng.unif_int(24, 25, qnum)
+        params = [f"19{year}-01-01", f"0.0{discount}", str(quantity)]
+    elif qnum == 7:
+        index1, nation1 = rng.pick_str(distributions["nations2"], qnum)
+        index2, nation2 = rng.pick_str(distributions["nations2"], qnum)
+        while index2 == index1:
+            index2, nation2 = rng.pick_str(distributions["nations2"], qnum)
+        params = [nation1, nation2]
+    elif qnum == 8:
+        index, nation = rng.pick_str(distributions["nations2"], qnum)
+        # The weights of nations aren't weights. Instead, the lines of dists.dss are deltas such that
+        #   the cumulative weight of a nation is the index of its region.
+        region_index = distributions["nations"][index][1]
+        assert (
+            0 <= region_index < len(distributions["regions"])
+        ), f"The region index ({region_index}) of nation {index} is out of range."
+        region = distributions["regions"][region_index][0]
+        _, part_type = rng.pick_str(distributions["p_types"], qnum)
+        params = [nation, region, part_type]
+    elif qnum == 9:
+        params = [rng.pick_str(distributions["colors"], qnum)[1]]
+    elif qnum == 10:
+        params = [_get_month_start(rng.unif_int(1, 24, qnum))]
+    elif qnum == 11:
+        _, nation = rng.pick_str(distributions["nations2"], qnum)
+        params = [nation, f"{Q11_FRACTION / scale_factor:11.10f}"]
+    elif qnum == 12:
+        index1, mode1 = rng.pick_str(distributions["smode"], qnum)
+        index2, mode2 = rng.pick_str(distributions["smode"], qnum)
+        while index2 == index1:
+            index2, mode2 = rng.pick_str(distributions["smode"], qnum)
+        params = [mode1, mode2, f"19{rng.unif_int(93, 97, qnum)}-01-01"]
+    elif qnum == 13:
+        _, word1 = rng.pick_str(distributions["q13a"], qnum)
+        _, word2 = rng.pick_str(distributions["q13b"], qnum)
+        params = [word1, word2]
+    elif qnum == 14:
+        params = [_get_month_start(rng.unif_int(1, 60, qnum))]
+    elif qnum == 16:
+        brand = _get_brand(rng, qnum)
+        _, part_type = rng.pick_str(distributions["p_types"], qnum)
+        sizes = _get_distinct_ints(rng, 1, 50, MAX_PARAM - 2, qnum)
+        params = [brand, part_type.rsplit(" ", 1)[0]] + [str(size) for size in sizes]
+    elif qnum == 17:
+        brand = _get_brand(rng, qnum)
+        params = [brand, rng.pick_str(distributions["p_cntr"], qnum)[1]]
+    elif qnum == 18:
+        params = [str(rng.unif_int(312, 315, qnum))]
+    elif qnum == 19:
+        brands = [_get_brand(rng, qnum) for _ in range(3)]
+        quantities = [
+            rng.unif_int(1, 10, qnum),
+            rng.unif_int(10, 20, qnum),
+            rng.unif_int(20, 30, qnum),
+        ]
+        params = brands + [str(quantity) for quantity in quantities]
+    elif qnum == 20:
+        _, color = rng.pick_str(distributions["colors"], qnum)
+        year = rng.unif_int(93, 97, qnum)
+        _, nation = rng.pick_str(distributions["nations2"], qnum)
+        params = [color, f"19{year}-01-01", nation]
+    elif qnum == 21:
+        params = [rng.pick_str(distributions["nations2"], qnum)[1]]
+    elif qnum == 22:
+        params = [str(10 + code) for code in _get_distinct_ints(rng, 0, 24, 7, qnum)]
+    return {i + 1: param for i, param in enumerate(params)}
+
+
+def _strip_c_comments(template: str) -> str:
+    # qgen strips /* */ comments (but not -- comments) unless it's run with -c.
+    return re.sub(r"/\*.*?\*/", "", template, flags=re.DOTALL)
+
+
+def substitute_template(
+    template: str,
+    qnum: int,
+    params: dict[int, str],
+    defines: dict[str, str],
+    stream: int = 0,
+) -> str:
+    """
+    Applies the tags of a query template like qsub() in qgen.c does with qgen's default flags.
+    """
+    output = []
+    for line in _strip_c_comments(template).splitlines(keepends=True):
+        i = 0
+        while True:
+            tag_index = line.find(TEMPLATE_TAG, i)
+            if tag_index == -1 or tag_index + 1 >= len(line):
+                output.append(line[i:])
+                break
+            output.append(line[i:tag_index])
+            tag = line[tag_index + 1]
+            i = tag_index + 2
+            if tag.isdigit():
+                match = re.match(r"\d+", line[tag_index + 1 :])
+                assert match is not None
+                output.append(params.get(int(match.group()), ""))
+                i = tag_index + 1 + len(match.group())
+            elif tag in "nN":
+                match = re.match(r"\s*(-?\d+)\s*", line[i:])
+                rowcount = int(match.group(1)) if match is not None else 0
+                output.append(defines["SET_ROWCOUNT"].replace("%d", str(rowcount)))
+                i += match.end() if match is not None else 0
+            elif tag in "qQ":
+                output.append(str(qnum))
+            elif tag in "sS":
+                output.append(str(stream))
+            # The other tags (b, c, e, o, x) only output something with flags we don't use.
+    return "".join(output)
+
+
+class TpchQueryGenerator:
+    """
+    Generates the same queries as "qgen <qnum> -r <seed> -s <scale_factor>" run in tpch-kit's
+    dbgen directory with DSS_QUERY=./queries.
+    """
+
+    def __init__(
+        self, dbgen_path: Path, tpcd_database: str = DEFAULT_TPCD_DATABASE
+    ) -> None:
+        with open(dbgen_path / "dists.dss", "r") as f:
+            self.distributions = parse_dists(f.read())
+        with open(dbgen_path / "tpcd.h", "r") as f:
+            self.defines = parse_tpcd_defines(f.read(), tpcd_database)
+        self.templates = {}
+        for qnum in range(1, NUM_TPCH_QUERIES + 1):
+            with open(dbgen_path / "queries" / f"{qnum}.sql", "r") as f:
+                self.templates[qnum] = f.read()
+
+    def generate(self, seed: int, scale_factor: float) -> list[str]:
+        """
+        Returns the queries of seed, in order.
+        """
+        queries = []
+        for qnum in range(1, NUM_TPCH_QUERIES + 1):
+            # Each qgen process only generates one query, so each query starts from fresh streams.
+            params = get_query_params(
+                qnum, QgenRandom(seed), self.distributions, scale_factor
+            )
+            queries.append(
+                f"-- using {seed} as a seed to the RNG\n"
+                + substitute_template(self.templates[qnum], qnum, params, self.defines)
+            )
+        return queries
+
+
+def run_qgen(
+    dbgen_path: Path, seed: int, scale_factor: float, queries_path: Path
+) -> None:
+    """
+    Writes the queries of seed to queries_path/<qnum>.sql with the real qgen. All queries of a seed
+    are generated by one shell to save on shell launches.
+    """
+    subprocess_run(
+        f"for i in $(seq 1 {NUM_TPCH_QUERIES}); do DSS_QUERY=./queries ./qgen $i -r {seed} -s {scale_factor} > {queries_path.resolve()}/$i.sql; done",
+        cwd=dbgen_path,
+        verbose=False,
+    )
+
+
+def get_verify_seeds(seeds: list[int], num_verify_seeds: int) -> list[int]:
+    """
+    Returns num_verify_seeds of seeds to check with verify_qgen(). They include the first and the
+    last seed, and the rest are sampled at random. The sample is seeded by seeds so that the same
+    seeds are always checked and a mismatch can be reproduced.
+    """
+    if num_verify_seeds >= len(seeds):
+        return list(seeds)
+    if num_verify_seeds <= 0:
+        return []
+    ends = sorted({seeds[0], seeds[-1]})[:num_verify_seeds]
+    middle = [seed for seed in seeds if seed not in ends]
+    rng = random.Random(",".join(str(seed) for seed in seeds))
+    return ends + sorted(rng.sample(middle, num_verify_seeds - len(ends)))
+
+
+def verify_qgen(
+    generator: TpchQueryGenerator,
+    dbgen_path: Path,
+    seeds: list[int],
+    scale_factor: float,
+    tmp_path: Path,
+) -> list[tuple[int, int]]:
+    """
+    Generates the queries of each seed in seeds with both generator and the real qgen and returns
+    the (seed, qnum) of each query that differs. The diff of the first one is logged.
+    """
+    mismatches: list[tuple[int, int]] = []
+    for seed in seeds:
+        qgen_path = tmp_path / f"qgen_{seed}"
+        qgen_path.mkdir(parents=True, exist_ok=True)
+        run_qgen(dbgen_path, seed, scale_factor, qgen_path)
+        for qnum, query in enumerate(generator.generate(seed, scale_factor), 1):
+            with open(qgen_path / f"{qnum}.sql", "r") as f:
+                expected_query = f.read()
+            if query == expected_query:
+                continue
+            if len(mismatches) == 0:
+                diff = difflib.unified_diff(
+                    expected_query.splitlines(keepends=True),
+                    query.splitlines(keepends=True),
+                    fromfile="qgen",
+                    tofile="TpchQueryGenerator",
+                )
+                logging.warning(
+                    f"Query {qnum} of seed {seed} differs from qgen:\n{''.join(diff)}"
+                )
+            mismatches.append((seed, qnum))
+    return mismatches
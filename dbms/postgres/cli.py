@@ -2,6 +2,7 @@
 At a high level, this file's goal is to (1) build postgres and (2) create dbdata (aka pgdata).
 """
 
+import json
 import logging
 import shutil
 import subprocess
@@ -10,6 +11,13 @@ from typing import Any, Optional
 
 import click
 import sqlalchemy
+from gymlib.dbdata_archive import (
+    DEFAULT_SNAPSHOT_FORMAT,
+    SNAPSHOT_FORMATS,
+    benchmark_snapshot_formats,
+    create_dbdata_snapshot,
+    extract_dbdata_snapshot,
+)
 from gymlib.infra_paths import (
     DEFAULT_SCALE_FACTOR,
     get_dbdata_tgz_symlink_path,
@@ -113,6 +121,12 @@ def _postgres_build(dbgym_workspace: DBGymWorkspace, rebuild: bool) -> None:
     type=Path,
     help=f"The path to the parent directory of the dbdata which will be actively tuned. The default is {get_tmp_path_from_workspace_path(WORKSPACE_PATH_PLACEHOLDER)}.",
 )
+@click.option(
+    "--snapshot-format",
+    type=click.Choice(SNAPSHOT_FORMATS),
+    default=DEFAULT_SNAPSHOT_FORMAT,
+    help=f'The compression format of the dbdata snapshot. "pigz" and "zstd" use all cores. The format is detected automatically when restoring. The default is {DEFAULT_SNAPSHOT_FORMAT}.',
+)
 def postgres_dbdata(
     dbgym_workspace: DBGymWorkspace,
     benchmark_name: str,
@@ -120,6 +134,7 @@ def postgres_dbdata(
     pgbin_path: Optional[Path],
     intended_dbdata_hardware: str,
     dbdata_parent_path: Optional[Path],
+    snapshot_format: str,
 ) -> None:
     _postgres_dbdata(
         dbgym_workspace,
@@ -128,6 +143,7 @@ def postgres_dbdata(
         pgbin_path,
         intended_dbdata_hardware,
         dbdata_parent_path,
+        snapshot_format,
     )
 
 
@@ -138,6 +154,7 @@ def _postgres_dbdata(
     pgbin_path: Optional[Path],
     intended_dbdata_hardware: str,
     dbdata_parent_path: Optional[Path],
+    snapshot_format: str = DEFAULT_SNAPSHOT_FORMAT,
 ) -> None:
     """
     This function exists as a hook for integration tests.
@@ -170,7 +187,12 @@ def _postgres_dbdata(
 
     # Create dbdata
     _create_dbdata(
-        dbgym_workspace, benchmark_name, scale_factor, pgbin_path, dbdata_parent_path
+        dbgym_workspace,
+        benchmark_name,
+        scale_factor,
+        pgbin_path,
+        dbdata_parent_path,
+        snapshot_format,
     )
 
 
@@ -180,6 +202,7 @@ def _create_dbdata(
     scale_factor: float,
     pgbin_path: Path,
     dbdata_parent_path: Path,
+    snapshot_format: str,
 ) -> None:
     """
     If you change the code of _create_dbdata(), you should also delete the symlink so that the next time you run
@@ -217,11 +240,12 @@ def _create_dbdata(
     stop_postgres(dbgym_workspace, pgbin_path, dbdata_path)
 
     # Create .tgz file.
+    # The file is always named .tgz but its actual format is snapshot_format. This is fine because the format is
+    #   detected from the file header when the snapshot is restored.
     dbdata_tgz_real_path = dbgym_workspace.dbgym_this_run_path / linkname_to_name(
         expected_dbdata_tgz_symlink_path.name
     )
-    # We need to cd into dbdata_path so that the tar file does not contain folders for the whole path of dbdata_path.
-    subprocess_run(f"tar -czf {dbdata_tgz_real_path} .", cwd=dbdata_path)
+    create_dbdata_snapshot(dbdata_path, dbdata_tgz_real_path, snapshot_format)
 
     # Create symlink.
     # Only link at the end so that the link only ever points to a complete dbdata.
@@ -230,6 +254,67 @@ def _create_dbdata(
     logging.info(f"Created dbdata in {dbdata_tgz_symlink_path}")
 
 
+@postgres_group.command(
+    name="snapshot-benchmark",
+    help="Measure the compression and decompression throughput of each dbdata snapshot format.",
+)
+@click.pass_obj
+@click.argument("benchmark_name", type=str)
+@click.option("--scale-factor", type=float, default=DEFAULT_SCALE_FACTOR)
+@click.option(
+    "--scratch-parent-path",
+    default=None,
+    type=Path,
+    help=f"The path to the parent directory of the snapshots and dbdata created during the benchmark. The default is {get_tmp_path_from_workspace_path(WORKSPACE_PATH_PLACEHOLDER)}.",
+)
+def postgres_snapshot_benchmark(
+    dbgym_workspace: DBGymWorkspace,
+    benchmark_name: str,
+    scale_factor: float,
+    scratch_parent_path: Optional[Path],
+) -> None:
+    _postgres_snapshot_benchmark(
+        dbgym_workspace, benchmark_name, scale_factor, scratch_parent_path
+    )
+
+
+def _postgres_snapshot_benchmark(
+    dbgym_workspace: DBGymWorkspace,
+    benchmark_name: str,
+    scale_factor: float,
+    scratch_parent_path: Optional[Path],
+) -> None:
+    """
+    The results are written to snapshot_benchmark.json in the run directory.
+    """
+    scratch_parent_real_path = fully_resolve_path(
+        scratch_parent_path
+        if scratch_parent_path is not None
+        else get_tmp_path_from_workspace_path(dbgym_workspace.dbgym_workspace_path)
+    )
+    dbdata_tgz_path = fully_resolve_path(
+        get_dbdata_tgz_symlink_path(
+            dbgym_workspace.dbgym_workspace_path, benchmark_name, scale_factor
+        )
+    )
+    dbgym_workspace.save_file(dbdata_tgz_path)
+
+    # We benchmark on the actual dbdata since compression throughput depends heavily on the data.
+    dbdata_path = scratch_parent_real_path / "dbdata_being_benchmarked"
+    extract_dbdata_snapshot(dbdata_tgz_path, dbdata_path)
+    try:
+        results = benchmark_snapshot_formats(
+            dbdata_path, scratch_parent_real_path / "snapshot_benchmark_scratch"
+        )
+    finally:
+        shutil.rmtree(dbdata_path)
+
+    results_path = dbgym_workspace.dbgym_this_run_path / "snapshot_benchmark.json"
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=4)
+    logging.info(f"Wrote snapshot benchmark results to {results_path}")
+
+
 def _generic_dbdata_setup(dbgym_workspace: DBGymWorkspace) -> None:
     # get necessary vars
     pgbin_real_path = get_pgbin_symlink_path(
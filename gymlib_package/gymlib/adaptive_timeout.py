@@ -0,0 +1,102 @@
+"""
+A single query_timeout for the whole workload is either too loose for short queries or too tight
+for long ones. If a 50ms query gets a pathological plan, it wastes the full timeout, which may be
+a minute. This file implements a policy which gives each query its own timeout based on the
+runtimes recently observed for it (under any configuration).
+"""
+
+import json
+import statistics
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+# Only the most recent runtimes of each qid are kept so that the history (and the file it's saved
+#   to) doesn't grow without bound over a long tuning run.
+DEFAULT_TIMEOUT_HISTORY_SIZE = 32
+
+
+class AdaptiveTimeoutPolicy:
+    """
+    Each query's timeout is `multiplier` times its best runtime among the last `history_size`
+    executions which didn't time out, clamped to [floor, ceiling].
+    Queries without any history use the default timeout passed to get_timeout().
+
+    Timeouts are in seconds while runtimes are in microseconds, just like in PostgresConn.
+    """
+
+    def __init__(
+        self,
+        multiplier: float = 2.0,
+        floor: float = 1.0,
+        # ceiling=0 means "no ceiling", following the convention of query_timeout.
+        ceiling: float = 0,
+        # If this is set, the history is loaded from and saved to this JSON file so that it can
+        #   be reused across runs.
+        history_path: Optional[Path] = None,
+        history_size: int = DEFAULT_TIMEOUT_HISTORY_SIZE,
+    ) -> None:
+        assert multiplier >= 1, f"multiplier ({multiplier}) must be at least 1."
+        assert floor > 0, f"floor ({floor}) must be positive."
+        assert (
+            ceiling == 0 or ceiling >= floor
+        ), f"ceiling ({ceiling}) must be 0 or at least floor ({floor})."
+        assert history_size >= 1, f"history_size ({history_size}) must be at least 1."
+        self.multiplier = multiplier
+        self.floor = floor
+        self.ceiling = ceiling
+        self.history_path = history_path
+        self.history_size = history_size
+        # The runtimes of the last history_size executions of each qid which didn't time out.
+        self.history: dict[str, deque[float]] = {}
+
+        if self.history_path is not None and self.history_path.exists():
+            with open(self.history_path) as f:
+                self.history = {
+                    qid: deque(runtimes, maxlen=self.history_size)
+                    for qid, runtimes in json.load(f).items()
+                }
+
+    def record(self, qid: str, runtime: float, did_time_out: bool) -> None:
+        """
+        Timed out executions are not recorded since their runtime is only a lower bound.
+        """
+        if not did_time_out:
+            self.history.setdefault(qid, deque(maxlen=self.history_size)).append(
+                runtime
+            )
+
+    def get_best(self, qid: str) -> Optional[float]:
+        return min(self.history[qid]) if qid in self.history else None
+
+    def get_median(self, qid: str) -> Optional[float]:
+        return statistics.median(self.history[qid]) if qid in self.history else None
+
+    def get_timeout(self, qid: str, default_timeout: float = 0) -> float:
+        """
+        Returns the timeout (in seconds) to run qid with. Following Postgres's convention, 0
+        means "no timeout", which is only possible for qids without history and without a
+        ceiling.
+        """
+        best = self.get_best(qid)
+        if best is None:
+            if self.ceiling > 0 and (
+                default_timeout == 0 or default_timeout > self.ceiling
+            ):
+                return self.ceiling
+            return default_timeout
+
+        timeout = max(self.multiplier * best / 1e6, self.floor)
+        if self.ceiling > 0:
+            timeout = min(timeout, self.ceiling)
+        return timeout
+
+    def save(self) -> None:
+        assert self.history_path is not None, "history_path must be set to save."
+        # We write to a temporary file and rename it so that the history is never half-written.
+        history_tmp_path = self.history_path.parent / f"{self.history_path.name}.tmp"
+        with open(history_tmp_path, "w") as f:
+            json.dump(
+                {qid: list(runtimes) for qid, runtimes in self.history.items()}, f
+            )
+        history_tmp_path.replace(self.history_path)
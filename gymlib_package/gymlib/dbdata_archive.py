@@ -0,0 +1,198 @@
+"""
+Helpers to create and extract dbdata snapshots (the pristine .tgz files).
+
+`tar -czf` and `tar -xf` are single-threaded, which makes them CPU-bound on one core for large
+scale factors. Snapshots can instead be created with parallel gzip (pigz) or multi-threaded zstd.
+Extraction detects the format from the file header, so the snapshot's filename (which always ends
+in .tgz for backwards compatibility) does not need to match its format.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+from plumbum import local
+
+# "gzip" is the format of snapshots created before formats were configurable.
+# "pigz" produces regular gzip files but compresses chunks of the input in parallel.
+SNAPSHOT_FORMATS = ["gzip", "pigz", "zstd"]
+DEFAULT_SNAPSHOT_FORMAT = "zstd"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Uncompressed tar files have "ustar" at offset 257.
+TAR_MAGIC_OFFSET = 257
+TAR_MAGIC = b"ustar"
+# zstd's default level (3) is both faster and smaller than gzip's default level (6).
+ZSTD_LEVEL = 3
+
+
+def get_default_num_threads() -> int:
+    num_cpus = os.cpu_count()
+    return num_cpus if num_cpus is not None else 1
+
+
+def detect_snapshot_format(snapshot_path: Path) -> str:
+    """
+    Returns "gzip", "zstd", or "tar" (uncompressed) based on the header of the file.
+
+    Note that both "gzip" and "pigz" snapshots are detected as "gzip" since they're the same format.
+    """
+    with open(snapshot_path, "rb") as f:
+        header = f.read(TAR_MAGIC_OFFSET + len(TAR_MAGIC))
+
+    if header.startswith(GZIP_MAGIC):
+        return "gzip"
+    elif header.startswith(ZSTD_MAGIC):
+        return "zstd"
+    elif header[TAR_MAGIC_OFFSET:] == TAR_MAGIC:
+        return "tar"
+    else:
+        raise AssertionError(f"Could not detect the format of {snapshot_path}")
+
+
+def _get_compress_program(snapshot_format: str, num_threads: int) -> Optional[str]:
+    """
+    Returns the argument to tar's --use-compress-program, or None for plain gzip.
+    """
+    if snapshot_format == "gzip":
+        return None
+    elif snapshot_format == "pigz":
+        assert shutil.which("pigz") is not None, "pigz is not installed."
+        return f"pigz -p {num_threads}"
+    elif snapshot_format == "zstd":
+        assert shutil.which("zstd") is not None, "zstd is not installed."
+        return f"zstd -T{num_threads} -{ZSTD_LEVEL}"
+    else:
+        raise AssertionError(f'"{snapshot_format}" is not one of {SNAPSHOT_FORMATS}')
+
+
+def _get_decompress_program(detected_format: str, num_threads: int) -> Optional[str]:
+    """
+    Returns the argument to tar's --use-compress-program, or None if tar doesn't need one. tar
+    appends -d to the program itself when extracting.
+    """
+    if detected_format == "gzip":
+        # gzip decompression can't be split across cores, but pigz still decompresses faster than
+        #   gzip because it reads, writes, and checksums in separate threads.
+        return "pigz" if shutil.which("pigz") is not None else "gzip"
+    elif detected_format == "zstd":
+        assert shutil.which("zstd") is not None, "zstd is not installed."
+        return f"zstd -T{num_threads}"
+    else:
+        assert detected_format == "tar"
+        return None
+
+
+def create_dbdata_snapshot(
+    dbdata_path: Path,
+    snapshot_path: Path,
+    snapshot_format: str = DEFAULT_SNAPSHOT_FORMAT,
+    num_threads: Optional[int] = None,
+) -> None:
+    """
+    The snapshot contains the *contents* of dbdata_path (not a folder named after dbdata_path).
+    """
+    if num_threads is None:
+        num_threads = get_default_num_threads()
+    compress_program = _get_compress_program(snapshot_format, num_threads)
+    compress_args = (
+        ["-z"]
+        if compress_program is None
+        else ["--use-compress-program", compress_program]
+    )
+    # We need to -C into dbdata_path so that the tar file does not contain folders for the whole
+    #   path of dbdata_path.
+    local["tar"][
+        "-c", *compress_args, "-f", snapshot_path, "-C", dbdata_path, "."
+    ].run()
+
+
+def extract_dbdata_snapshot(
+    snapshot_path: Path, dbdata_path: Path, num_threads: Optional[int] = None
+) -> None:
+    """
+    Extracts a snapshot of any format into dbdata_path, replacing anything that was there before.
+    """
+    assert snapshot_path.exists()
+    if num_threads is None:
+        num_threads = get_default_num_threads()
+    decompress_program = _get_decompress_program(
+        detect_snapshot_format(snapshot_path), num_threads
+    )
+    decompress_args = (
+        []
+        if decompress_program is None
+        else ["--use-compress-program", decompress_program]
+    )
+
+    local["rm"]["-rf", dbdata_path].run()
+    local["mkdir"]["-m", "0700", "-p", dbdata_path].run()
+
+    # Strip the "dbdata" so we can implant directly into the target dbdata_path.
+    local["tar"][
+        "-x",
+        *decompress_args,
+        "-f",
+        snapshot_path,
+        "-C",
+        dbdata_path,
+        "--strip-components",
+        "1",
+    ].run()
+
+
+def get_dir_size(path: Path) -> int:
+    return sum(
+        (Path(root) / file_name).stat().st_size
+        for root, _, file_names in os.walk(path)
+        for file_name in file_names
+    )
+
+
+def benchmark_snapshot_formats(
+    dbdata_path: Path,
+    scratch_path: Path,
+    snapshot_formats: list[str] = SNAPSHOT_FORMATS,
+    num_threads: Optional[int] = None,
+) -> dict[str, dict[str, float]]:
+    """
+    Snapshots dbdata_path in every format and extracts it again, recording the throughput (in MB of
+    uncompressed dbdata per second) and compression ratio of each format.
+
+    scratch_path is used for the temporary snapshots and extracted dbdata and is deleted at the end.
+    """
+    dbdata_mb = get_dir_size(dbdata_path) / 1024**2
+    scratch_path.mkdir(parents=True, exist_ok=False)
+    results: dict[str, dict[str, float]] = {}
+
+    try:
+        for snapshot_format in snapshot_formats:
+            snapshot_path = scratch_path / f"dbdata.{snapshot_format}"
+            extracted_path = scratch_path / f"dbdata_{snapshot_format}"
+
+            start_time = time.time()
+            create_dbdata_snapshot(
+                dbdata_path, snapshot_path, snapshot_format, num_threads
+            )
+            compress_s = time.time() - start_time
+            start_time = time.time()
+            extract_dbdata_snapshot(snapshot_path, extracted_path, num_threads)
+            decompress_s = time.time() - start_time
+
+            results[snapshot_format] = {
+                "compress_mb_per_s": dbdata_mb / compress_s,
+                "decompress_mb_per_s": dbdata_mb / decompress_s,
+                "compression_ratio": dbdata_mb * 1024**2 / snapshot_path.stat().st_size,
+            }
+            logging.info(f"{snapshot_format}: {json.dumps(results[snapshot_format])}")
+
+            snapshot_path.unlink()
+            shutil.rmtree(extracted_path)
+    finally:
+        shutil.rmtree(scratch_path)
+
+    return results
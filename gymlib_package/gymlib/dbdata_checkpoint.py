@@ -0,0 +1,376 @@
+"""
+Checkpointing dbdata by tarring the whole directory costs I/O proportional to the size of the
+database, even if a tuning step only added one index. This file implements incremental (delta)
+checkpoints whose cost is proportional to the size of what changed instead.
+
+A checkpoint directory looks like this:
+    checkpoint_path/
+        layer0/     files that changed between the base dbdata and the first checkpoint
+        layer1/     files that changed between the first and the second checkpoint
+        ...
+        manifest.json
+
+The base dbdata is an immutable, fully materialized dbdata (the golden dbdata of the pristine
+snapshot, see gymlib.dbdata_restore). The manifest describes the *full* state of the latest
+checkpoint: every file's size, mtime, content hash (if known), and the layer that holds its
+contents (BASE_LAYER if the file is unchanged from the base dbdata). Restoring a checkpoint thus
+only needs to clone the base dbdata and then overlay the latest version of each changed file.
+
+Since the checkpoint is only valid on top of the base dbdata it was taken from, the manifest also
+records the base's key (the snapshot key of the golden dbdata). If the base changes (e.g. because
+the pristine snapshot was regenerated), the checkpoint is discarded instead of being restored on
+top of the wrong base.
+
+Older versions of a file aren't needed once a newer one is committed, so commit() deletes them
+(see compact()). Once more than max_layers layers still hold files, they're merged into one so that
+the number of layers stays bounded.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from gymlib.dbdata_restore import (
+    DEFAULT_NUM_CLONE_THREADS,
+    clone_dbdata,
+    clone_file,
+    get_supports_reflink,
+)
+
+MANIFEST_FNAME = "manifest.json"
+BASE_LAYER = -1
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_CHECKPOINT_LAYERS = 8
+
+
+def get_layer_dname(layer: int) -> str:
+    return f"layer{layer}"
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+@dataclass
+class FileEntry:
+    size: int
+    mtime_ns: int
+    # The hash is only computed when we need it (i.e. when the size or mtime changed) because
+    #   hashing every file would cost as much as copying it.
+    content_hash: Optional[str]
+    layer: int
+
+    def to_json(self) -> list[Any]:
+        return [self.size, self.mtime_ns, self.content_hash, self.layer]
+
+    @staticmethod
+    def from_json(data: list[Any]) -> "FileEntry":
+        return FileEntry(
+            size=data[0], mtime_ns=data[1], content_hash=data[2], layer=data[3]
+        )
+
+
+@dataclass
+class Manifest:
+    # The key of the base dbdata the checkpoint was taken from.
+    base_key: str
+    num_layers: int
+    # Both are keyed by paths relative to the root of dbdata.
+    dirs: set[str]
+    files: dict[str, FileEntry]
+
+
+def _scan_dbdata(dbdata_path: Path) -> tuple[set[str], dict[str, os.stat_result]]:
+    dirs: set[str] = set()
+    file_stats: dict[str, os.stat_result] = {}
+    for root, dir_names, file_names in os.walk(dbdata_path):
+        root_path = Path(root)
+        for dir_name in dir_names:
+            dirs.add(str((root_path / dir_name).relative_to(dbdata_path)))
+        for file_name in file_names:
+            file_path = root_path / file_name
+            file_stats[str(file_path.relative_to(dbdata_path))] = file_path.stat()
+    return dirs, file_stats
+
+
+class DeltaCheckpoint:
+    """
+    Saving a checkpoint is split into stage() and commit() so that callers can make sure a
+    checkpoint is valid (e.g. that Postgres can start from it) before it replaces the previous one.
+    """
+
+    def __init__(
+        self,
+        checkpoint_path: Path,
+        base_dbdata_path: Path,
+        base_key: str,
+        num_threads: int = DEFAULT_NUM_CLONE_THREADS,
+        max_layers: int = DEFAULT_MAX_CHECKPOINT_LAYERS,
+    ) -> None:
+        assert base_dbdata_path.exists()
+        assert max_layers >= 1, f"max_layers ({max_layers}) must be at least 1."
+        self.checkpoint_path = checkpoint_path
+        self.base_dbdata_path = base_dbdata_path
+        self.base_key = base_key
+        self.num_threads = num_threads
+        self.max_layers = max_layers
+        self.checkpoint_path.mkdir(parents=True, exist_ok=True)
+        self._staged_manifest: Optional[Manifest] = None
+
+        if self.has_checkpoint():
+            checkpoint_base_key = self.get_manifest().base_key
+            if checkpoint_base_key != self.base_key:
+                logging.warning(
+                    f"Discarding the checkpoint in {self.checkpoint_path} since it was taken from base {checkpoint_base_key} instead of {self.base_key}"
+                )
+                shutil.rmtree(self.checkpoint_path)
+                self.checkpoint_path.mkdir()
+
+    def _get_manifest_path(self) -> Path:
+        return self.checkpoint_path / MANIFEST_FNAME
+
+    def _get_staged_layer_path(self, layer: int) -> Path:
+        return self.checkpoint_path / f"{get_layer_dname(layer)}.being_created"
+
+    def _get_source_path(self, relpath: str, entry: FileEntry) -> Path:
+        if entry.layer == BASE_LAYER:
+            return self.base_dbdata_path / relpath
+        return self.checkpoint_path / get_layer_dname(entry.layer) / relpath
+
+    def has_checkpoint(self) -> bool:
+        return self._get_manifest_path().exists()
+
+    def get_manifest(self) -> Manifest:
+        """
+        If nothing has been committed yet, the manifest describes the base dbdata.
+        """
+        if not self.has_checkpoint():
+            dirs, file_stats = _scan_dbdata(self.base_dbdata_path)
+            return Manifest(
+                base_key=self.base_key,
+                num_layers=0,
+                dirs=dirs,
+                files={
+                    relpath: FileEntry(stat.st_size, stat.st_mtime_ns, None, BASE_LAYER)
+                    for relpath, stat in file_stats.items()
+                },
+            )
+
+        with open(self._get_manifest_path()) as f:
+            data = json.load(f)
+        return Manifest(
+            # Checkpoints from before the base key was recorded don't have one, so they're never
+            #   restored.
+            base_key=data.get("base_key", ""),
+            num_layers=data["num_layers"],
+            dirs=set(data["dirs"]),
+            files={
+                relpath: FileEntry.from_json(entry)
+                for relpath, entry in data["files"].items()
+            },
+        )
+
+    def stage(self, dbdata_path: Path) -> None:
+        """
+        Saves the files in dbdata_path which changed since the latest checkpoint into a new layer.
+        Postgres must not be running while this is called.
+
+        Staging again before committing discards the previously staged layer.
+        """
+        prev_manifest = self.get_manifest()
+        new_layer = prev_manifest.num_layers
+        staged_layer_path = self._get_staged_layer_path(new_layer)
+        if staged_layer_path.exists():
+            shutil.rmtree(staged_layer_path)
+        staged_layer_path.mkdir()
+
+        dirs, file_stats = _scan_dbdata(dbdata_path)
+        use_reflink = get_supports_reflink(staged_layer_path)
+
+        def get_new_entry(relpath: str) -> FileEntry:
+            stat = file_stats[relpath]
+            prev_entry = prev_manifest.files.get(relpath)
+            if (
+                prev_entry is not None
+                and prev_entry.size == stat.st_size
+                and prev_entry.mtime_ns == stat.st_mtime_ns
+            ):
+                return prev_entry
+
+            content_hash = hash_file(dbdata_path / relpath)
+            if prev_entry is not None:
+                prev_content_hash = prev_entry.content_hash
+                if prev_content_hash is None:
+                    prev_content_hash = hash_file(
+                        self._get_source_path(relpath, prev_entry)
+                    )
+                if prev_content_hash == content_hash:
+                    # The file was rewritten with the same contents so we don't need to save it again.
+                    return FileEntry(
+                        stat.st_size, stat.st_mtime_ns, content_hash, prev_entry.layer
+                    )
+
+            dst_path = staged_layer_path / relpath
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            clone_file(dbdata_path / relpath, dst_path, use_reflink)
+            return FileEntry(stat.st_size, stat.st_mtime_ns, content_hash, new_layer)
+
+        relpaths = list(file_stats.keys())
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            new_entries = list(executor.map(get_new_entry, relpaths))
+
+        self._staged_manifest = Manifest(
+            base_key=self.base_key,
+            num_layers=new_layer + 1,
+            dirs=dirs,
+            files=dict(zip(relpaths, new_entries)),
+        )
+        num_changed_files = sum(1 for entry in new_entries if entry.layer == new_layer)
+        logging.debug(
+            f"Staged checkpoint layer {new_layer} with {num_changed_files}/{len(relpaths)} changed files"
+        )
+
+    def commit(self) -> None:
+        """
+        Makes the staged layer the latest checkpoint.
+        """
+        assert self._staged_manifest is not None, "stage() must be called first."
+        new_layer = self._staged_manifest.num_layers - 1
+        os.rename(
+            self._get_staged_layer_path(new_layer),
+            self.checkpoint_path / get_layer_dname(new_layer),
+        )
+        self._write_manifest(self._staged_manifest)
+        self._staged_manifest = None
+        self.compact()
+
+    def _write_manifest(self, manifest: Manifest) -> None:
+        # We write to a temporary file and rename it so that the manifest is never half-written.
+        manifest_tmp_path = self.checkpoint_path / f"{MANIFEST_FNAME}.tmp"
+        with open(manifest_tmp_path, "w") as f:
+            json.dump(
+                {
+                    "base_key": manifest.base_key,
+                    "num_layers": manifest.num_layers,
+                    "dirs": sorted(manifest.dirs),
+                    "files": {
+                        relpath: entry.to_json()
+                        for relpath, entry in manifest.files.items()
+                    },
+                },
+                f,
+            )
+        os.replace(manifest_tmp_path, self._get_manifest_path())
+
+    def _get_layer_paths(self, num_layers: int) -> dict[int, Path]:
+        """
+        Returns the committed layers which still exist, keyed by layer.
+        """
+        return {
+            layer: self.checkpoint_path / get_layer_dname(layer)
+            for layer in range(num_layers)
+            if (self.checkpoint_path / get_layer_dname(layer)).exists()
+        }
+
+    def compact(self) -> None:
+        """
+        Deletes the versions of files which the latest checkpoint doesn't use. If more than
+        max_layers layers are left, the files in them are moved into a single new layer.
+
+        The manifest always describes a complete checkpoint, so a crash at any point leaves either
+        the checkpoint before compacting or the one after.
+        """
+        manifest = self.get_manifest()
+        layer_relpaths: dict[int, set[str]] = {}
+        for relpath, entry in manifest.files.items():
+            if entry.layer != BASE_LAYER:
+                layer_relpaths.setdefault(entry.layer, set()).add(relpath)
+
+        for layer, layer_path in self._get_layer_paths(manifest.num_layers).items():
+            if layer not in layer_relpaths:
+                shutil.rmtree(layer_path)
+                continue
+            _, file_stats = _scan_dbdata(layer_path)
+            for relpath in file_stats.keys() - layer_relpaths[layer]:
+                (layer_path / relpath).unlink()
+
+        if len(layer_relpaths) <= self.max_layers:
+            return
+
+        new_layer = manifest.num_layers
+        staged_layer_path = self._get_staged_layer_path(new_layer)
+        if staged_layer_path.exists():
+            shutil.rmtree(staged_layer_path)
+        new_files = dict(manifest.files)
+        for relpath, entry in manifest.files.items():
+            if entry.layer == BASE_LAYER:
+                continue
+            dst_path = staged_layer_path / relpath
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            # The files of a layer never change, so the merged layer can share them.
+            os.link(self._get_source_path(relpath, entry), dst_path)
+            new_files[relpath] = FileEntry(
+                entry.size, entry.mtime_ns, entry.content_hash, new_layer
+            )
+        os.rename(staged_layer_path, self.checkpoint_path / get_layer_dname(new_layer))
+        self._write_manifest(
+            Manifest(manifest.base_key, new_layer + 1, manifest.dirs, new_files)
+        )
+        for layer in layer_relpaths:
+            shutil.rmtree(self.checkpoint_path / get_layer_dname(layer))
+        logging.debug(
+            f"Merged {len(layer_relpaths)} checkpoint layers into layer {new_layer}"
+        )
+
+    def restore(self, dbdata_path: Path) -> None:
+        """
+        Materializes the latest checkpoint (or the base dbdata if nothing has been committed) in
+        dbdata_path, replacing anything that was there before.
+        """
+        manifest = self.get_manifest()
+        assert (
+            manifest.base_key == self.base_key
+        ), f"The checkpoint in {self.checkpoint_path} was taken from base {manifest.base_key} instead of {self.base_key}."
+        clone_dbdata(self.base_dbdata_path, dbdata_path, num_threads=self.num_threads)
+        if not self.has_checkpoint():
+            return
+
+        base_dirs, base_file_stats = _scan_dbdata(self.base_dbdata_path)
+        for relpath in base_file_stats.keys() - manifest.files.keys():
+            (dbdata_path / relpath).unlink()
+        # Sorting in reverse makes sure we remove children before their parents.
+        for relpath in sorted(base_dirs - manifest.dirs, reverse=True):
+            if (dbdata_path / relpath).exists():
+                shutil.rmtree(dbdata_path / relpath)
+        # Sorting makes sure we create parents before their children.
+        for relpath in sorted(manifest.dirs - base_dirs):
+            (dbdata_path / relpath).mkdir(mode=0o700, exist_ok=True)
+
+        use_reflink = get_supports_reflink(dbdata_path)
+        layered_files = [
+            (relpath, entry)
+            for relpath, entry in manifest.files.items()
+            if entry.layer != BASE_LAYER
+        ]
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            # list() forces any exception raised in a thread to be raised here.
+            list(
+                executor.map(
+                    lambda layered_file: clone_file(
+                        self._get_source_path(*layered_file),
+                        dbdata_path / layered_file[0],
+                        use_reflink,
+                    ),
+                    layered_files,
+                )
+            )
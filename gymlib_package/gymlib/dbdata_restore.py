@@ -0,0 +1,235 @@
+"""
+Restoring dbdata by untarring a snapshot is slow (tens of seconds for JOB) because the whole
+snapshot has to be decompressed every time. This file lets us pay that cost once per snapshot.
+
+The first restore of a snapshot untars it into a "golden" dbdata directory. Every restore after
+that materializes dbdata by cloning the golden directory. On filesystems which support reflinks
+(e.g. XFS or btrfs), cloning a file is a metadata-only operation that shares the underlying
+blocks copy-on-write, so a restore takes well under a second. On other filesystems, we fall back
+to copying the files in parallel.
+
+The golden directory must never be modified, which is why we don't fall back to hardlinks: Postgres
+writes to relation files in place, so a hardlinked dbdata would write through to the golden copy.
+"""
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from gymlib.dbdata_archive import extract_dbdata_snapshot
+
+# From linux/fs.h. This is _IOW(0x94, 9, int).
+FICLONE = 0x40049409
+# These are the errnos ioctl(FICLONE) returns when the filesystem doesn't support reflinks or
+#   when the source and destination are on different filesystems.
+REFLINK_UNSUPPORTED_ERRNOS = {
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.EXDEV,
+    errno.ENOSYS,
+}
+DEFAULT_NUM_CLONE_THREADS = 16
+GOLDEN_DBDATA_PREFIX = "golden_dbdata_"
+GOLDEN_DBDATA_SOURCE_SUFFIX = ".source"
+
+
+def get_snapshot_key(dbdata_snapshot_path: Path) -> str:
+    """
+    The key includes the size and mtime of the snapshot so that a regenerated snapshot at the same
+    path gets a different key.
+    """
+    snapshot_stat = dbdata_snapshot_path.stat()
+    return hashlib.sha256(
+        f"{dbdata_snapshot_path.resolve()}:{snapshot_stat.st_size}:{snapshot_stat.st_mtime_ns}".encode()
+    ).hexdigest()[:16]
+
+
+def get_golden_dbdata_path(
+    dbdata_parent_path: Path, dbdata_snapshot_path: Path
+) -> Path:
+    """
+    The golden dbdata lives in dbdata_parent_path so that it's on the same filesystem as the dbdata
+    that is cloned from it (reflinks don't work across filesystems).
+
+    The name includes the key of the snapshot so that a regenerated snapshot at the same path
+    doesn't reuse a stale golden dbdata.
+    """
+    return (
+        dbdata_parent_path
+        / f"{GOLDEN_DBDATA_PREFIX}{get_snapshot_key(dbdata_snapshot_path)}"
+    )
+
+
+def ensure_golden_dbdata(dbdata_snapshot_path: Path, golden_dbdata_path: Path) -> None:
+    """
+    Extracts dbdata_snapshot_path into golden_dbdata_path if it hasn't been extracted already.
+
+    This is safe to call from multiple threads or processes at once (e.g. when a PostgresConnPool
+    restores all its instances in parallel). Only one of them will extract the snapshot.
+
+    Each golden dbdata has a GOLDEN_DBDATA_SOURCE_SUFFIX file next to it with the path of its
+    snapshot. When a snapshot is regenerated, the golden dbdatas of its previous versions are
+    deleted so that they don't pile up.
+    """
+    lock_path = _get_golden_dbdata_lock_path(golden_dbdata_path)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not golden_dbdata_path.exists():
+                logging.info(
+                    f"Creating golden dbdata {golden_dbdata_path} from {dbdata_snapshot_path}"
+                )
+                # We extract into a temporary directory and rename it at the end so that
+                #   golden_dbdata_path only ever exists if it is complete.
+                being_created_path = (
+                    golden_dbdata_path.parent
+                    / f"{golden_dbdata_path.name}.being_created"
+                )
+                extract_dbdata_snapshot(dbdata_snapshot_path, being_created_path)
+                os.rename(being_created_path, golden_dbdata_path)
+
+            source_path = _get_golden_dbdata_source_path(golden_dbdata_path)
+            if not source_path.exists():
+                source_path.write_text(str(dbdata_snapshot_path.resolve()))
+                _remove_stale_golden_dbdatas(dbdata_snapshot_path, golden_dbdata_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _get_golden_dbdata_lock_path(golden_dbdata_path: Path) -> Path:
+    return golden_dbdata_path.parent / f"{golden_dbdata_path.name}.lock"
+
+
+def _get_golden_dbdata_source_path(golden_dbdata_path: Path) -> Path:
+    return (
+        golden_dbdata_path.parent
+        / f"{golden_dbdata_path.name}{GOLDEN_DBDATA_SOURCE_SUFFIX}"
+    )
+
+
+def _remove_stale_golden_dbdatas(
+    dbdata_snapshot_path: Path, golden_dbdata_path: Path
+) -> None:
+    """
+    Deletes the other golden dbdatas in golden_dbdata_path's directory which were extracted from
+    (previous versions of) dbdata_snapshot_path.
+    """
+    snapshot_path_str = str(dbdata_snapshot_path.resolve())
+    for source_path in golden_dbdata_path.parent.glob(
+        f"{GOLDEN_DBDATA_PREFIX}*{GOLDEN_DBDATA_SOURCE_SUFFIX}"
+    ):
+        stale_golden_dbdata_path = source_path.parent / source_path.name.removesuffix(
+            GOLDEN_DBDATA_SOURCE_SUFFIX
+        )
+        if (
+            stale_golden_dbdata_path == golden_dbdata_path
+            or source_path.read_text() != snapshot_path_str
+        ):
+            continue
+        stale_lock_path = _get_golden_dbdata_lock_path(stale_golden_dbdata_path)
+        with open(stale_lock_path, "w") as stale_lock_file:
+            # We don't wait for the lock since that could deadlock with a process doing the same
+            #   for the other version. If it's locked, it's in use and we'll get it next time.
+            try:
+                fcntl.flock(stale_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                logging.info(f"Removing stale golden dbdata {stale_golden_dbdata_path}")
+                shutil.rmtree(stale_golden_dbdata_path, ignore_errors=True)
+                source_path.unlink()
+            finally:
+                fcntl.flock(stale_lock_file, fcntl.LOCK_UN)
+        stale_lock_path.unlink(missing_ok=True)
+
+
+def _reflink_file(src_path: Path, dst_path: Path) -> None:
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def clone_file(src_path: Path, dst_path: Path, use_reflink: bool) -> None:
+    if use_reflink:
+        _reflink_file(src_path, dst_path)
+    else:
+        # On Linux, this uses sendfile() so the data never passes through Python.
+        shutil.copyfile(src_path, dst_path)
+
+    # Preserve the mode and times so that the clone is indistinguishable from an untarred snapshot.
+    src_stat = src_path.stat()
+    os.chmod(dst_path, src_stat.st_mode)
+    os.utime(dst_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+
+def get_supports_reflink(path: Path) -> bool:
+    """
+    Returns whether the filesystem of the directory `path` supports reflinks.
+    """
+    src_path = path / ".reflink_probe_src"
+    dst_path = path / ".reflink_probe_dst"
+    try:
+        src_path.write_bytes(b"dbgym")
+        _reflink_file(src_path, dst_path)
+        return True
+    except OSError as e:
+        if e.errno in REFLINK_UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    finally:
+        src_path.unlink(missing_ok=True)
+        dst_path.unlink(missing_ok=True)
+
+
+def clone_dbdata(
+    golden_dbdata_path: Path,
+    dbdata_path: Path,
+    num_threads: int = DEFAULT_NUM_CLONE_THREADS,
+    use_reflink: Optional[bool] = None,
+) -> None:
+    """
+    Materializes dbdata_path from golden_dbdata_path, replacing anything that was there before.
+
+    use_reflink=None means "use reflinks if the filesystem supports them".
+    """
+    assert golden_dbdata_path.exists()
+    if dbdata_path.exists():
+        shutil.rmtree(dbdata_path)
+
+    # We create the directories serially first so that the files can then be cloned in any order.
+    file_pairs: list[tuple[Path, Path]] = []
+    for root, dir_names, file_names in os.walk(golden_dbdata_path):
+        src_root_path = Path(root)
+        dst_root_path = dbdata_path / src_root_path.relative_to(golden_dbdata_path)
+        dst_root_path.mkdir(mode=0o700)
+        os.chmod(dst_root_path, src_root_path.stat().st_mode)
+
+        for name in dir_names + file_names:
+            src_path = src_root_path / name
+            # Symlinks (e.g. a pg_wal/ on another device) are recreated as symlinks. os.walk()
+            #   doesn't descend into symlinked dirs so they won't be copied.
+            if src_path.is_symlink():
+                os.symlink(os.readlink(src_path), dst_root_path / name)
+            elif name in file_names:
+                file_pairs.append((src_path, dst_root_path / name))
+
+    if use_reflink is None:
+        use_reflink = get_supports_reflink(dbdata_path)
+    logging.debug(
+        f"Cloning {len(file_pairs)} files from {golden_dbdata_path} to {dbdata_path} (use_reflink={use_reflink})"
+    )
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        # list() forces any exception raised in a thread to be raised here.
+        list(
+            executor.map(
+                lambda file_pair: clone_file(file_pair[0], file_pair[1], use_reflink),
+                file_pairs,
+            )
+        )
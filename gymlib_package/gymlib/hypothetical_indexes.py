@@ -0,0 +1,51 @@
+"""
+Building an index just to find out whether it helps takes minutes on a large table. HypoPG (which
+dbms/postgres/_build_repo.sh installs) instead lets the planner pretend that an index exists
+without building it, so EXPLAIN shows the plans and costs as if the index were there. This file has
+the results of PostgresConn.evaluate_hypothetical_indexes(), which uses it to screen candidate
+indexes.
+
+Note that these are the planner's estimates, so they're only as good as its cost model. The
+indexes which look best should still be built and timed for real.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+@dataclass
+class HypotheticalIndex:
+    sql: str
+    # The name HypoPG gave the index, which is what shows up in plans. It's None if HypoPG couldn't
+    #   create the index, in which case error is set.
+    name: Optional[str]
+    # In bytes.
+    estimated_size: Optional[int]
+    # The qids whose plan uses the index, in the order of the workload.
+    used_by: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class HypotheticalIndexesResult:
+    # The estimated total cost of each qid without and with the hypothetical indexes.
+    baseline_costs: dict[str, float]
+    costs: dict[str, float]
+    indexes: list[HypotheticalIndex]
+
+    def get_cost_reductions(self) -> dict[str, float]:
+        """
+        Returns how much the hypothetical indexes reduce the estimated cost of each qid.
+        """
+        return {qid: self.baseline_costs[qid] - self.costs[qid] for qid in self.costs}
+
+
+def get_index_names_in_plan(plan: dict[str, Any]) -> set[str]:
+    """
+    Returns the names of all indexes used by a plan node (as in the "Plan" key of EXPLAIN (FORMAT
+    JSON)) and its descendants.
+    """
+    index_names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        index_names |= get_index_names_in_plan(child)
+    return index_names
@@ -2,8 +2,10 @@
 There are multiple parts of the codebase which interact with Postgres. This file contains helpers common to all those parts.
 """
 
+import re
+import socket
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import pglast
 import psutil
@@ -17,7 +19,51 @@ DBGYM_POSTGRES_PASS = "dbgym_pass"
 DBGYM_POSTGRES_DBNAME = "dbgym"
 DEFAULT_POSTGRES_DBNAME = "postgres"
 DEFAULT_POSTGRES_PORT = 5432
-SHARED_PRELOAD_LIBRARIES = "boot,pg_hint_plan,pg_prewarm"
+# pg_stat_statements is needed by the "pg_stat_statements" measurement mode of PostgresConn.time_query().
+#   Preloading it is a trade-off: its hooks compute a queryid and update its entry for every
+#   statement, which adds a small overhead to the runtimes measured in every mode (including "wall").
+#   Remove it from this list if that overhead matters more than that mode. The list is part of the
+#   runtime cache's config fingerprint, so changing it never mixes up cached runtimes.
+SHARED_PRELOAD_LIBRARIES = "boot,pg_hint_plan,pg_prewarm,pg_stat_statements"
+# This is the value initdb writes into postgresql.conf.
+DEFAULT_SHARED_BUFFERS = "128MB"
+PG_MEMORY_UNITS = {
+    "B": 1,
+    "kB": 1024,
+    "MB": 1024**2,
+    "GB": 1024**3,
+    "TB": 1024**4,
+}
+# Memory knobs without a unit (e.g. shared_buffers) are interpreted as a number of 8kB blocks.
+PG_BLOCK_SIZE = 8192
+# These are the values of pg_settings.context for knobs that can be changed with a reload (i.e.
+#   without restarting Postgres). "backend" knobs only take effect in new connections.
+RELOADABLE_SYSKNOB_CONTEXTS = {
+    "sighup",
+    "user",
+    "superuser",
+    "backend",
+    "superuser-backend",
+}
+
+POSTMASTER_PID_FNAME = "postmaster.pid"
+# The status line of postmaster.pid is its 8th line. These are the statuses in which the
+#   postmaster accepts connections.
+POSTMASTER_PID_STATUS_LINE = 8
+POSTMASTER_READY_STATUSES = {"ready", "standby"}
+# These are the severities Postgres logs when it fails to start (e.g. because of an invalid knob).
+STARTUP_ERROR_SEVERITIES = ("FATAL", "PANIC")
+# CREATE INDEX only takes a SHARE lock on its table, so several of them can run at the same time
+#   (even on the same table). Other statements (e.g. DROP INDEX) may conflict with them.
+CREATE_INDEX_REGEX = re.compile(r"\s*CREATE\s+(UNIQUE\s+)?INDEX\b", re.IGNORECASE)
+# This matches both CREATE INDEX statements and pg_indexes.indexdef. The name is optional in
+#   CREATE INDEX and may be quoted.
+CREATE_INDEX_NAME_REGEX = re.compile(
+    r'\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(?!ON\b|CONCURRENTLY\b)("[^"]+"|[^\s(]+)\s+ON\b',
+    re.IGNORECASE,
+)
+# This is the smallest value Postgres accepts for maintenance_work_mem.
+MIN_MAINTENANCE_WORK_MEM_BYTES = 1024 * 1024
 
 
 def sqlalchemy_conn_execute(
@@ -79,6 +125,148 @@ def create_sqlalchemy_conn(
     return engine.connect()
 
 
+def pg_memory_to_bytes(value: str, unitless_multiplier: int = PG_BLOCK_SIZE) -> int:
+    """
+    Converts a Postgres memory setting (e.g. "4GB" or "'512 MB'") to a number of bytes.
+
+    Values without a unit are multiplied by unitless_multiplier. For most memory knobs (e.g.
+    shared_buffers), Postgres interprets unitless values as 8kB blocks.
+    """
+    match = re.fullmatch(r"\s*'?\s*([0-9.]+)\s*([A-Za-z]*)\s*'?\s*", value)
+    assert match is not None, f'"{value}" is not a valid Postgres memory setting.'
+    num = float(match.group(1))
+    unit = match.group(2)
+
+    if unit == "":
+        return int(num * unitless_multiplier)
+    assert unit in PG_MEMORY_UNITS, f'"{unit}" is not a valid Postgres memory unit.'
+    return int(num * PG_MEMORY_UNITS[unit])
+
+
+def get_index_batches(sqls: list[str]) -> list[list[int]]:
+    """
+    Splits sqls into batches (of indexes into sqls) which can each be run concurrently while
+    keeping the result the same as running sqls one at a time. Consecutive CREATE INDEX statements
+    are put in the same batch and every other statement gets its own batch.
+    """
+    batches: list[list[int]] = []
+    is_last_batch_create_index = False
+    for i, sql in enumerate(sqls):
+        is_create_index = CREATE_INDEX_REGEX.match(sql) is not None
+        if is_create_index and is_last_batch_create_index:
+            batches[-1].append(i)
+        else:
+            batches.append([i])
+        is_last_batch_create_index = is_create_index
+    return batches
+
+
+def get_created_index_name(sql: str) -> Optional[str]:
+    """
+    Returns the name of the index a CREATE INDEX statement creates, as Postgres would store it
+    (i.e. lowercase unless quoted). Returns None if sql isn't a CREATE INDEX statement or doesn't
+    name the index.
+    """
+    match = CREATE_INDEX_NAME_REGEX.match(sql)
+    if match is None:
+        return None
+    name = match.group(1)
+    if name.startswith('"'):
+        return name[1:-1]
+    return name.lower()
+
+
+def divide_maintenance_resources(
+    total_maintenance_work_mem: str, total_parallel_workers: int, num_builders: int
+) -> tuple[str, int]:
+    """
+    Returns the maintenance_work_mem and max_parallel_maintenance_workers each of num_builders
+    concurrent index builds should use so that together they use no more than the totals.
+    """
+    assert num_builders >= 1, f"num_builders ({num_builders}) must be at least 1."
+    maintenance_work_mem_bytes = max(
+        pg_memory_to_bytes(total_maintenance_work_mem, unitless_multiplier=1024)
+        // num_builders,
+        MIN_MAINTENANCE_WORK_MEM_BYTES,
+    )
+    return (
+        f"{maintenance_work_mem_bytes // 1024}kB",
+        total_parallel_workers // num_builders,
+    )
+
+
+def get_changed_sysknobs(
+    old_conf_changes: dict[str, str], new_conf_changes: dict[str, str]
+) -> set[str]:
+    """
+    Returns the knobs whose value differs between two sets of conf_changes. A knob which only
+    appears in one of them is considered changed since the other one leaves it at its default.
+    """
+    return {
+        knob
+        for knob in old_conf_changes.keys() | new_conf_changes.keys()
+        if old_conf_changes.get(knob) != new_conf_changes.get(knob)
+    }
+
+
+def conf_value_to_str(value: str) -> str:
+    """
+    Values in conf_changes are written as they would be in postgresql.conf, so they may be wrapped
+    in single quotes (e.g. "'8MB'"). This strips the quotes so the value can be passed to
+    ALTER SYSTEM as a literal.
+    """
+    value = value.strip()
+    if len(value) >= 2 and value[0] == "'" and value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    return value
+
+
+def read_postmaster_pid_file(dbdata_path: Path) -> Optional[tuple[int, Optional[str]]]:
+    """
+    Returns the pid and status (e.g. "starting" or "ready") of the postmaster from its
+    postmaster.pid, or None if the file doesn't exist (or hasn't been fully written yet). The status
+    is None if the postmaster hasn't written it yet.
+    """
+    try:
+        lines = (dbdata_path / POSTMASTER_PID_FNAME).read_text().splitlines()
+    except FileNotFoundError:
+        return None
+
+    if len(lines) == 0 or not lines[0].strip().isdigit():
+        return None
+    pid = int(lines[0].strip())
+    status = (
+        lines[POSTMASTER_PID_STATUS_LINE - 1].strip()
+        if len(lines) >= POSTMASTER_PID_STATUS_LINE
+        else None
+    )
+    return pid, status
+
+
+def get_startup_errors(pglog_text: str) -> list[str]:
+    """
+    Returns the FATAL or PANIC lines of a Postgres log, such as the ones logged when postgresql.conf
+    contains an invalid value or when shared memory can't be allocated.
+    """
+    return [
+        line.strip()
+        for line in pglog_text.splitlines()
+        if any(f"{severity}:" in line for severity in STARTUP_ERROR_SEVERITIES)
+    ]
+
+
+def get_is_port_open(pgport: int) -> bool:
+    """
+    Returns whether anything accepts TCP connections on pgport. Unlike a libpq connection attempt,
+    this doesn't make Postgres log a failed connection.
+    """
+    try:
+        with socket.create_connection(("localhost", pgport), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
 def get_is_postgres_running() -> bool:
     """
     This is often used in assertions to ensure that Postgres isn't running before we
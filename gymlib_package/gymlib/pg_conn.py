@@ -10,22 +10,107 @@ util.pg provides helpers used by *both* of the above files (as well as other fil
 
 import logging
 import os
+import queue
 import shutil
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Any, Optional, Union
 
 import psutil
 import psycopg
 import yaml
-from gymlib.pg import DBGYM_POSTGRES_DBNAME, SHARED_PRELOAD_LIBRARIES, get_kv_connstr
+from gymlib.adaptive_timeout import AdaptiveTimeoutPolicy
+from gymlib.dbdata_checkpoint import DeltaCheckpoint
+from gymlib.dbdata_restore import (
+    clone_dbdata,
+    ensure_golden_dbdata,
+    get_golden_dbdata_path,
+    get_snapshot_key,
+)
+from gymlib.hypothetical_indexes import (
+    HypotheticalIndex,
+    HypotheticalIndexesResult,
+    get_index_names_in_plan,
+)
+from gymlib.pg import (
+    POSTMASTER_PID_FNAME,
+    POSTMASTER_READY_STATUSES,
+    RELOADABLE_SYSKNOB_CONTEXTS,
+    SHARED_PRELOAD_LIBRARIES,
+    conf_value_to_str,
+    divide_maintenance_resources,
+    get_changed_sysknobs,
+    get_index_batches,
+    get_is_port_open,
+    get_kv_connstr,
+    get_startup_errors,
+    read_postmaster_pid_file,
+)
+from gymlib.runtime_cache import RuntimeCache, get_config_fingerprint, get_query_key
+from gymlib.throughput import run_throughput
+from gymlib.timing import QueryTiming, ThroughputTiming, TraceTiming, WorkloadTiming
+from gymlib.trace_workload import TraceWorkload
 from gymlib.workload import Workload
-from gymlib.workspace import DBGymWorkspace, parent_path_of_path
+from gymlib.workspace import DBGymWorkspace
 from plumbum import local
+from psycopg import sql
 from psycopg.errors import ProgramLimitExceeded, QueryCanceled
+from psycopg.pq import TransactionStatus
 
 CONNECT_TIMEOUT = 300
+# statement_timeout has millisecond granularity and 0 disables it, so we never set a timeout below 1ms.
+MIN_STATEMENT_TIMEOUT = 0.001
+SHUTDOWN_TIMEOUT = 180
+RELOAD_POLL_INTERVAL = 0.01
+# Startup and shutdown are probed with exponential backoff between these intervals (in seconds).
+#   Starting in the millisecond range lets us notice that Postgres is ready almost immediately.
+PROBE_INITIAL_INTERVAL = 0.001
+PROBE_MAX_INTERVAL = 0.1
+# These are the ways time_query() can measure a query's runtime:
+#  - "wall" is the wall-clock time of executing the query, including transferring the result to
+#    the client.
+#  - "server_cursor" is the wall-clock time of running the query through a server-side cursor
+#    which discards the rows instead of sending them to the client. The planning time is the time
+#    to DECLARE the cursor and the execution time is the time to run through it.
+#  - "explain" is the execution time reported by EXPLAIN (ANALYZE, TIMING OFF).
+#  - "pg_stat_statements" is the execution time recorded by pg_stat_statements.
+#  - "prepared" is the wall-clock time of executing a prepared statement whose plan was built
+#    ahead of time. The planning time is the time it took to build that plan.
+MEASUREMENT_MODE_WALL = "wall"
+MEASUREMENT_MODE_SERVER_CURSOR = "server_cursor"
+MEASUREMENT_MODE_EXPLAIN = "explain"
+MEASUREMENT_MODE_PG_STAT_STATEMENTS = "pg_stat_statements"
+MEASUREMENT_MODE_PREPARED = "prepared"
+MEASUREMENT_MODES = [
+    MEASUREMENT_MODE_WALL,
+    MEASUREMENT_MODE_SERVER_CURSOR,
+    MEASUREMENT_MODE_EXPLAIN,
+    MEASUREMENT_MODE_PG_STAT_STATEMENTS,
+    MEASUREMENT_MODE_PREPARED,
+]
+SERVER_CURSOR_NAME = "dbgym_timing_cursor"
+PREPARED_STATEMENT_NAME_PREFIX = "dbgym_prepared_"
+# These are the values apply_sysknobs() returns to tell the caller how the knobs were applied.
+SYSKNOBS_APPLIED_NOOP = "noop"
+SYSKNOBS_APPLIED_RELOAD = "reload"
+SYSKNOBS_APPLIED_RESTART = "restart"
+# These are the defaults of apply_indexes(). They're the same as the ones psql() uses for a single
+#   statement.
+INDEX_BUILD_TIMEOUT = 300
+INDEX_BUILD_MAINTENANCE_WORK_MEM = "4GB"
+INDEX_BUILD_POLL_INTERVAL = 1
+# time_trace_workload() logs its progress every this many queries.
+TRACE_LOG_INTERVAL = 10000
+
+
+def get_hint_prefix(query_knobs: list[str]) -> str:
+    """
+    Returns the pg_hint_plan comment to put in front of a query to apply query_knobs.
+    """
+    return f"/*+ {' '.join(query_knobs)} */ " if query_knobs else ""
 
 
 class PostgresConn:
@@ -41,12 +126,15 @@ class PostgresConn:
         pgbin_path: Union[str, Path],
         # Whether this is None determines whether Boot is enabled.
         boot_config_path: Optional[Path],
+        # Whether this is None determines whether time_query() caches runtimes.
+        runtime_cache: Optional[RuntimeCache] = None,
     ) -> None:
 
         self.dbgym_workspace = dbgym_workspace
         self.pgport = pgport
         self.pgbin_path = pgbin_path
         self.boot_config_path = boot_config_path
+        self.runtime_cache = runtime_cache
         self.log_step = 0
 
         # All the paths related to dbdata
@@ -54,11 +142,12 @@ class PostgresConn:
         #   of the database (with the default configuration). It is generated by a call to
         #   `python tune.py dbms postgres ...` and should not be overwritten.
         self.pristine_dbdata_snapshot_path = pristine_dbdata_snapshot_path
-        # checkpoint_dbdata_snapshot_path is the .tgz snapshot that represents the current
-        #   state of the database as it is being tuned. It is generated while tuning and is
-        #   discarded once tuning is completed.
-        self.checkpoint_dbdata_snapshot_path = (
-            dbgym_workspace.dbgym_tmp_path / "checkpoint_dbdata.tgz"
+        # checkpoint_dbdata_path is the delta checkpoint (see gymlib.dbdata_checkpoint) that
+        #   represents the current state of the database as it is being tuned. It is generated
+        #   while tuning and is discarded once tuning is completed. It includes the port so that
+        #   different PostgresConn objects don't overwrite each other's checkpoints.
+        self.checkpoint_dbdata_path = (
+            dbgym_workspace.dbgym_tmp_path / f"checkpoint_dbdata{self.pgport}"
         )
         # dbdata_parent_path is the parent directory of the dbdata that is *actively being tuned*.
         # It is *not* the parent directory of pristine_dbdata_snapshot_path.
@@ -69,6 +158,28 @@ class PostgresConn:
 
         self._conn: Optional[psycopg.Connection[Any]] = None
         self.hint_check_failed_with: Optional[str] = None
+        # Whether pg_stat_statements has been set up for the current connection.
+        self._is_pg_stat_statements_set_up = False
+        # The pg_stat_statements queryid of each query (without its hint prefix) timed with the
+        #   "pg_stat_statements" measurement mode on the current connection.
+        self._pg_stat_statements_queryids: dict[str, int] = {}
+        # The prepared statements of the current connection, keyed by their text (including the hint
+        #   prefix). Each value is the statement's name and the time (in microseconds) it took to plan
+        #   it. Prepared statements only live as long as the connection, so this is cleared by
+        #   disconnect(). Every way of changing the configuration (restart_with_changes(), the reload
+        #   in apply_sysknobs(), and psql()) disconnects, so a plan is never reused across configurations.
+        self._prepared_statements: dict[str, tuple[str, float]] = {}
+        # This is only used to give each prepared statement a unique name.
+        self._num_prepared_statements = 0
+        # The conf_changes currently applied to the running instance. It is None if we don't know
+        #   (e.g. Postgres isn't running), in which case apply_sysknobs() always restarts.
+        self._sysknobs: Optional[dict[str, str]] = None
+        # The parsed Boot config set up on the running instance, which is part of the config
+        #   fingerprint. It is None if Boot isn't enabled.
+        self._boot_config: Optional[dict[str, Any]] = None
+        # The definitions of all indexes, which are part of the config fingerprint. It is None if
+        #   it needs to be re-read (e.g. after psql() since it may have created an index).
+        self._index_defs: Optional[list[str]] = None
 
     def get_kv_connstr(self) -> str:
         return get_kv_connstr(self.pgport)
@@ -99,9 +210,20 @@ class PostgresConn:
         if self._conn is not None:
             self._conn.close()
             self._conn = None
+        self._is_pg_stat_statements_set_up = False
+        self._pg_stat_statements_queryids = {}
+        self._prepared_statements = {}
+
+    def get_pglog_path(self) -> Path:
+        # We log to pg{self.pgport}.log instead of pg.log so that different PostgresConn objects
+        #   don't all try to write to the same file.
+        pglog_path: Path = (
+            self.dbgym_workspace.dbgym_this_run_path / f"pg{self.pgport}.log"
+        )
+        return pglog_path
 
     def move_log(self) -> None:
-        pglog_path = self.dbgym_workspace.dbgym_this_run_path / f"pg{self.pgport}.log"
+        pglog_path = self.get_pglog_path()
         pglog_this_step_path = (
             self.dbgym_workspace.dbgym_this_run_path
             / f"pg{self.pgport}.log.{self.log_step}"
@@ -126,6 +248,7 @@ class PostgresConn:
         query_knobs: list[str] = [],
         add_explain: bool = False,
         timeout: float = 0,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
     ) -> tuple[float, bool, Optional[dict[str, Any]]]:
         """
         It returns the runtime in milliseconds, whether the query timed out, and the explain data if add_explain is True.
@@ -139,42 +262,129 @@ class PostgresConn:
 
         If you write explain in the query manually instead of setting add_explain, it won't return explain_data. This
         is because it won't know the format of the explain data.
+
+        measurement_mode is one of MEASUREMENT_MODES. add_explain=True is the same as
+        measurement_mode=MEASUREMENT_MODE_EXPLAIN.
+
+        See time_query_detailed() if you also want to know whether the result came from the runtime cache.
         """
-        if timeout > 0:
-            self.force_statement_timeout(timeout)
-        else:
-            assert (
-                timeout == 0
-            ), f'Setting timeout to 0 indicates "disable timeout". However, setting timeout ({timeout}) < 0 is a bug.'
+        timing = self.time_query_detailed(
+            query, query_knobs, add_explain, timeout, measurement_mode
+        )
+        return timing.runtime, timing.did_time_out, timing.explain_data
+
+    def time_query_detailed(
+        self,
+        query: str,
+        query_knobs: list[str] = [],
+        add_explain: bool = False,
+        timeout: float = 0,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
+    ) -> QueryTiming:
+        """
+        The same as time_query() but returns a QueryTiming.
+
+        If this PostgresConn has a runtime cache, the cache is consulted first and the query is only
+        executed if the cache doesn't have enough trials for the current configuration.
+        """
+        assert (
+            measurement_mode in MEASUREMENT_MODES
+        ), f'"{measurement_mode}" is not one of {MEASUREMENT_MODES}'
+        if add_explain:
+            assert measurement_mode in {
+                MEASUREMENT_MODE_WALL,
+                MEASUREMENT_MODE_EXPLAIN,
+            }, f"add_explain can't be used with measurement_mode={measurement_mode}."
+            measurement_mode = MEASUREMENT_MODE_EXPLAIN
+
+        hint_prefix = get_hint_prefix(query_knobs)
+        # We don't compute the fingerprint without a cache since it needs to read the indexes.
+        config_fingerprint = (
+            self.get_config_fingerprint() if self.runtime_cache is not None else None
+        )
+        query_key = get_query_key(query, hint_prefix, measurement_mode)
+        if self.runtime_cache is not None and config_fingerprint is not None:
+            cached = self.runtime_cache.get(config_fingerprint, query_key, timeout)
+            if cached is not None:
+                logging.debug(f"{query} was cached ({cached.num_trials} trials)")
+                return cached
+
+        timing = self._execute_and_time_query(
+            query, hint_prefix, measurement_mode, timeout
+        )
+        if self.runtime_cache is not None and config_fingerprint is not None:
+            self.runtime_cache.put(config_fingerprint, query_key, timing, timeout)
+        return timing
+
+    def _execute_and_time_query(
+        self, query: str, hint_prefix: str, measurement_mode: str, timeout: float
+    ) -> QueryTiming:
+        if measurement_mode == MEASUREMENT_MODE_PG_STAT_STATEMENTS:
+            self._set_up_pg_stat_statements()
+
+        assert (
+            timeout >= 0
+        ), f'Setting timeout to 0 indicates "disable timeout". However, setting timeout ({timeout}) < 0 is a bug.'
 
         did_time_out = False
         explain_data = None
+        planning_time: Optional[float] = None
+        execution_time: Optional[float] = None
 
         try:
-            if query_knobs:
-                query = f"/*+ {' '.join(query_knobs)} */ {query}"
+            # Reset this every time before calling execute() so that hint_check_notice_handler works correctly.
+            self.hint_check_failed_with = None
 
-            if add_explain:
+            if measurement_mode == MEASUREMENT_MODE_WALL:
+                start_time = time.time()
+                self._execute_with_timeout(hint_prefix + query, timeout)
+                qid_runtime = (time.time() - start_time) * 1e6
+            elif measurement_mode == MEASUREMENT_MODE_SERVER_CURSOR:
+                planning_time, execution_time = self._time_with_server_cursor(
+                    hint_prefix + query, timeout
+                )
+                qid_runtime = planning_time + execution_time
+            elif measurement_mode == MEASUREMENT_MODE_EXPLAIN:
                 assert (
                     "explain" not in query.lower()
                 ), "If you're using add_explain, don't also write explain manually in the query."
-                query = f"explain (analyze, format json, timing off) {query}"
-
-            # Reset this every time before calling execute() so that hint_check_notice_handler works correctly.
-            self.hint_check_failed_with = None
-
-            start_time = time.time()
-            cursor = self.conn().execute(query)
-            qid_runtime = (time.time() - start_time) * 1e6
-
-            if self.hint_check_failed_with is not None:
-                raise RuntimeError(f"Query hint failed: {self.hint_check_failed_with}")
-
-            if add_explain:
+                cursor = self._execute_with_timeout(
+                    f"explain (analyze, format json, timing off) {hint_prefix}{query}",
+                    timeout,
+                )
                 c = [c for c in cursor][0][0][0]
                 assert "Execution Time" in c
                 qid_runtime = float(c["Execution Time"]) * 1e3
+                planning_time = float(c["Planning Time"]) * 1e3
+                execution_time = qid_runtime
                 explain_data = c
+            elif measurement_mode == MEASUREMENT_MODE_PG_STAT_STATEMENTS:
+                queryid = self._get_pg_stat_statements_queryid(query)
+                prev_totals = self._get_pg_stat_statements_totals(queryid)
+                self._execute_with_timeout(hint_prefix + query, timeout)
+                totals = self._get_pg_stat_statements_totals(queryid)
+                # If another session ran the same statement in between or the entry was evicted
+                #   (see pg_stat_statements.max), the difference isn't the time of our execution.
+                assert (
+                    totals[2] - prev_totals[2] == 1
+                ), f"pg_stat_statements counted {totals[2] - prev_totals[2]} executions of queryid {queryid} instead of 1. Either another session ran it or its entry was evicted."
+                # pg_stat_statements reports times in milliseconds.
+                planning_time = (totals[0] - prev_totals[0]) * 1e3
+                execution_time = (totals[1] - prev_totals[1]) * 1e3
+                assert (
+                    planning_time >= 0 and execution_time >= 0
+                ), f"The times of queryid {queryid} in pg_stat_statements decreased."
+                qid_runtime = execution_time
+            else:
+                assert measurement_mode == MEASUREMENT_MODE_PREPARED
+                name, planning_time = self._prepare(hint_prefix + query, timeout)
+                start_time = time.time()
+                self._execute_with_timeout(f"EXECUTE {name}", timeout)
+                execution_time = (time.time() - start_time) * 1e6
+                qid_runtime = execution_time
+
+            if self.hint_check_failed_with is not None:
+                raise RuntimeError(f"Query hint failed: {self.hint_check_failed_with}")
 
             logging.debug(f"{query} evaluated in {qid_runtime/1e6}")
 
@@ -182,75 +392,421 @@ class PostgresConn:
             logging.debug(f"{query} exceeded evaluation timeout {timeout}")
             qid_runtime = timeout * 1e6
             did_time_out = True
+            # Make sure we don't leave the connection in the aborted transaction.
+            if self.conn().info.transaction_status == TransactionStatus.INERROR:
+                self.conn().rollback()
         except Exception as e:
             raise e
-        finally:
-            # Wipe the statement timeout.
-            self.force_statement_timeout(0)
 
         # qid_runtime is in microseconds.
-        return qid_runtime, did_time_out, explain_data
+        return QueryTiming(
+            qid_runtime,
+            did_time_out,
+            explain_data,
+            planning_time=planning_time,
+            execution_time=execution_time,
+        )
+
+    def _execute_with_timeout(
+        self, query: str, timeout: float, use_pipeline: bool = True
+    ) -> psycopg.Cursor[Any]:
+        """
+        Executes query with a statement timeout (in seconds). Following Postgres's convention,
+        timeout=0 indicates "disable timeout".
+
+        The timeout is set with SET LOCAL in the same transaction as the query and all statements
+        are sent in a single pipeline. This takes one round trip instead of one per statement, which
+        dominates the runtime of sub-millisecond queries. Since SET LOCAL only lasts until the end of
+        the transaction, the timeout never needs to be reset.
+
+        use_pipeline=False sends the same statements without a pipeline. It's only there so that
+        orchestrate.timing_overhead_benchmark can measure what the pipeline saves.
+        """
+        conn = self.conn()
+        if timeout == 0:
+            return conn.execute(query)
+        with conn.pipeline() if use_pipeline else nullcontext(), conn.transaction():
+            conn.execute(f"SET LOCAL statement_timeout = {timeout * 1000}")
+            cursor = conn.execute(query)
+        return cursor
+
+    def _time_with_server_cursor(
+        self, query: str, timeout: float
+    ) -> tuple[float, float]:
+        """
+        Returns the planning time and execution time (in microseconds) of running query through a
+        server-side cursor. MOVE runs the query to completion without sending any rows to the client,
+        so neither the network nor psycopg's result buffering is part of the measurement and the
+        client's memory usage stays bounded no matter how many rows the query returns.
+        """
+        conn = self.conn()
+        # Cursors only exist inside a transaction. If the query is canceled, the transaction is
+        #   rolled back, which also closes the cursor.
+        with conn.transaction():
+            if timeout > 0:
+                conn.execute(f"SET LOCAL statement_timeout = {timeout * 1000}")
+            start_time = time.time()
+            conn.execute(f"DECLARE {SERVER_CURSOR_NAME} NO SCROLL CURSOR FOR {query}")
+            declare_time = time.time()
+            conn.execute(f"MOVE FORWARD ALL IN {SERVER_CURSOR_NAME}")
+            end_time = time.time()
+        return (declare_time - start_time) * 1e6, (end_time - declare_time) * 1e6
+
+    def _prepare(self, query: str, timeout: float) -> tuple[str, float]:
+        """
+        Returns the name of a prepared statement for query and the time (in microseconds) it took
+        to plan it. The statement is only prepared and planned the first time query is seen on the
+        current connection.
+
+        Since queries don't have parameters, Postgres uses a generic plan for them, which it builds on
+        the first EXECUTE and then caches. We build it ahead of time with EXPLAIN EXECUTE so that
+        every EXECUTE we time reuses the cached plan and we get the planning time out of the
+        EXPLAIN output. The hint prefix stays in the PREPARE statement, where pg_hint_plan reads it
+        when planning EXECUTE.
+        """
+        if query in self._prepared_statements:
+            return self._prepared_statements[query]
+
+        # We use a new name every time instead of reusing one so that a PREPARE whose EXPLAIN was
+        #   canceled never clashes with a later one.
+        name = f"{PREPARED_STATEMENT_NAME_PREFIX}{self._num_prepared_statements}"
+        self._num_prepared_statements += 1
+        self.conn().execute(f"PREPARE {name} AS {query}")
+        cursor = self._execute_with_timeout(
+            f"explain (format json, summary on) EXECUTE {name}", timeout
+        )
+        row = cursor.fetchone()
+        assert row is not None
+        planning_time = float(row[0][0]["Planning Time"]) * 1e3
+        self._prepared_statements[query] = (name, planning_time)
+        return name, planning_time
+
+    def _set_up_pg_stat_statements(self) -> None:
+        """
+        pg_stat_statements is in SHARED_PRELOAD_LIBRARIES but its view only exists once the extension
+        is created. track_planning and track_utility can only be set by a superuser, which we are.
+        """
+        if self._is_pg_stat_statements_set_up:
+            return
+        self.conn().execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+        self.conn().execute("SET pg_stat_statements.track_planning = on")
+        # Otherwise, the BEGIN, SET LOCAL, and COMMIT around each query would also be counted.
+        self.conn().execute("SET pg_stat_statements.track_utility = off")
+        self._is_pg_stat_statements_set_up = True
+
+    def _get_pg_stat_statements_queryid(self, query: str) -> int:
+        """
+        Returns the queryid pg_stat_statements records query under. Comments (and thus the hint
+        prefix) don't change the queryid. We get it from EXPLAIN VERBOSE, which shows it since
+        pg_stat_statements turns on compute_query_id. EXPLAIN is a utility statement, so it's not
+        counted as an execution of query.
+        """
+        if query not in self._pg_stat_statements_queryids:
+            row = (
+                self.conn()
+                .execute(f"EXPLAIN (VERBOSE, FORMAT JSON) {query}")
+                .fetchone()
+            )
+            assert row is not None
+            assert (
+                "Query Identifier" in row[0][0]
+            ), "EXPLAIN VERBOSE didn't show a query identifier. Is compute_query_id off?"
+            self._pg_stat_statements_queryids[query] = int(
+                row[0][0]["Query Identifier"]
+            )
+        return self._pg_stat_statements_queryids[query]
+
+    def _get_pg_stat_statements_totals(self, queryid: int) -> tuple[float, float, int]:
+        """
+        Returns the total planning time, the total execution time (both in milliseconds), and the
+        number of executions of queryid run by this user in this database. Only looking at queryid
+        means that statements of other sessions (and the reads of pg_stat_statements) don't count.
+        """
+        row = (
+            self.conn()
+            .execute(
+                "SELECT coalesce(sum(total_plan_time), 0), coalesce(sum(total_exec_time), 0), "
+                + "coalesce(sum(calls), 0) "
+                + "FROM pg_stat_statements "
+                + "WHERE queryid = %s "
+                + "AND userid = (SELECT oid FROM pg_roles WHERE rolname = current_user) "
+                + "AND dbid = (SELECT oid FROM pg_database WHERE datname = current_database())",
+                (queryid,),
+            )
+            .fetchone()
+        )
+        assert row is not None
+        return float(row[0]), float(row[1]), int(row[2])
 
     def time_workload(
         self,
         workload: Workload,
         qknobs: dict[str, list[str]] = {},
         query_timeout: int = 0,
+        workload_budget: float = 0,
+        timeout_policy: Optional[AdaptiveTimeoutPolicy] = None,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
     ) -> tuple[float, int]:
         """
         Returns the total runtime and the number of timed out queries.
 
+        If workload_budget (in seconds) is set, the workload is aborted as soon as the total runtime
+        exceeds it (see time_workload_detailed()). Following the convention of query_timeout,
+        workload_budget=0 means "no budget".
+
+        If timeout_policy is set, each query gets its own timeout from the policy instead of
+        query_timeout, which is only used for queries the policy has no history for. Timed out
+        queries are counted the same way either way.
+
         It's possible that your agent will want to run the workload in a more complex manner (e.g. only running
         a subset of queries, trying many types of qknobs, etc.). It's okay to ignore the time_workload() function
         in that case and write your own function. This is simply a nice "default" implementation.
         """
-        total_runtime: float = 0
-        num_timed_out_queries: int = 0
+        timing = self.time_workload_detailed(
+            workload,
+            qknobs,
+            query_timeout,
+            workload_budget,
+            timeout_policy,
+            measurement_mode,
+        )
+        return timing.total_runtime, timing.num_timed_out
+
+    def time_workload_detailed(
+        self,
+        workload: Workload,
+        qknobs: dict[str, list[str]] = {},
+        query_timeout: int = 0,
+        workload_budget: float = 0,
+        timeout_policy: Optional[AdaptiveTimeoutPolicy] = None,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
+        weights: Optional[dict[str, float]] = None,
+    ) -> WorkloadTiming:
+        """
+        The same as time_workload() but returns a WorkloadTiming, which includes the timing of each query.
+
+        With a workload_budget, each query's statement timeout is capped at the remaining budget.
+        This way, the query which crosses the budget is cancelled as soon as it does so and the
+        remaining queries are skipped. This is useful when comparing a candidate configuration
+        against the best one so far since we can stop as soon as the candidate is worse.
+
+        The runtimes of all queries which completed are recorded in timeout_policy (if set), except
+        for cached ones since they were already recorded when they were measured.
+
+        total_runtime weights the runtime of each query by its weight in the workload (see
+        Workload.get_weights()), which is 1 unless the workload is a subset, so that it estimates
+        the runtime of the workload the subset stands for. num_timed_out and query_timings aren't
+        weighted. If weights is set, it's used instead and only the qids in it are run.
+        """
+        assert (
+            workload_budget >= 0
+        ), f'Setting workload_budget to 0 indicates "no budget". However, setting workload_budget ({workload_budget}) < 0 is a bug.'
+        timing = WorkloadTiming(total_runtime=0, num_timed_out=0)
 
         query_order_set = set(workload.get_query_order())
         assert all(
             qid in query_order_set for qid in qknobs
         ), f"All IDs in qknobs ({qknobs.keys()}) must be in {query_order_set}."
 
-        for qid in workload.get_query_order():
+        if weights is None:
+            weights = workload.get_weights()
+            qids = workload.get_query_order()
+        else:
+            assert all(
+                qid in query_order_set for qid in weights
+            ), f"All IDs in weights ({weights.keys()}) must be in {query_order_set}."
+            qids = list(weights)
+        for qid in qids:
+            if timing.budget_exceeded:
+                timing.skipped_qids.append(qid)
+                continue
+            weight = weights.get(qid, 1.0)
+
+            timeout: float = (
+                timeout_policy.get_timeout(qid, query_timeout)
+                if timeout_policy is not None
+                else query_timeout
+            )
+            is_budget_limited = False
+            if workload_budget > 0:
+                # The query uses up the budget weight times as fast as it runs.
+                remaining_budget = max(
+                    (workload_budget - timing.total_runtime / 1e6) / weight,
+                    MIN_STATEMENT_TIMEOUT,
+                )
+                if timeout == 0 or remaining_budget < timeout:
+                    timeout = remaining_budget
+                    is_budget_limited = True
+
             query = workload.get_query(qid)
             this_query_knobs = qknobs[qid] if qid in qknobs else []
-            runtime, did_time_out, _ = self.time_query(
-                query, query_knobs=this_query_knobs, timeout=query_timeout
+            query_timing = self.time_query_detailed(
+                query,
+                query_knobs=this_query_knobs,
+                timeout=timeout,
+                measurement_mode=measurement_mode,
             )
-            total_runtime += runtime
-            if did_time_out:
-                num_timed_out_queries += 1
+            if is_budget_limited and query_timing.did_time_out:
+                logging.debug(
+                    f"Workload budget {workload_budget}s exceeded while running {qid}"
+                )
+                timing.total_runtime += weight * query_timing.runtime
+                timing.budget_exceeded = True
+                timing.skipped_qids.append(qid)
+                continue
+
+            timing.query_timings[qid] = query_timing
+            if timeout_policy is not None and not query_timing.cached:
+                timeout_policy.record(
+                    qid, query_timing.runtime, query_timing.did_time_out
+                )
+            timing.total_runtime += weight * query_timing.runtime
+            if query_timing.did_time_out:
+                timing.num_timed_out += 1
+            # The client-side runtime may exceed the server-side timeout by a little.
+            if workload_budget > 0 and timing.total_runtime >= workload_budget * 1e6:
+                timing.budget_exceeded = True
 
-        return total_runtime, num_timed_out_queries
+        return timing
+
+    def time_workload_by_template(
+        self,
+        workload: Workload,
+        qknobs: dict[str, list[str]] = {},
+        query_timeout: int = 0,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
+    ) -> WorkloadTiming:
+        """
+        Estimates time_workload_detailed() by only timing the representative qid of each template
+        (see Workload.get_templates()) and weighting it by the number of qids in its template.
+
+        Templates ignore constants, so this is only valid for workloads whose queries of the same
+        template have similar runtimes, such as the seeds of TPC-H. It's refused for workloads whose
+        templates aren't marked as safe (see WorkloadTemplates.is_template_safe), such as JOB.
+
+        total_runtime is the weighted estimate while num_timed_out and query_timings only count the
+        representatives. The qknobs of the other qids are ignored since they aren't run.
+        """
+        templates = workload.get_templates()
+        assert (
+            templates.is_template_safe
+        ), f"Templates of {workload.workload_path} differ in more than constants, so they can't be timed by template."
+        weights: dict[str, float] = dict(templates.get_weights())
+        return self.time_workload_detailed(
+            workload,
+            qknobs,
+            query_timeout,
+            measurement_mode=measurement_mode,
+            weights=weights,
+        )
+
+    def time_trace_workload(
+        self,
+        trace: TraceWorkload,
+        query_knobs: list[str] = [],
+        query_timeout: float = 0,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
+        log_interval: int = TRACE_LOG_INTERVAL,
+    ) -> TraceTiming:
+        """
+        Times every query of trace in a single pass and returns the aggregates. Unlike
+        time_workload(), memory use doesn't grow with the number of queries, so this can replay
+        traces with millions of queries. The aggregates so far are logged every log_interval
+        queries.
+
+        Since the qids of a trace are usually not meaningful, the same query_knobs are used for
+        every query. MEASUREMENT_MODE_PREPARED and MEASUREMENT_MODE_PG_STAT_STATEMENTS aren't
+        supported since they keep a statement or a queryid per distinct query for the lifetime of
+        the connection.
+        """
+        assert measurement_mode not in [
+            MEASUREMENT_MODE_PREPARED,
+            MEASUREMENT_MODE_PG_STAT_STATEMENTS,
+        ], f'time_trace_workload() does not support measurement_mode="{measurement_mode}".'
+        assert log_interval >= 1, f"log_interval ({log_interval}) must be at least 1."
+        timing = TraceTiming()
+        for _, query in trace:
+            timing.add(
+                self.time_query_detailed(
+                    query,
+                    query_knobs=query_knobs,
+                    timeout=query_timeout,
+                    measurement_mode=measurement_mode,
+                )
+            )
+            if timing.num_queries % log_interval == 0:
+                logging.info(
+                    f"Timed {timing.num_queries} queries of {trace.trace_path}: {timing.total_runtime / 1e6:.1f}s in total, "
+                    + f"{timing.get_mean_runtime() / 1e3:.3f}ms on average, {timing.num_timed_out} timed out"
+                )
+        return timing
+
+    def time_workload_throughput(
+        self,
+        workload: Workload,
+        num_clients: int,
+        duration: float,
+        arrival_rate: Optional[float] = None,
+        qknobs: dict[str, list[str]] = {},
+        query_timeout: float = 0,
+    ) -> ThroughputTiming:
+        """
+        Runs the workload's queries round robin with num_clients concurrent clients for duration
+        seconds and returns a ThroughputTiming, from which you can get the throughput and the
+        latency percentiles of each qid.
+
+        If arrival_rate (in queries per second) is None, the clients run in closed loop. Otherwise,
+        queries arrive at that rate in open loop. See gymlib.throughput for details.
+
+        Unlike time_workload(), this doesn't use the runtime cache or check whether hints failed
+        since the clients use their own connections.
+        """
+        query_order_set = set(workload.get_query_order())
+        assert all(
+            qid in query_order_set for qid in qknobs
+        ), f"All IDs in qknobs ({qknobs.keys()}) must be in {query_order_set}."
+        queries = [
+            (qid, get_hint_prefix(qknobs.get(qid, [])) + workload.get_query(qid))
+            for qid in workload.get_query_order()
+        ]
+        return run_throughput(
+            self.get_kv_connstr(),
+            queries,
+            num_clients,
+            duration,
+            arrival_rate,
+            query_timeout,
+        )
 
     def shutdown_postgres(self) -> None:
-        """Shuts down postgres."""
+        """
+        Shuts down postgres.
+
+        Instead of sleeping and polling pg_isready, we wait until the postmaster has removed its
+        pid file and closed its port, probing with exponential backoff.
+        """
         self.disconnect()
+        self._sysknobs = None
+        self._index_defs = None
         if not Path(self.dbdata_path).exists():
             return
 
-        while True:
-            logging.debug("Shutting down postgres...")
-            _, stdout, stderr = local[f"{self.pgbin_path}/pg_ctl"][
-                "stop", "--wait", "-t", "180", "-D", self.dbdata_path
-            ].run(retcode=None)
-            time.sleep(1)
-            logging.debug("Stop message: (%s, %s)", stdout, stderr)
-
-            # Wait until pg_isready fails.
-            retcode, _, _ = local[f"{self.pgbin_path}/pg_isready"][
-                "--host",
-                "localhost",
-                "--port",
-                str(self.pgport),
-                "--dbname",
-                DBGYM_POSTGRES_DBNAME,
-            ].run(retcode=None)
-
-            exists = (Path(self.dbdata_path) / "postmaster.pid").exists()
-            if not exists and retcode != 0:
-                break
+        logging.debug("Shutting down postgres...")
+        _, stdout, stderr = local[f"{self.pgbin_path}/pg_ctl"][
+            "stop", "--no-wait", "-D", self.dbdata_path
+        ].run(retcode=None)
+        logging.debug("Stop message: (%s, %s)", stdout, stderr)
+
+        start_time = time.time()
+        interval = PROBE_INITIAL_INTERVAL
+        while (self.dbdata_path / POSTMASTER_PID_FNAME).exists() or get_is_port_open(
+            self.pgport
+        ):
+            assert (
+                time.time() - start_time < SHUTDOWN_TIMEOUT
+            ), "Postgres did not shut down before the timeout."
+            time.sleep(interval)
+            interval = min(interval * 2, PROBE_MAX_INTERVAL)
 
     def restart_postgres(self) -> bool:
         # TODO: check if we still get the shared preload libraries correctly if we do None
@@ -264,12 +820,15 @@ class PostgresConn:
     ) -> bool:
         """
         This function is called "(re)start" because it also shuts down Postgres before starting it.
-        This function assumes that some snapshot has already been untarred into self.dbdata_path.
-        You can do this by calling one of the wrappers around _restore_snapshot().
+        This function assumes that dbdata has already been materialized in self.dbdata_path. You can
+        do this by calling restore_pristine_snapshot() or restore_checkpointed_snapshot().
+
+        With save_checkpoint=True, the files of dbdata which changed since the latest checkpoint are
+        staged as a new layer of a DeltaCheckpoint (see gymlib.dbdata_checkpoint), which is only
+        committed once Postgres has started from it. restore_checkpointed_snapshot() restores it.
 
-        Note that multiple calls are not "additive". Calling this will restart from the latest saved
-        snapshot. If you want it to be additive without the overhead of saving a snapshot, pass in
-        multiple changes to `conf_changes`.
+        Note that multiple calls are not "additive". conf_changes replaces the changes of the
+        previous call instead of adding to them, so pass all the changes you want every time.
         """
         # Install the new configuration changes.
         dbdata_auto_conf_path = self.dbdata_path / "postgresql.auto.conf"
@@ -293,96 +852,212 @@ class PostgresConn:
         self.move_log()
 
         if save_checkpoint:
-            local["tar"][
-                "cf",
-                # We append .tmp so that if we fail in the *middle* of running tar, we
-                #   still have the previous checkpoint available to us
-                f"{self.checkpoint_dbdata_snapshot_path}.tmp",
-                "-C",
-                parent_path_of_path(self.dbdata_path),
-                self.dbdata_path,
-            ].run()
+            # This only stages the checkpoint so that if we fail to start Postgres, we still
+            #   have the previous checkpoint available to us.
+            checkpoint = self._get_checkpoint()
+            checkpoint.stage(self.dbdata_path)
 
         # Make sure the PID lock file doesn't exist.
-        pid_lock = Path(f"{self.dbdata_path}/postmaster.pid")
-        assert not pid_lock.exists()
+        assert not (self.dbdata_path / POSTMASTER_PID_FNAME).exists()
 
         if dump_page_cache:
             # Dump the OS page cache.
             os.system('sudo sh -c "sync; echo 3 > /proc/sys/vm/drop_caches"')
 
-        attempts = 0
-        while not pid_lock.exists():
-            # Try starting up.
-            retcode, stdout, stderr = local[f"{self.pgbin_path}/pg_ctl"][
-                "-D",
-                self.dbdata_path,
-                "--wait",
-                "-t",
-                "180",
-                "-l",
-                # We log to pg{self.pgport}.log instead of pg.log so that different PostgresConn objects
-                #   don't all try to write to the same file.
-                self.dbgym_workspace.dbgym_this_run_path / f"pg{self.pgport}.log",
-                "start",
-            ].run(retcode=None)
-
-            if retcode == 0 or pid_lock.exists():
-                break
+        # We only look at the part of the log written by this startup when checking for errors.
+        pglog_path = self.get_pglog_path()
+        pglog_offset = pglog_path.stat().st_size if pglog_path.exists() else 0
 
-            logging.warning("startup encountered: (%s, %s)", stdout, stderr)
-            attempts += 1
-            if attempts >= 5:
-                logging.error(
-                    "Number of attempts to start postgres has exceeded limit."
-                )
-                assert False, "Could not start postgres."
-
-        # Wait until postgres is ready to accept connections.
-        num_cycles = 0
-        while True:
-            if num_cycles >= CONNECT_TIMEOUT:
-                # In this case, we've failed to start postgres.
-                logging.error("Failed to start postgres before timeout...")
-                return False
-
-            retcode, _, _ = local[f"{self.pgbin_path}/pg_isready"][
-                "--host",
-                "localhost",
-                "--port",
-                str(self.pgport),
-                "--dbname",
-                DBGYM_POSTGRES_DBNAME,
-            ].run(retcode=None)
-            if retcode == 0:
-                break
-
-            time.sleep(1)
-            num_cycles += 1
-            logging.debug("Waiting for postgres to bootup but it is not...")
+        # We don't pass --wait because pg_ctl only checks whether Postgres is ready every 100ms. We
+        #   probe readiness ourselves instead (see _wait_until_ready()).
+        retcode, stdout, stderr = local[f"{self.pgbin_path}/pg_ctl"][
+            "-D",
+            self.dbdata_path,
+            "--no-wait",
+            "-l",
+            pglog_path,
+            "start",
+        ].run(retcode=None)
+        if retcode != 0:
+            logging.error("Could not launch postgres: (%s, %s)", stdout, stderr)
+            return False
+
+        if not self._wait_until_ready(pglog_offset):
+            return False
 
         # Set up Boot if we're told to do so
+        self._boot_config = None
         if self.boot_config_path is not None:
             with self.dbgym_workspace.open_and_save(self.boot_config_path) as f:
                 boot_config = yaml.safe_load(f)
+            self._boot_config = boot_config
+            self._set_up_boot_from_config(boot_config)
 
-            self._set_up_boot(
-                boot_config["intelligent_cache"],
-                boot_config["early_stop"],
-                boot_config["seq_sample"],
-                boot_config["seq_sample_pct"],
-                boot_config["seq_sample_seed"],
-                boot_config["mu_hyp_opt"],
-                boot_config["mu_hyp_time"],
-                boot_config["mu_hyp_stdev"],
-            )
-
-        # Move the temporary over since we now know the temporary can load.
+        # Commit the staged checkpoint since we now know it can load.
         if save_checkpoint:
-            shutil.move(f"{self.dbdata_path}.tgz.tmp", f"{self.dbdata_path}.tgz")
+            checkpoint.commit()
 
+        self._sysknobs = dict(conf_changes) if conf_changes is not None else {}
         return True
 
+    def _wait_until_ready(self, pglog_offset: int) -> bool:
+        """
+        Waits until Postgres accepts connections, returning False if it fails to start.
+
+        We only attempt a libpq connection once the postmaster has marked itself as ready in
+        postmaster.pid since every connection attempt made while Postgres is starting up gets
+        logged as a FATAL error. If the postmaster isn't running (either because it hasn't written
+        its pid file yet or because it already exited), we check the log for startup errors (e.g.
+        an invalid knob value) so that we fail immediately instead of waiting for the timeout.
+        """
+        pglog_path = self.get_pglog_path()
+        start_time = time.time()
+        interval = PROBE_INITIAL_INTERVAL
+        saw_postmaster = False
+
+        while time.time() - start_time < CONNECT_TIMEOUT:
+            pid_file_info = read_postmaster_pid_file(self.dbdata_path)
+            if pid_file_info is not None and psutil.pid_exists(pid_file_info[0]):
+                saw_postmaster = True
+                if pid_file_info[1] in POSTMASTER_READY_STATUSES:
+                    try:
+                        self.conn()
+                        return True
+                    except psycopg.OperationalError as e:
+                        logging.debug(f"Postgres is ready but connecting failed: {e}")
+            else:
+                startup_errors: list[str] = []
+                if pglog_path.exists():
+                    with open(pglog_path) as f:
+                        f.seek(pglog_offset)
+                        startup_errors = get_startup_errors(f.read())
+                # If the postmaster was running before, it exited without becoming ready.
+                if len(startup_errors) > 0 or saw_postmaster:
+                    logging.error(f"Failed to start postgres: {startup_errors}")
+                    return False
+
+            time.sleep(interval)
+            interval = min(interval * 2, PROBE_MAX_INTERVAL)
+
+        logging.error("Failed to start postgres before timeout...")
+        return False
+
+    def apply_sysknobs(self, conf_changes: Optional[dict[str, str]]) -> str:
+        """
+        Applies conf_changes with the same (non-additive) semantics as restart_with_changes(), but
+        only restarts Postgres if it has to.
+
+        The context of each changed knob is looked up in pg_settings. If all changed knobs can be
+        changed with a reload (e.g. work_mem or random_page_cost), they're applied with ALTER SYSTEM
+        and pg_reload_conf(), which avoids seconds of downtime. If any of them is a "postmaster"
+        knob (e.g. shared_buffers) or is unknown to pg_settings, we fall back to a restart.
+
+        Returns SYSKNOBS_APPLIED_NOOP, SYSKNOBS_APPLIED_RELOAD, or SYSKNOBS_APPLIED_RESTART
+        depending on which path was taken so that callers can log it.
+
+        Use restart_with_changes() directly if you need to dump the page cache or save a checkpoint
+        since those both require Postgres to be shut down.
+        """
+        new_sysknobs = dict(conf_changes) if conf_changes is not None else {}
+        assert (
+            "shared_preload_libraries" not in new_sysknobs
+        ), f"You should not set shared_preload_libraries manually."
+
+        if self._sysknobs is None:
+            self._restart_or_raise(new_sysknobs)
+            return SYSKNOBS_APPLIED_RESTART
+
+        changed_knobs = get_changed_sysknobs(self._sysknobs, new_sysknobs)
+        if len(changed_knobs) == 0:
+            return SYSKNOBS_APPLIED_NOOP
+
+        contexts = self.get_sysknob_contexts(changed_knobs)
+        if any(
+            contexts.get(knob.lower()) not in RELOADABLE_SYSKNOB_CONTEXTS
+            for knob in changed_knobs
+        ):
+            logging.debug(f"Restarting to apply {changed_knobs} (contexts: {contexts})")
+            self._restart_or_raise(new_sysknobs)
+            return SYSKNOBS_APPLIED_RESTART
+
+        conn = self.conn()
+        for knob in sorted(changed_knobs):
+            if knob in new_sysknobs:
+                conn.execute(
+                    sql.SQL("ALTER SYSTEM SET {} = {}").format(
+                        sql.Identifier(knob.lower()),
+                        sql.Literal(conf_value_to_str(new_sysknobs[knob])),
+                    )
+                )
+            else:
+                conn.execute(
+                    sql.SQL("ALTER SYSTEM RESET {}").format(
+                        sql.Identifier(knob.lower())
+                    )
+                )
+        self._reload_conf()
+        self._sysknobs = new_sysknobs
+        return SYSKNOBS_APPLIED_RELOAD
+
+    def _restart_or_raise(self, conf_changes: dict[str, str]) -> None:
+        if not self.restart_with_changes(conf_changes):
+            raise RuntimeError(f"Could not restart postgres with {conf_changes}")
+
+    def _reload_conf(self) -> None:
+        """
+        Calls pg_reload_conf() and waits until the postmaster has actually reloaded its config.
+
+        pg_reload_conf() only signals the postmaster, so we poll pg_conf_load_time() in fresh
+        connections until it advances. Fresh connections are also needed for "backend" knobs, and
+        they make sure our own connection doesn't keep a stale session-level value.
+
+        Boot is set up with session-level settings, so we set it up again on the new connection.
+        """
+        prev_load_time = self._get_conf_load_time()
+        self.conn().execute("SELECT pg_reload_conf()")
+
+        start_time = time.time()
+        while True:
+            self.disconnect()
+            load_time = self._get_conf_load_time()
+            if load_time > prev_load_time:
+                break
+            assert (
+                time.time() - start_time < CONNECT_TIMEOUT
+            ), "Postgres did not reload its config before the timeout."
+            time.sleep(RELOAD_POLL_INTERVAL)
+
+        if self._boot_config is not None:
+            self._set_up_boot_from_config(self._boot_config)
+
+    def _get_conf_load_time(self) -> Any:
+        row = self.conn().execute("SELECT pg_conf_load_time()").fetchone()
+        assert row is not None
+        return row[0]
+
+    def get_sysknob_contexts(self, knobs: set[str]) -> dict[str, str]:
+        """
+        Returns the pg_settings.context of each knob, keyed by the lowercase knob name. Knobs that
+        aren't in pg_settings (e.g. misspelled knobs) are omitted.
+        """
+        result = self.conn().execute(
+            "SELECT name, context FROM pg_settings WHERE name = ANY(%s)",
+            ([knob.lower() for knob in knobs],),
+        )
+        return {row[0]: row[1] for row in result}
+
+    def _set_up_boot_from_config(self, boot_config: dict[str, Any]) -> None:
+        self._set_up_boot(
+            boot_config["intelligent_cache"],
+            boot_config["early_stop"],
+            boot_config["seq_sample"],
+            boot_config["seq_sample_pct"],
+            boot_config["seq_sample_seed"],
+            boot_config["mu_hyp_opt"],
+            boot_config["mu_hyp_time"],
+            boot_config["mu_hyp_stdev"],
+        )
+
     def _set_up_boot(
         self,
         intelligent_cache: bool,
@@ -454,6 +1129,8 @@ class PostgresConn:
 
         # Get a fresh connection.
         self.disconnect()
+        # sql may have created or dropped an index.
+        self._index_defs = None
         conn = self.conn()
         conn.execute("SET maintenance_work_mem = '4GB'")
         # TODO(wz2): Make this a configuration/runtime option for action timeout.
@@ -487,6 +1164,266 @@ class PostgresConn:
         self.disconnect()
         return 0, None
 
+    def apply_indexes(
+        self,
+        sqls: list[str],
+        num_builders: Optional[int] = None,
+        total_maintenance_work_mem: str = INDEX_BUILD_MAINTENANCE_WORK_MEM,
+        timeout: float = INDEX_BUILD_TIMEOUT,
+    ) -> list[tuple[int, Optional[str]]]:
+        """
+        Runs sqls (e.g. the indexes of a DBMSConfigDelta) and returns the status code and stderr of
+        each one, just like psql().
+
+        Unlike calling psql() on each statement, consecutive CREATE INDEX statements are built
+        concurrently by up to num_builders connections (by default, one per CPU). This way, a delta
+        with many indexes takes about as long as its largest index instead of the sum of all of
+        them. Every other statement (e.g. DROP INDEX) is run on its own with psql() since it may
+        conflict with the builds.
+
+        The builders split total_maintenance_work_mem and the server's max_parallel_workers evenly.
+        Builds which take longer than timeout (in seconds) are cancelled with pg_cancel_backend().
+        """
+        results: list[tuple[int, Optional[str]]] = [(0, None)] * len(sqls)
+        for batch in get_index_batches(sqls):
+            if len(batch) == 1:
+                results[batch[0]] = self.psql(sqls[batch[0]])
+                continue
+            batch_results = self._build_indexes_concurrently(
+                [sqls[i] for i in batch],
+                num_builders,
+                total_maintenance_work_mem,
+                timeout,
+            )
+            for i, result in zip(batch, batch_results):
+                results[i] = result
+
+        # Just like psql(), we get a fresh connection afterwards so that nothing (e.g. prepared
+        #   statements) is reused across the change in indexes.
+        self.disconnect()
+        self._index_defs = None
+        return results
+
+    def _build_indexes_concurrently(
+        self,
+        sqls: list[str],
+        num_builders: Optional[int],
+        total_maintenance_work_mem: str,
+        timeout: float,
+    ) -> list[tuple[int, Optional[str]]]:
+        num_builders = min(
+            num_builders if num_builders is not None else (os.cpu_count() or 1),
+            len(sqls),
+        )
+        row = self.conn().execute("SHOW max_parallel_workers").fetchone()
+        assert row is not None
+        maintenance_work_mem, max_parallel_maintenance_workers = (
+            divide_maintenance_resources(
+                total_maintenance_work_mem, int(row[0]), num_builders
+            )
+        )
+        logging.debug(
+            f"Building {len(sqls)} indexes with {num_builders} builders, each with maintenance_work_mem={maintenance_work_mem} and max_parallel_maintenance_workers={max_parallel_maintenance_workers}"
+        )
+
+        pending: queue.Queue[tuple[int, str]] = queue.Queue()
+        for i, sql in enumerate(sqls):
+            pending.put((i, sql))
+        # If a builder's connection breaks, the statements it didn't get to are left with this.
+        results: list[tuple[int, Optional[str]]] = [
+            (-1, f"operational error: {sql}.") for sql in sqls
+        ]
+        # The statement each builder is running and when it started, keyed by the builder's pid.
+        running: dict[int, tuple[str, float]] = {}
+        running_lock = threading.Lock()
+
+        def build() -> None:
+            with psycopg.connect(
+                self.get_kv_connstr(), autocommit=True, prepare_threshold=None
+            ) as conn:
+                conn.execute(f"SET maintenance_work_mem = '{maintenance_work_mem}'")
+                conn.execute(
+                    f"SET max_parallel_maintenance_workers = {max_parallel_maintenance_workers}"
+                )
+                pid = conn.info.backend_pid
+                while True:
+                    try:
+                        i, sql = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    with running_lock:
+                        running[pid] = (sql, time.time())
+                    try:
+                        conn.execute(sql)
+                        results[i] = (0, None)
+                    except ProgramLimitExceeded as e:
+                        logging.debug(f"Action error: {e}")
+                        results[i] = (-1, str(e))
+                    except QueryCanceled as e:
+                        logging.debug(f"Action error: {e}")
+                        results[i] = (-1, f"canceling statement: {sql}.")
+                    except psycopg.OperationalError as e:
+                        logging.debug(f"Action error: {e}")
+                        results[i] = (-1, f"operational error: {sql}.")
+                        # The connection can't be used anymore so we leave the remaining
+                        #   statements to the other builders.
+                        return
+                    finally:
+                        with running_lock:
+                            del running[pid]
+
+        with ThreadPoolExecutor(max_workers=num_builders) as executor:
+            futures = [executor.submit(build) for _ in range(num_builders)]
+            # A builder whose statement was cancelled moves on to its next statement, which gets
+            #   its own timeout.
+            cancelled_pids: set[tuple[int, float]] = set()
+            while len(wait(futures, timeout=INDEX_BUILD_POLL_INTERVAL).not_done) > 0:
+                with running_lock:
+                    running_snapshot = dict(running)
+                self._log_index_build_progress(running_snapshot)
+                for pid, (sql, start_time) in running_snapshot.items():
+                    if (
+                        time.time() - start_time <= timeout
+                        or (pid, start_time) in cancelled_pids
+                    ):
+                        continue
+                    with running_lock:
+                        # The builder may have moved on to another statement in the meantime.
+                        if running.get(pid) != (sql, start_time):
+                            continue
+                        logging.info(f"Cancelling {sql} after {timeout}s")
+                        self.conn().execute("SELECT pg_cancel_backend(%s)", (pid,))
+                        cancelled_pids.add((pid, start_time))
+            # This re-raises any exception a builder didn't handle (e.g. UndefinedTable), which
+            #   psql() also does.
+            for future in futures:
+                future.result()
+
+        return results
+
+    def _log_index_build_progress(self, running: dict[int, tuple[str, float]]) -> None:
+        """
+        Logs the progress of each running build from pg_stat_progress_create_index.
+        """
+        result = self.conn().execute(
+            "SELECT pid, phase, blocks_done, blocks_total, tuples_done, tuples_total "
+            + "FROM pg_stat_progress_create_index WHERE pid = ANY(%s)",
+            (list(running.keys()),),
+        )
+        for pid, phase, blocks_done, blocks_total, tuples_done, tuples_total in result:
+            logging.info(
+                f"{running[pid][0]}: {phase} (blocks {blocks_done}/{blocks_total}, tuples {tuples_done}/{tuples_total})"
+            )
+
+    def evaluate_hypothetical_indexes(
+        self,
+        index_sqls: list[str],
+        workload: Workload,
+        qknobs: dict[str, list[str]] = {},
+    ) -> HypotheticalIndexesResult:
+        """
+        Creates index_sqls (CREATE INDEX statements) as HypoPG hypothetical indexes and returns the
+        estimated cost of every query in workload with and without them, which queries would use
+        each index, and the estimated size of each index. Nothing is built and the hypothetical
+        indexes are removed before returning.
+
+        An index which HypoPG can't create (e.g. because it refers to a column which doesn't exist)
+        gets an error instead of failing the whole call, so that you can screen many candidates at
+        once.
+        """
+        # Hypothetical indexes only exist in the backend that created them, so everything here has
+        #   to use the same connection.
+        conn = self.conn()
+        conn.execute("CREATE EXTENSION IF NOT EXISTS hypopg")
+        conn.execute("SELECT hypopg_reset()")
+        try:
+            baseline_costs = {
+                qid: self._get_estimated_plan(
+                    workload.get_query(qid), qknobs.get(qid, [])
+                )["Total Cost"]
+                for qid in workload.get_query_order()
+            }
+
+            indexes: list[HypotheticalIndex] = []
+            for index_sql in index_sqls:
+                try:
+                    row = conn.execute(
+                        "SELECT indexname, hypopg_relation_size(indexrelid) "
+                        + "FROM hypopg_create_index(%s)",
+                        (index_sql,),
+                    ).fetchone()
+                    assert row is not None
+                    indexes.append(HypotheticalIndex(index_sql, row[0], int(row[1])))
+                except psycopg.Error as e:
+                    logging.debug(f"HypoPG could not create {index_sql}: {e}")
+                    indexes.append(
+                        HypotheticalIndex(index_sql, None, None, error=str(e))
+                    )
+
+            costs = {}
+            indexes_by_name = {
+                index.name: index for index in indexes if index.name is not None
+            }
+            for qid in workload.get_query_order():
+                plan = self._get_estimated_plan(
+                    workload.get_query(qid), qknobs.get(qid, [])
+                )
+                costs[qid] = plan["Total Cost"]
+                for index_name in get_index_names_in_plan(plan):
+                    if index_name in indexes_by_name:
+                        indexes_by_name[index_name].used_by.append(qid)
+        finally:
+            conn.execute("SELECT hypopg_reset()")
+
+        return HypotheticalIndexesResult(baseline_costs, costs, indexes)
+
+    def _get_estimated_plan(self, query: str, query_knobs: list[str]) -> dict[str, Any]:
+        """
+        Returns the root node of the plan of query (without running it), whose "Total Cost" is the
+        estimated cost.
+        """
+        row = (
+            self.conn()
+            .execute(f"explain (format json) {get_hint_prefix(query_knobs)}{query}")
+            .fetchone()
+        )
+        assert row is not None
+        plan: dict[str, Any] = row[0][0]["Plan"]
+        return plan
+
+    def get_index_defs(self) -> list[str]:
+        """
+        Returns the definitions of all indexes outside the system schemas.
+        """
+        if self._index_defs is None:
+            result = self.conn().execute(
+                "SELECT indexdef FROM pg_indexes "
+                + "WHERE schemaname NOT IN ('pg_catalog', 'information_schema') "
+                + "ORDER BY indexdef"
+            )
+            self._index_defs = [row[0] for row in result]
+        return self._index_defs
+
+    def get_config_fingerprint(self) -> Optional[str]:
+        """
+        Returns a hash of the configuration that the runtime cache is keyed by, or None if we don't
+        know the configuration (e.g. if Postgres wasn't started by restart_with_changes()).
+
+        Only the system knobs applied through restart_with_changes()/apply_sysknobs(), the indexes,
+        the Boot config, and the preloaded libraries are tracked. Changes made by executing SQL directly on conn() (e.g. SET or ALTER TABLE) are
+        not, so don't use a runtime cache if you make such changes.
+        """
+        if self._sysknobs is None:
+            return None
+        config_fingerprint: str = get_config_fingerprint(
+            get_snapshot_key(self.pristine_dbdata_snapshot_path),
+            self._sysknobs,
+            self.get_index_defs(),
+            self._boot_config,
+            SHARED_PRELOAD_LIBRARIES,
+        )
+        return config_fingerprint
+
     def get_system_knobs(self) -> dict[str, str]:
         """
         System knobs are those applied across the entire system. They do not include table-specific
@@ -499,35 +1436,54 @@ class PostgresConn:
             knobs[row[0]] = row[1]
         return knobs
 
-    def restore_pristine_snapshot(self) -> bool:
-        return self._restore_snapshot(self.pristine_dbdata_snapshot_path)
-
-    def restore_checkpointed_snapshot(self) -> bool:
-        return self._restore_snapshot(self.checkpoint_dbdata_snapshot_path)
+    def _get_checkpoint(self) -> DeltaCheckpoint:
+        # Checkpoints are stored as deltas on top of the golden dbdata of the pristine snapshot.
+        golden_dbdata_path = get_golden_dbdata_path(
+            self.dbdata_parent_path, self.pristine_dbdata_snapshot_path
+        )
+        ensure_golden_dbdata(self.pristine_dbdata_snapshot_path, golden_dbdata_path)
+        return DeltaCheckpoint(
+            self.checkpoint_dbdata_path,
+            golden_dbdata_path,
+            get_snapshot_key(self.pristine_dbdata_snapshot_path),
+        )
 
-    def _restore_snapshot(
-        self,
-        dbdata_snapshot_path: Path,
-    ) -> bool:
+    def restore_pristine_snapshot(self) -> bool:
+        """
+        The snapshot is only untarred the first time it's restored. Every restore after that clones
+        the untarred "golden" dbdata, which is much faster (see gymlib.dbdata_restore for details).
+        """
         self.shutdown_postgres()
 
-        local["rm"]["-rf", self.dbdata_path].run()
-        local["mkdir"]["-m", "0700", "-p", self.dbdata_path].run()
+        assert self.pristine_dbdata_snapshot_path.exists()
+        golden_dbdata_path = get_golden_dbdata_path(
+            self.dbdata_parent_path, self.pristine_dbdata_snapshot_path
+        )
+        ensure_golden_dbdata(self.pristine_dbdata_snapshot_path, golden_dbdata_path)
+        clone_dbdata(golden_dbdata_path, self.dbdata_path)
+        self._imprint_port()
 
-        # Strip the "dbdata" so we can implant directly into the target dbdata_path.
-        assert dbdata_snapshot_path.exists()
-        local["tar"][
-            "xf",
-            dbdata_snapshot_path,
-            "-C",
-            self.dbdata_path,
-            "--strip-components",
-            "1",
-        ].run()
-        # Imprint the required port.
-        (
-            (local["echo"][f"port={self.pgport}"])
-            >> f"{self.dbdata_path}/postgresql.conf"
-        )()
+        return self.restart_postgres()
+
+    def restore_checkpointed_snapshot(self) -> bool:
+        """
+        Rebuilds dbdata from the latest checkpoint saved by restart_with_changes(save_checkpoint=True).
+        If no checkpoint was saved yet, this is equivalent to restore_pristine_snapshot().
+        """
+        self.shutdown_postgres()
+        self._get_checkpoint().restore(self.dbdata_path)
+        self._imprint_port()
 
         return self.restart_postgres()
+
+    def _imprint_port(self) -> None:
+        """
+        Appends the port to postgresql.conf unless a checkpoint already imprinted it.
+        """
+        port_line = f"port={self.pgport}"
+        conf_path = self.dbdata_path / "postgresql.conf"
+        with open(conf_path) as f:
+            lines = f.read().splitlines()
+        if len(lines) == 0 or lines[-1] != port_line:
+            with open(conf_path, "a") as f:
+                f.write(f"{port_line}\n")
@@ -0,0 +1,187 @@
+"""
+PostgresConn manages a single Postgres instance, which means that timing a workload only ever uses
+one core. This file provides PostgresConnPool, which manages multiple identical Postgres instances
+(each on its own port and with its own dbdata) and shards the queries of a workload across them.
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, TypeVar, Union
+
+import psutil
+from gymlib.pg import DEFAULT_SHARED_BUFFERS, pg_memory_to_bytes
+from gymlib.pg_conn import PostgresConn
+from gymlib.runtime_cache import RuntimeCache
+from gymlib.workload import Workload
+from gymlib.workspace import DBGymWorkspace
+
+T = TypeVar("T")
+
+
+def check_shared_buffers_fit_in_memory(
+    conf_changes: Optional[dict[str, str]], num_instances: int
+) -> None:
+    """
+    Asserts that running num_instances Postgres instances with conf_changes will not use more
+    shared_buffers in total than the physical memory of the machine.
+
+    This does not account for other memory usage (e.g. work_mem or the OS page cache). It is only
+    meant to catch configurations which would definitely cause the machine to swap or OOM.
+    """
+    shared_buffers = (
+        conf_changes["shared_buffers"]
+        if conf_changes is not None and "shared_buffers" in conf_changes
+        else DEFAULT_SHARED_BUFFERS
+    )
+    total_shared_buffers_bytes = pg_memory_to_bytes(shared_buffers) * num_instances
+    physical_memory_bytes = psutil.virtual_memory().total
+    assert (
+        total_shared_buffers_bytes < physical_memory_bytes
+    ), f"Running {num_instances} instances with shared_buffers={shared_buffers} needs {total_shared_buffers_bytes} bytes but the machine only has {physical_memory_bytes} bytes of memory."
+
+
+class PostgresConnPool:
+    """
+    A pool of PostgresConns which are all restored from the same pristine snapshot. All
+    configuration changes are applied to every instance so that the instances stay identical.
+    This means that a query will take (roughly) the same time no matter which instance it runs on.
+    """
+
+    def __init__(
+        self,
+        dbgym_workspace: DBGymWorkspace,
+        pgports: list[int],
+        pristine_dbdata_snapshot_path: Path,
+        dbdata_parent_path: Path,
+        pgbin_path: Union[str, Path],
+        # Whether this is None determines whether Boot is enabled.
+        boot_config_path: Optional[Path],
+        # The cache is shared by all instances since they all have the same configuration.
+        runtime_cache: Optional[RuntimeCache] = None,
+    ) -> None:
+        assert len(pgports) > 0, "A pool needs at least one instance."
+        assert len(set(pgports)) == len(pgports), f"pgports ({pgports}) must be unique."
+
+        # Each PostgresConn puts its dbdata in dbdata_parent_path / f"dbdata{pgport}" and logs to
+        #   pg{pgport}.log so the instances don't interfere with each other.
+        self.pg_conns = [
+            PostgresConn(
+                dbgym_workspace,
+                pgport,
+                pristine_dbdata_snapshot_path,
+                dbdata_parent_path,
+                pgbin_path,
+                boot_config_path,
+                runtime_cache,
+            )
+            for pgport in pgports
+        ]
+
+    def _run_on_all(self, fn: Callable[[PostgresConn], T]) -> list[T]:
+        with ThreadPoolExecutor(max_workers=len(self.pg_conns)) as executor:
+            return list(executor.map(fn, self.pg_conns))
+
+    def restore_pristine_snapshot(self) -> bool:
+        check_shared_buffers_fit_in_memory(None, len(self.pg_conns))
+        return all(
+            self._run_on_all(lambda pg_conn: pg_conn.restore_pristine_snapshot())
+        )
+
+    def restart_postgres(self) -> bool:
+        return self.restart_with_changes(conf_changes=None)
+
+    def restart_with_changes(
+        self,
+        conf_changes: Optional[dict[str, str]],
+        dump_page_cache: bool = False,
+    ) -> bool:
+        """
+        See PostgresConn.restart_with_changes(). Checkpoints are not supported by the pool since a
+        checkpoint would be identical across all instances.
+        """
+        check_shared_buffers_fit_in_memory(conf_changes, len(self.pg_conns))
+        return all(
+            self._run_on_all(
+                lambda pg_conn: pg_conn.restart_with_changes(
+                    conf_changes, dump_page_cache=dump_page_cache
+                )
+            )
+        )
+
+    def apply_sysknobs(self, conf_changes: Optional[dict[str, str]]) -> list[str]:
+        """
+        See PostgresConn.apply_sysknobs(). It returns the path taken by each instance.
+        """
+        check_shared_buffers_fit_in_memory(conf_changes, len(self.pg_conns))
+        return self._run_on_all(lambda pg_conn: pg_conn.apply_sysknobs(conf_changes))
+
+    def shutdown_postgres(self) -> None:
+        self._run_on_all(lambda pg_conn: pg_conn.shutdown_postgres())
+
+    def psql(self, sql: str) -> list[tuple[int, Optional[str]]]:
+        """
+        Executes the SQL command on every instance. See PostgresConn.psql() for what it returns.
+        """
+        return self._run_on_all(lambda pg_conn: pg_conn.psql(sql))
+
+    def time_workload(
+        self,
+        workload: Workload,
+        qknobs: dict[str, list[str]] = {},
+        query_timeout: int = 0,
+    ) -> tuple[float, int]:
+        """
+        Returns the total runtime and the number of timed out queries, just like
+        PostgresConn.time_workload().
+
+        Each instance pulls the next query from a shared queue as soon as it finishes its previous
+        query. This balances the load across instances even when query runtimes are very skewed.
+        Note that the total runtime is the (weighted, see Workload.get_weights()) *sum* of the query
+        runtimes, not the wall-clock time.
+        """
+        query_order = workload.get_query_order()
+        query_order_set = set(query_order)
+        assert all(
+            qid in query_order_set for qid in qknobs
+        ), f"All IDs in qknobs ({qknobs.keys()}) must be in {query_order_set}."
+
+        qid_queue: queue.Queue[str] = queue.Queue()
+        for qid in query_order:
+            qid_queue.put(qid)
+        results: dict[str, tuple[float, bool]] = {}
+        results_lock = threading.Lock()
+
+        def time_queries_from_queue(pg_conn: PostgresConn) -> None:
+            while True:
+                try:
+                    qid = qid_queue.get_nowait()
+                except queue.Empty:
+                    return
+
+                runtime, did_time_out, _ = pg_conn.time_query(
+                    workload.get_query(qid),
+                    query_knobs=qknobs[qid] if qid in qknobs else [],
+                    timeout=query_timeout,
+                )
+                with results_lock:
+                    results[qid] = (runtime, did_time_out)
+
+        self._run_on_all(time_queries_from_queue)
+        logging.debug(
+            f"Timed {len(results)} queries across {len(self.pg_conns)} instances"
+        )
+
+        # Merge in the workload's order so that the floating point sum is deterministic.
+        weights = workload.get_weights()
+        total_runtime: float = 0
+        num_timed_out_queries: int = 0
+        for qid in query_order:
+            runtime, did_time_out = results[qid]
+            total_runtime += weights.get(qid, 1.0) * runtime
+            if did_time_out:
+                num_timed_out_queries += 1
+
+        return total_runtime, num_timed_out_queries
@@ -0,0 +1,242 @@
+"""
+Tuning runs the same queries over and over, and most executions use a plan we've seen before.
+Keeping the full EXPLAIN output of every execution (which is mostly the same tree with different
+timings) makes memory and disk use grow with the length of the run. This file implements a plan
+store which instead splits each EXPLAIN output into:
+ - Its shape, which is the plan tree without any estimates or measurements. Each distinct shape is
+   stored once, keyed by its hash.
+ - Its actuals, which are everything that was removed from the shape (in pre-order of the nodes)
+   plus the planning and execution time. These are small and are stored per execution along with
+   the step, the qid, and the hash of the shape.
+
+Since shapes are compared by hash, it's cheap to ask which steps changed the plan of a query (see
+get_plan_change_steps()).
+
+Like RuntimeCache, it's backed by sqlite so that it can be queried without loading it.
+"""
+
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Optional
+
+from gymlib.timing import WorkloadTiming
+
+SQLITE_TIMEOUT = 60
+# These keys of a plan node depend on the planner's estimates or on the execution rather than on
+#   the shape of the plan.
+VOLATILE_PLAN_KEYS = {
+    "Startup Cost",
+    "Total Cost",
+    "Plan Rows",
+    "Plan Width",
+    "Planned Partitions",
+    "Workers Launched",
+    "Workers",
+    "Heap Fetches",
+    "Sort Method",
+    "Sort Space Used",
+    "Sort Space Type",
+    "Peak Memory Usage",
+    "Disk Usage",
+    "Hash Buckets",
+    "Original Hash Buckets",
+    "Hash Batches",
+    "Original Hash Batches",
+    "HashAgg Batches",
+    "Cache Hits",
+    "Cache Misses",
+    "Cache Evictions",
+    "Cache Overflows",
+    "Full-sort Groups",
+    "Pre-sorted Groups",
+}
+VOLATILE_PLAN_KEY_PREFIXES = (
+    "Actual ",
+    "Rows Removed by ",
+    "Exact ",
+    "Lossy ",
+    "Shared ",
+    "Local ",
+    "Temp ",
+    "WAL ",
+    "I/O ",
+)
+# These are the top-level keys of the EXPLAIN output (i.e. next to "Plan") which we keep as actuals.
+TOP_LEVEL_ACTUAL_KEYS = ["Planning Time", "Execution Time"]
+
+
+def _is_volatile_plan_key(key: str) -> bool:
+    return key in VOLATILE_PLAN_KEYS or key.startswith(VOLATILE_PLAN_KEY_PREFIXES)
+
+
+def split_plan(
+    plan: dict[str, Any], node_actuals: list[dict[str, Any]]
+) -> dict[str, Any]:
+    """
+    Returns the shape of a plan node (as in the "Plan" key of EXPLAIN (FORMAT JSON)). The volatile
+    keys of each node are appended to node_actuals in pre-order.
+    """
+    shape: dict[str, Any] = {}
+    actuals: dict[str, Any] = {}
+    for key, value in plan.items():
+        if _is_volatile_plan_key(key):
+            actuals[key] = value
+        elif key != "Plans":
+            shape[key] = value
+    node_actuals.append(actuals)
+    if "Plans" in plan:
+        shape["Plans"] = [split_plan(child, node_actuals) for child in plan["Plans"]]
+    return shape
+
+
+def join_plan(
+    shape: dict[str, Any], node_actuals: list[dict[str, Any]], node_index: int = 0
+) -> tuple[dict[str, Any], int]:
+    """
+    The inverse of split_plan(). Returns the plan node and the index of the next node.
+    """
+    plan = {**shape, **node_actuals[node_index]}
+    node_index += 1
+    if "Plans" in shape:
+        plan["Plans"] = []
+        for child_shape in shape["Plans"]:
+            child, node_index = join_plan(child_shape, node_actuals, node_index)
+            plan["Plans"].append(child)
+    return plan, node_index
+
+
+def get_plan_hash(shape: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(shape, sort_keys=True).encode()).hexdigest()
+
+
+class PlanStore:
+    """
+    Steps are the tuning steps of TuningArtifactsWriter but any integer works (e.g. replay uses the
+    step it's replaying).
+    """
+
+    def __init__(self, store_path: Path) -> None:
+        self.store_path = store_path
+        # The hashes of the shapes we know are in the store, so that we don't have to write them
+        #   again.
+        self._known_plan_hashes: set[str] = set()
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS plans (
+                    plan_hash TEXT PRIMARY KEY,
+                    shape TEXT NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS executions (
+                    step INTEGER NOT NULL,
+                    qid TEXT NOT NULL,
+                    plan_hash TEXT NOT NULL,
+                    actuals TEXT NOT NULL
+                )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS executions_qid_step ON executions (qid, step)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.store_path, timeout=SQLITE_TIMEOUT)
+
+    def add(self, step: int, qid: str, explain_data: dict[str, Any]) -> str:
+        """
+        Adds an EXPLAIN output (as returned by PostgresConn.time_query(add_explain=True)) and
+        returns the hash of its shape.
+        """
+        assert "Plan" in explain_data, "explain_data must be the output of EXPLAIN."
+        node_actuals: list[dict[str, Any]] = []
+        shape = split_plan(explain_data["Plan"], node_actuals)
+        plan_hash = get_plan_hash(shape)
+        actuals = {
+            key: explain_data[key]
+            for key in TOP_LEVEL_ACTUAL_KEYS
+            if key in explain_data
+        }
+        actuals["Nodes"] = node_actuals
+
+        with closing(self._connect()) as conn, conn:
+            if plan_hash not in self._known_plan_hashes:
+                conn.execute(
+                    "INSERT OR IGNORE INTO plans VALUES (?, ?)",
+                    (plan_hash, json.dumps(shape)),
+                )
+                self._known_plan_hashes.add(plan_hash)
+            conn.execute(
+                "INSERT INTO executions VALUES (?, ?, ?, ?)",
+                (step, qid, plan_hash, json.dumps(actuals)),
+            )
+        return plan_hash
+
+    def add_workload_timing(self, step: int, timing: WorkloadTiming) -> None:
+        """
+        Adds the plans of all queries in timing which have explain data.
+        """
+        for qid, query_timing in timing.query_timings.items():
+            if query_timing.explain_data is not None:
+                self.add(step, qid, query_timing.explain_data)
+
+    def get_shape(self, plan_hash: str) -> Optional[dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT shape FROM plans WHERE plan_hash = ?", (plan_hash,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get_plan_hashes(self, qid: str) -> dict[int, str]:
+        """
+        Returns the hash of the plan of qid at each step it was executed in. If qid was executed
+        more than once in a step, the last execution is used.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT step, plan_hash FROM executions WHERE qid = ? ORDER BY step, rowid",
+                (qid,),
+            ).fetchall()
+        return {step: plan_hash for step, plan_hash in rows}
+
+    def get_plan_change_steps(self, qid: str) -> list[int]:
+        """
+        Returns the steps in which the plan of qid was different from its plan in the previous step
+        it was executed in. The first step qid was executed in doesn't count as a change.
+        """
+        change_steps: list[int] = []
+        prev_plan_hash = None
+        for step, plan_hash in sorted(self.get_plan_hashes(qid).items()):
+            if prev_plan_hash is not None and plan_hash != prev_plan_hash:
+                change_steps.append(step)
+            prev_plan_hash = plan_hash
+        return change_steps
+
+    def get_explain_data(self, step: int, qid: str) -> list[dict[str, Any]]:
+        """
+        Returns the full EXPLAIN output of each execution of qid in step, reassembled from its shape
+        and its actuals.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT shape, actuals FROM executions "
+                + "JOIN plans ON executions.plan_hash = plans.plan_hash "
+                + "WHERE step = ? AND qid = ? ORDER BY executions.rowid",
+                (step, qid),
+            ).fetchall()
+
+        explain_datas = []
+        for shape, actuals_str in rows:
+            actuals = json.loads(actuals_str)
+            plan, _ = join_plan(json.loads(shape), actuals.pop("Nodes"))
+            explain_datas.append({"Plan": plan, **actuals})
+        return explain_datas
+
+    def get_num_plans(self) -> int:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT count(*) FROM plans").fetchone()
+        return int(row[0])
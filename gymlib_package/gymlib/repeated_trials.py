@@ -0,0 +1,325 @@
+"""
+A single run of a query is a noisy measurement of its runtime, but running every query a fixed
+number of times (e.g. the demo used to average 3 runs of time_workload()) wastes runs on stable
+queries and is still not enough for noisy ones. This file implements a harness on top of
+PostgresConn.time_query_detailed() which:
+ - Discards a few warmup runs of each query (e.g. to fill the buffer pool).
+ - Aggregates the remaining trials of each query with the median or a trimmed mean, both of which
+   are robust to the occasional outlier.
+ - Computes a confidence interval for the aggregate and stops running a query as soon as the
+   interval is narrower than a target width relative to the aggregate.
+
+Only the Python standard library is used, so the confidence intervals use closed forms:
+ - For the median, the interval between two order statistics, whose coverage follows from the
+   binomial distribution and doesn't depend on the distribution of the runtimes.
+ - For the trimmed mean, the Tukey-McLaughlin interval, which is based on the winsorized variance
+   and Student's t distribution.
+"""
+
+import logging
+import math
+import statistics
+from typing import Callable, Optional
+
+from gymlib.pg_conn import MEASUREMENT_MODE_WALL, PostgresConn
+from gymlib.timing import QueryTiming, TrialsTiming, WorkloadTrialsTiming
+from gymlib.workload import Workload
+
+AGGREGATION_MEDIAN = "median"
+AGGREGATION_TRIMMED_MEAN = "trimmed_mean"
+AGGREGATIONS = [AGGREGATION_MEDIAN, AGGREGATION_TRIMMED_MEAN]
+
+
+def get_trimmed_mean(values: list[float], trim_fraction: float) -> float:
+    """
+    Returns the mean of values after removing the smallest and largest trim_fraction of them.
+    """
+    assert len(values) > 0, "values must not be empty."
+    num_trimmed = int(trim_fraction * len(values))
+    sorted_values = sorted(values)
+    return statistics.mean(sorted_values[num_trimmed : len(values) - num_trimmed])
+
+
+def get_t_quantile(p: float, df: int) -> float:
+    """
+    Returns the p quantile of Student's t distribution with df degrees of freedom.
+
+    There are closed forms for df=1 and df=2. For larger df, we use the Cornish-Fisher expansion
+    around the normal quantile, which is within 0.5% of the exact value for df >= 3.
+    """
+    assert 0 < p < 1, f"p ({p}) must be in (0, 1)."
+    assert df >= 1, f"df ({df}) must be at least 1."
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) * math.sqrt(2 / (4 * p * (1 - p)))
+    z = statistics.NormalDist().inv_cdf(p)
+    g1 = (z**3 + z) / 4
+    g2 = (5 * z**5 + 16 * z**3 + 3 * z) / 96
+    g3 = (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / 384
+    g4 = (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / 92160
+    return float(z + g1 / df + g2 / df**2 + g3 / df**3 + g4 / df**4)
+
+
+def get_median_confidence_interval(
+    values: list[float], confidence: float
+) -> tuple[float, float]:
+    """
+    Returns the narrowest interval between two order statistics (symmetric in rank) which contains
+    the median with probability at least confidence. This is (-inf, inf) if there are too few
+    values (e.g. fewer than 6 for confidence=0.95).
+    """
+    n = len(values)
+    alpha = 1 - confidence
+    # The interval between the k-th smallest and the k-th largest values (1-indexed) misses the
+    #   median with probability 2 * P(X <= k - 1), where X ~ Binomial(n, 0.5). We find the largest
+    #   such k for which this is at most alpha.
+    k = 0
+    cdf = 0.0
+    while k < (n + 1) // 2:
+        next_cdf = cdf + math.comb(n, k) / 2**n
+        if next_cdf > alpha / 2:
+            break
+        cdf = next_cdf
+        k += 1
+    if k == 0:
+        return -math.inf, math.inf
+    sorted_values = sorted(values)
+    return sorted_values[k - 1], sorted_values[n - k]
+
+
+def get_trimmed_mean_confidence_interval(
+    values: list[float], trim_fraction: float, confidence: float
+) -> tuple[float, float]:
+    """
+    Returns the Tukey-McLaughlin confidence interval of the trimmed mean. This is (-inf, inf) if
+    fewer than two values are left after trimming.
+    """
+    n = len(values)
+    num_trimmed = int(trim_fraction * n)
+    num_kept = n - 2 * num_trimmed
+    if num_kept < 2:
+        return -math.inf, math.inf
+    sorted_values = sorted(values)
+    low_value = sorted_values[num_trimmed]
+    high_value = sorted_values[n - num_trimmed - 1]
+    winsorized_values = [min(max(value, low_value), high_value) for value in values]
+    standard_error = statistics.stdev(winsorized_values) / (num_kept / n * math.sqrt(n))
+    t = get_t_quantile(1 - (1 - confidence) / 2, num_kept - 1)
+    trimmed_mean = get_trimmed_mean(values, trim_fraction)
+    return trimmed_mean - t * standard_error, trimmed_mean + t * standard_error
+
+
+def get_min_trials_with_confidence_interval(
+    aggregation: str, trim_fraction: float, confidence: float
+) -> int:
+    """
+    Returns the fewest trials for which the confidence interval of aggregation is finite.
+    """
+    n = 1
+    if aggregation == AGGREGATION_MEDIAN:
+        # See get_median_confidence_interval(). The widest interval (from the smallest to the largest
+        #   value) misses the median with probability 2 * 0.5^n.
+        while 2 * 0.5**n > 1 - confidence:
+            n += 1
+    else:
+        # See get_trimmed_mean_confidence_interval().
+        while n - 2 * int(trim_fraction * n) < 2:
+            n += 1
+    return n
+
+
+def _assert_no_runtime_cache(pg_conn: PostgresConn) -> None:
+    # The runtime cache would return the same result for every trial.
+    assert (
+        pg_conn.runtime_cache is None
+    ), "RepeatedTrials can't be used with a PostgresConn that has a runtime cache."
+
+
+class RepeatedTrials:
+    """
+    Runs each query num_warmup times without measuring it and then between min_trials and
+    max_trials times, stopping as soon as the confidence interval of its runtime is narrower than
+    target_relative_width times its runtime.
+
+    By default, min_trials is the fewest trials for which the confidence interval exists (see
+    get_min_trials_with_confidence_interval()), e.g. 6 for the median at confidence=0.95, since no
+    query can stop before that anyway.
+    """
+
+    def __init__(
+        self,
+        num_warmup: int = 1,
+        min_trials: Optional[int] = None,
+        max_trials: int = 10,
+        aggregation: str = AGGREGATION_MEDIAN,
+        # This is only used by AGGREGATION_TRIMMED_MEAN.
+        trim_fraction: float = 0.1,
+        confidence: float = 0.95,
+        target_relative_width: float = 0.05,
+    ) -> None:
+        assert num_warmup >= 0, f"num_warmup ({num_warmup}) must be non-negative."
+        assert (
+            aggregation in AGGREGATIONS
+        ), f'"{aggregation}" is not one of {AGGREGATIONS}'
+        assert (
+            0 <= trim_fraction < 0.5
+        ), f"trim_fraction ({trim_fraction}) must be in [0, 0.5)."
+        assert 0 < confidence < 1, f"confidence ({confidence}) must be in (0, 1)."
+        assert (
+            target_relative_width > 0
+        ), f"target_relative_width ({target_relative_width}) must be positive."
+        if min_trials is None:
+            min_trials = get_min_trials_with_confidence_interval(
+                aggregation, trim_fraction, confidence
+            )
+        assert min_trials >= 1, f"min_trials ({min_trials}) must be at least 1."
+        assert (
+            max_trials >= min_trials
+        ), f"max_trials ({max_trials}) must be at least min_trials ({min_trials})."
+        self.num_warmup = num_warmup
+        self.min_trials = min_trials
+        self.max_trials = max_trials
+        self.aggregation = aggregation
+        self.trim_fraction = trim_fraction
+        self.confidence = confidence
+        self.target_relative_width = target_relative_width
+
+    def aggregate(self, trials: list[float]) -> float:
+        if self.aggregation == AGGREGATION_MEDIAN:
+            return float(statistics.median(trials))
+        return get_trimmed_mean(trials, self.trim_fraction)
+
+    def get_confidence_interval(self, trials: list[float]) -> tuple[float, float]:
+        if self.aggregation == AGGREGATION_MEDIAN:
+            return get_median_confidence_interval(trials, self.confidence)
+        return get_trimmed_mean_confidence_interval(
+            trials, self.trim_fraction, self.confidence
+        )
+
+    def summarize(self, trials: list[float]) -> TrialsTiming:
+        """
+        Returns the TrialsTiming of a query which completed all of trials.
+        """
+        assert len(trials) > 0, "trials must not be empty."
+        ci_low, ci_high = self.get_confidence_interval(trials)
+        timing = TrialsTiming(
+            self.aggregate(trials), False, list(trials), ci_low, ci_high, False
+        )
+        timing.converged = (
+            len(trials) >= self.min_trials
+            and timing.get_relative_ci_width() <= self.target_relative_width
+        )
+        return timing
+
+    def time_query(
+        self,
+        pg_conn: PostgresConn,
+        query: str,
+        query_knobs: list[str] = [],
+        timeout: float = 0,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
+    ) -> TrialsTiming:
+        """
+        Times query with repeated trials. The arguments are the same as in PostgresConn.time_query().
+        """
+        _assert_no_runtime_cache(pg_conn)
+        return self.run_trials(
+            {
+                query: lambda: pg_conn.time_query_detailed(
+                    query,
+                    query_knobs,
+                    timeout=timeout,
+                    measurement_mode=measurement_mode,
+                )
+            }
+        )[query]
+
+    def time_workload(
+        self,
+        pg_conn: PostgresConn,
+        workload: Workload,
+        qknobs: dict[str, list[str]] = {},
+        query_timeout: float = 0,
+        measurement_mode: str = MEASUREMENT_MODE_WALL,
+    ) -> WorkloadTrialsTiming:
+        """
+        Times each query in workload with repeated trials. The arguments are the same as in
+        PostgresConn.time_workload().
+
+        The trials are run in rounds. Each round runs the queries which still need more trials in
+        the order of the workload so that every query sees a similar state of the database (e.g.
+        of the buffer pool) across trials.
+        """
+
+        def get_measure_fn(qid: str) -> Callable[[], QueryTiming]:
+            return lambda: pg_conn.time_query_detailed(
+                workload.get_query(qid),
+                qknobs.get(qid, []),
+                timeout=query_timeout,
+                measurement_mode=measurement_mode,
+            )
+
+        _assert_no_runtime_cache(pg_conn)
+        query_timings = self.run_trials(
+            {qid: get_measure_fn(qid) for qid in workload.get_query_order()}
+        )
+        weights = workload.get_weights()
+        return WorkloadTrialsTiming(
+            total_runtime=sum(
+                weights.get(qid, 1.0) * timing.runtime
+                for qid, timing in query_timings.items()
+            ),
+            num_timed_out=sum(
+                1 for timing in query_timings.values() if timing.did_time_out
+            ),
+            query_timings=query_timings,
+        )
+
+    def run_trials(
+        self, measure_fns: dict[str, Callable[[], QueryTiming]]
+    ) -> dict[str, TrialsTiming]:
+        """
+        Runs the trials of each query, where measure_fns maps a key (e.g. the qid) to a function
+        which runs the query once. It returns the TrialsTiming of each key in the same order.
+        """
+        timings: dict[str, TrialsTiming] = {}
+        trials: dict[str, list[float]] = {key: [] for key in measure_fns}
+
+        def record_timeout(key: str, query_timing: QueryTiming) -> None:
+            # Running a query which timed out again would most likely waste another timeout.
+            timings[key] = TrialsTiming(
+                query_timing.runtime,
+                True,
+                trials[key],
+                query_timing.runtime,
+                query_timing.runtime,
+                True,
+            )
+
+        for _ in range(self.num_warmup):
+            for key, measure_fn in measure_fns.items():
+                if key in timings:
+                    continue
+                query_timing = measure_fn()
+                if query_timing.did_time_out:
+                    record_timeout(key, query_timing)
+
+        active_keys = [key for key in measure_fns if key not in timings]
+        while len(active_keys) > 0:
+            for key in active_keys:
+                query_timing = measure_fns[key]()
+                if query_timing.did_time_out:
+                    record_timeout(key, query_timing)
+                    continue
+                trials[key].append(query_timing.runtime)
+                timing = self.summarize(trials[key])
+                if timing.converged or len(trials[key]) >= self.max_trials:
+                    timings[key] = timing
+            active_keys = [key for key in active_keys if key not in timings]
+
+        logging.debug(
+            f"Ran {sum(len(key_trials) for key_trials in trials.values())} trials of {len(measure_fns)} queries"
+        )
+        # We return the timings in the same order as measure_fns.
+        return {key: timings[key] for key in measure_fns}
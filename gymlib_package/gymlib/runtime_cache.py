@@ -0,0 +1,259 @@
+"""
+Agents and replay often re-measure the same query under a configuration they have already
+measured. This file implements an opt-in cache of query runtimes which lives in the workspace (see
+get_runtime_cache_path_from_workspace_path()) so that it persists across runs.
+
+Results are keyed by two hashes:
+ - The config fingerprint, which covers everything about the database that affects a query's
+   runtime: the pristine snapshot, the system knobs, the set of indexes, and the Boot config.
+ - The query key, which covers the query text, its hint prefix (the query knobs), and the
+   measurement mode (since e.g. EXPLAIN ANALYZE measures the execution time instead of the wall
+   time).
+
+Each measurement is stored as a separate trial. A cached result is only used once there are at
+least num_trials fresh trials, and it is the median of those trials.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Optional
+
+from gymlib.pg import SHARED_PRELOAD_LIBRARIES, conf_value_to_str
+from gymlib.timing import QueryTiming
+
+# Index names are arbitrary (agents usually generate them) so they're not part of the fingerprint.
+INDEX_NAME_REGEX = re.compile(r"\bINDEX\s+(\S+\s+)?ON\b", re.IGNORECASE)
+SQLITE_TIMEOUT = 60
+# This is the version of the schema of the trials table (see RuntimeCache._migrate()). Version 2
+#   added these columns, which caches created before it don't have.
+RUNTIME_CACHE_SCHEMA_VERSION = 2
+RUNTIME_CACHE_V2_COLUMNS = [
+    ("explain_data", "TEXT"),
+    ("planning_time", "REAL"),
+    ("execution_time", "REAL"),
+]
+
+
+def canonicalize_sysknobs(sysknobs: dict[str, str]) -> dict[str, str]:
+    """
+    Knob names are case-insensitive in Postgres and values may or may not be quoted, so
+    {"Work_Mem": "'64MB'"} and {"work_mem": "64MB"} are the same configuration.
+    """
+    return {knob.lower(): conf_value_to_str(value) for knob, value in sysknobs.items()}
+
+
+def canonicalize_index_def(index_def: str) -> str:
+    """
+    Removes the name from an index definition as returned by pg_indexes.indexdef.
+    """
+    return INDEX_NAME_REGEX.sub("INDEX ON", index_def, count=1)
+
+
+def get_config_fingerprint(
+    snapshot_key: str,
+    sysknobs: dict[str, str],
+    index_defs: list[str],
+    boot_config: Optional[dict[str, Any]] = None,
+    shared_preload_libraries: str = SHARED_PRELOAD_LIBRARIES,
+) -> str:
+    """
+    boot_config is the parsed Boot config if Boot is enabled. Boot's early stopping and sampling
+    change the measured runtimes, so runs with and without Boot (or with different Boot configs)
+    never share results.
+
+    The preloaded libraries are included too since their hooks run for every statement (e.g.
+    pg_stat_statements adds a small overhead to every query).
+    """
+    parts: list[Any] = [
+        snapshot_key,
+        sorted(canonicalize_sysknobs(sysknobs).items()),
+        sorted(canonicalize_index_def(index_def) for index_def in index_defs),
+        sorted(library.strip() for library in shared_preload_libraries.split(",")),
+        boot_config,
+    ]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def get_query_key(query: str, hint_prefix: str, measurement_mode: str) -> str:
+    return hashlib.sha256(
+        json.dumps([query, hint_prefix, measurement_mode]).encode()
+    ).hexdigest()
+
+
+def _adjust_trial_to_timeout(
+    runtime: float, did_time_out: bool, trial_timeout: float, timeout: float
+) -> Optional[tuple[float, bool]]:
+    """
+    Returns what a trial measured with trial_timeout would have measured with timeout, or None if
+    we can't know. Timeouts are in seconds and runtimes are in microseconds, just like in
+    PostgresConn.time_query().
+    """
+    if did_time_out:
+        # We only know that the query takes at least trial_timeout.
+        if timeout > 0 and timeout <= trial_timeout:
+            return timeout * 1e6, True
+        return None
+
+    if timeout > 0 and runtime >= timeout * 1e6:
+        return timeout * 1e6, True
+    return runtime, False
+
+
+class RuntimeCache:
+    """
+    Every method opens its own sqlite connection so that a RuntimeCache can be shared across
+    threads (e.g. by the instances of a PostgresConnPool) and processes.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path,
+        num_trials: int = 1,
+        # The maximum age of a trial in seconds. None means trials never become stale.
+        max_age: Optional[float] = None,
+    ) -> None:
+        assert num_trials >= 1, f"num_trials ({num_trials}) must be at least 1."
+        assert max_age is None or max_age > 0, f"max_age ({max_age}) must be positive."
+        self.cache_path = cache_path
+        self.num_trials = num_trials
+        self.max_age = max_age
+
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                # We take the write lock right away so that processes opening the same cache don't
+                #   migrate it at the same time.
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS trials (
+                        config_fingerprint TEXT NOT NULL,
+                        query_key TEXT NOT NULL,
+                        runtime REAL NOT NULL,
+                        did_time_out INTEGER NOT NULL,
+                        timeout REAL NOT NULL,
+                        explain_data TEXT,
+                        planning_time REAL,
+                        execution_time REAL,
+                        created_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS trials_key ON trials (config_fingerprint, query_key)"
+                )
+                self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """
+        Brings a cache created by an older version up to RUNTIME_CACHE_SCHEMA_VERSION, which is
+        stored in the user_version of the database. Caches from before there was a version have a
+        user_version of 0.
+        """
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        assert (
+            version <= RUNTIME_CACHE_SCHEMA_VERSION
+        ), f"The runtime cache has schema version {version}, which is newer than this code's ({RUNTIME_CACHE_SCHEMA_VERSION})."
+        if version == RUNTIME_CACHE_SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(trials)")}
+        for column, column_type in RUNTIME_CACHE_V2_COLUMNS:
+            if column not in columns:
+                conn.execute(f"ALTER TABLE trials ADD COLUMN {column} {column_type}")
+        conn.execute(f"PRAGMA user_version = {RUNTIME_CACHE_SCHEMA_VERSION}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.cache_path, timeout=SQLITE_TIMEOUT)
+
+    def get(
+        self, config_fingerprint: str, query_key: str, timeout: float
+    ) -> Optional[QueryTiming]:
+        """
+        Returns the cached timing (with cached=True and num_trials set to the number of trials the
+        result is based on). Returns None if there aren't enough fresh trials which are valid for
+        timeout.
+        """
+        min_created_at = time.time() - self.max_age if self.max_age is not None else 0
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT runtime, did_time_out, timeout, explain_data, planning_time, execution_time "
+                + "FROM trials "
+                + "WHERE config_fingerprint = ? AND query_key = ? AND created_at >= ?",
+                (config_fingerprint, query_key, min_created_at),
+            ).fetchall()
+
+        valid_trials: list[QueryTiming] = []
+        for (
+            runtime,
+            did_time_out,
+            trial_timeout,
+            explain_data,
+            planning_time,
+            execution_time,
+        ) in rows:
+            adjusted = _adjust_trial_to_timeout(
+                runtime, bool(did_time_out), trial_timeout, timeout
+            )
+            if adjusted is None:
+                continue
+            if adjusted[1]:
+                # A trial which now counts as timed out wouldn't have had any of these.
+                valid_trials.append(QueryTiming(adjusted[0], True, None, cached=True))
+            else:
+                valid_trials.append(
+                    QueryTiming(
+                        adjusted[0],
+                        False,
+                        json.loads(explain_data) if explain_data is not None else None,
+                        cached=True,
+                        planning_time=planning_time,
+                        execution_time=execution_time,
+                    )
+                )
+
+        if len(valid_trials) < self.num_trials:
+            return None
+        # We use the (lower) median trial as a whole so that all its fields are consistent with
+        #   each other.
+        valid_trials.sort(key=lambda trial: trial.runtime)
+        median_trial = valid_trials[(len(valid_trials) - 1) // 2]
+        median_trial.num_trials = len(valid_trials)
+        return median_trial
+
+    def put(
+        self,
+        config_fingerprint: str,
+        query_key: str,
+        timing: QueryTiming,
+        timeout: float,
+    ) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                # The columns are named since migrated caches have them in a different order.
+                "INSERT INTO trials (config_fingerprint, query_key, runtime, did_time_out, timeout, "
+                + "explain_data, planning_time, execution_time, created_at) "
+                + "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    config_fingerprint,
+                    query_key,
+                    timing.runtime,
+                    int(timing.did_time_out),
+                    timeout,
+                    (
+                        json.dumps(timing.explain_data)
+                        if timing.explain_data is not None
+                        else None
+                    ),
+                    timing.planning_time,
+                    timing.execution_time,
+                    time.time(),
+                ),
+            )
+
+    def clear(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM trials")
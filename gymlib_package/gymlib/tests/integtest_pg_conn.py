@@ -1,5 +1,8 @@
 import copy
+import json
+import time
 import unittest
+from typing import Any
 
 import psycopg
 from gymlib.pg import (
@@ -7,9 +10,26 @@ from gymlib.pg import (
     get_is_postgres_running,
     get_running_postgres_ports,
 )
-from gymlib.pg_conn import PostgresConn
+from gymlib.pg_conn import (
+    MEASUREMENT_MODE_PG_STAT_STATEMENTS,
+    MEASUREMENT_MODE_PREPARED,
+    MEASUREMENT_MODE_WALL,
+    MEASUREMENT_MODES,
+    SYSKNOBS_APPLIED_NOOP,
+    SYSKNOBS_APPLIED_RELOAD,
+    SYSKNOBS_APPLIED_RESTART,
+    PostgresConn,
+)
+from gymlib.runtime_cache import RuntimeCache
 from gymlib.tests.gymlib_integtest_util import GymlibIntegtestManager
-from gymlib.workspace import DBGymWorkspace
+from gymlib.trace_workload import TraceWorkload, write_trace
+from gymlib.workload import Workload
+from gymlib.workload_subset import WORKLOAD_WEIGHTS_FNAME
+from gymlib.workspace import (
+    DEFAULT_BOOT_CONFIG_PATH,
+    DBGymWorkspace,
+    get_runtime_cache_path_from_workspace_path,
+)
 
 
 class PostgresConnTests(unittest.TestCase):
@@ -103,6 +123,100 @@ class PostgresConnTests(unittest.TestCase):
         self.pg_conn.restart_with_changes(conf_changes)
         self.assertEqual(conf_changes, orig_conf_changes)
 
+    def test_restart_with_invalid_knob_fails_fast(self) -> None:
+        start_time = time.time()
+        self.assertFalse(self.pg_conn.restart_with_changes({"wal_buffers": "invalid"}))
+        # We should notice the error in the log instead of waiting for CONNECT_TIMEOUT.
+        self.assertLess(time.time() - start_time, 10)
+        self.assertFalse(get_is_postgres_running())
+
+    def test_apply_sysknobs_reloads_reloadable_knobs(self) -> None:
+        initial_sysknobs = self.pg_conn.get_system_knobs()
+        self.assertEqual(initial_sysknobs["work_mem"], "4MB")
+        postmaster_start_time = self._get_postmaster_start_time()
+
+        # First call
+        self.assertEqual(
+            self.pg_conn.apply_sysknobs(
+                {"work_mem": "'64MB'", "random_page_cost": "1.5"}
+            ),
+            SYSKNOBS_APPLIED_RELOAD,
+        )
+        new_sysknobs = self.pg_conn.get_system_knobs()
+        self.assertEqual(new_sysknobs["work_mem"], "64MB")
+        self.assertEqual(new_sysknobs["random_page_cost"], "1.5")
+
+        # Applying the same knobs again should do nothing.
+        self.assertEqual(
+            self.pg_conn.apply_sysknobs(
+                {"work_mem": "'64MB'", "random_page_cost": "1.5"}
+            ),
+            SYSKNOBS_APPLIED_NOOP,
+        )
+
+        # The changes should not be additive. The "work_mem" should have "reset" to 4MB.
+        self.assertEqual(
+            self.pg_conn.apply_sysknobs({"random_page_cost": "1.5"}),
+            SYSKNOBS_APPLIED_RELOAD,
+        )
+        new_sysknobs = self.pg_conn.get_system_knobs()
+        self.assertEqual(new_sysknobs["work_mem"], "4MB")
+        self.assertEqual(new_sysknobs["random_page_cost"], "1.5")
+        self.assertEqual(self._get_postmaster_start_time(), postmaster_start_time)
+
+    def test_apply_sysknobs_keeps_boot(self) -> None:
+        self.pg_conn.shutdown_postgres()
+        boot_pg_conn = PostgresConn(
+            PostgresConnTests.workspace,
+            DEFAULT_POSTGRES_PORT,
+            self.metadata.pristine_dbdata_snapshot_path,
+            self.metadata.dbdata_parent_path,
+            self.metadata.pgbin_path,
+            DEFAULT_BOOT_CONFIG_PATH.resolve(),
+        )
+        boot_pg_conn.restart_postgres()
+
+        def get_boot_settings() -> dict[str, str]:
+            result = boot_pg_conn.conn().execute(
+                "SELECT name, setting FROM pg_settings WHERE name IN ('boot.enable', 'boot.seq_sample_pct')"
+            )
+            return {row[0]: row[1] for row in result}
+
+        boot_settings = get_boot_settings()
+        self.assertEqual(boot_settings["boot.enable"], "on")
+        # The session-level Boot settings should survive the reload's new connection.
+        self.assertEqual(
+            boot_pg_conn.apply_sysknobs({"work_mem": "'64MB'"}),
+            SYSKNOBS_APPLIED_RELOAD,
+        )
+        self.assertEqual(get_boot_settings(), boot_settings)
+        boot_pg_conn.shutdown_postgres()
+
+    def test_apply_sysknobs_restarts_for_postmaster_knobs(self) -> None:
+        self.assertEqual(
+            self.pg_conn.apply_sysknobs({"wal_buffers": "8MB", "work_mem": "64MB"}),
+            SYSKNOBS_APPLIED_RESTART,
+        )
+        new_sysknobs = self.pg_conn.get_system_knobs()
+        self.assertEqual(new_sysknobs["wal_buffers"], "8MB")
+        self.assertEqual(new_sysknobs["work_mem"], "64MB")
+
+        # Only changing a reloadable knob should keep the postmaster knob.
+        self.assertEqual(
+            self.pg_conn.apply_sysknobs({"wal_buffers": "8MB", "work_mem": "32MB"}),
+            SYSKNOBS_APPLIED_RELOAD,
+        )
+        new_sysknobs = self.pg_conn.get_system_knobs()
+        self.assertEqual(new_sysknobs["wal_buffers"], "8MB")
+        self.assertEqual(new_sysknobs["work_mem"], "32MB")
+
+    def _get_postmaster_start_time(self) -> Any:
+        row = (
+            self.pg_conn.conn().execute("SELECT pg_postmaster_start_time()").fetchone()
+        )
+        assert row is not None
+        return row[0]
+
     def test_time_query(self) -> None:
         runtime, did_time_out, explain_data = self.pg_conn.time_query(
             "select pg_sleep(1)"
@@ -112,6 +226,246 @@ class PostgresConnTests(unittest.TestCase):
         self.assertFalse(did_time_out)
         self.assertIsNone(explain_data)
 
+    def test_time_query_with_runtime_cache(self) -> None:
+        runtime_cache = RuntimeCache(
+            get_runtime_cache_path_from_workspace_path(
+                PostgresConnTests.workspace.dbgym_workspace_path
+            )
+        )
+        runtime_cache.clear()
+        self.pg_conn.runtime_cache = runtime_cache
+
+        timing = self.pg_conn.time_query_detailed("select pg_sleep(1)")
+        self.assertFalse(timing.cached)
+        cached_timing = self.pg_conn.time_query_detailed("select pg_sleep(1)")
+        self.assertTrue(cached_timing.cached)
+        self.assertEqual(cached_timing.runtime, timing.runtime)
+
+        # Changing the configuration should invalidate the cache.
+        self.pg_conn.apply_sysknobs({"work_mem": "64MB"})
+        self.assertFalse(self.pg_conn.time_query_detailed("select pg_sleep(1)").cached)
+        self.pg_conn.psql("CREATE TABLE t (a int)")
+        self.pg_conn.psql("CREATE INDEX t_a ON t (a)")
+        self.assertFalse(self.pg_conn.time_query_detailed("select pg_sleep(1)").cached)
+        self.assertTrue(self.pg_conn.time_query_detailed("select pg_sleep(1)").cached)
+
+    def test_time_workload_with_budget(self) -> None:
+        workload_path = PostgresConnTests.workspace.dbgym_tmp_path / "sleep_workload"
+        workload_path.mkdir(parents=True, exist_ok=True)
+        order_lines = []
+        for i in range(1, 5):
+            query_path = workload_path / f"{i}.sql"
+            query_path.write_text("select pg_sleep(0.5)")
+            order_lines.append(f"S{i},{query_path}")
+        (workload_path / "order.txt").write_text("\n".join(order_lines) + "\n")
+        workload = Workload(PostgresConnTests.workspace, workload_path)
+
+        timing = self.pg_conn.time_workload_detailed(workload, workload_budget=1.2)
+        self.assertTrue(timing.budget_exceeded)
+        self.assertEqual(list(timing.query_timings.keys()), ["S1", "S2"])
+        # S3 was cancelled and S4 was never run.
+        self.assertEqual(timing.skipped_qids, ["S3", "S4"])
+        self.assertEqual(timing.num_timed_out, 0)
+        # The workload was aborted as soon as it exceeded the budget.
+        self.assertTrue(abs(timing.total_runtime - 1_200_000) < 100_000)
+
+        timing = self.pg_conn.time_workload_detailed(workload, workload_budget=10)
+        self.assertFalse(timing.budget_exceeded)
+        self.assertEqual(timing.skipped_qids, [])
+        self.assertEqual(len(timing.query_timings), 4)
+
+    def test_time_workload_with_weights(self) -> None:
+        workload_path = PostgresConnTests.workspace.dbgym_tmp_path / "weighted_workload"
+        workload_path.mkdir(parents=True, exist_ok=True)
+        with open(workload_path / "order.txt", "w") as f:
+            for i in range(2):
+                query_path = workload_path / f"{i}.sql"
+                query_path.write_text("select pg_sleep(0.2)")
+                f.write(f"Q{i},{query_path}\n")
+        with open(workload_path / WORKLOAD_WEIGHTS_FNAME, "w") as f:
+            json.dump({"Q0": 3, "Q1": 1}, f)
+        workload = Workload(PostgresConnTests.workspace, workload_path)
+
+        total_runtime, num_timed_out = self.pg_conn.time_workload(workload)
+        # Q0 stands for three queries.
+        self.assertTrue(abs(total_runtime - 800_000) < 100_000)
+        self.assertEqual(num_timed_out, 0)
+
+    def test_time_workload_throughput(self) -> None:
+        workload_path = (
+            PostgresConnTests.workspace.dbgym_tmp_path / "throughput_workload"
+        )
+        workload_path.mkdir(parents=True, exist_ok=True)
+        query_path = workload_path / "1.sql"
+        query_path.write_text("select pg_sleep(0.1)")
+        (workload_path / "order.txt").write_text(f"S1,{query_path}\n")
+        workload = Workload(PostgresConnTests.workspace, workload_path)
+
+        # In closed loop, 4 clients should each run about 10 queries in 1 second.
+        timing = self.pg_conn.time_workload_throughput(workload, 4, 1)
+        self.assertTrue(abs(timing.get_throughput() - 40) < 8)
+        self.assertTrue(
+            abs(timing.get_latency_percentiles()["S1"][50] - 100_000) < 20_000
+        )
+
+        # In open loop, 10 queries per second should not queue with 4 clients.
+        timing = self.pg_conn.time_workload_throughput(workload, 4, 1, arrival_rate=10)
+        self.assertEqual(timing.get_num_completed(), 10)
+        self.assertEqual(timing.num_dropped, 0)
+
+        # With a single client, 20 queries per second queue up and their latency grows.
+        timing = self.pg_conn.time_workload_throughput(workload, 1, 1, arrival_rate=20)
+        self.assertTrue(timing.num_dropped > 0)
+        self.assertTrue(timing.get_latency_percentiles()["S1"][99] > 300_000)
+
+    def test_time_workload_by_template(self) -> None:
+        workload_path = PostgresConnTests.workspace.dbgym_tmp_path / "template_workload"
+        workload_path.mkdir(parents=True, exist_ok=True)
+        with open(workload_path / "order.txt", "w") as f:
+            for i, sleep_time in enumerate([0.1, 0.11, 0.12, 0.3]):
+                query_path = workload_path / f"{i}.sql"
+                if i < 3:
+                    query_path.write_text(f"select pg_sleep({sleep_time})")
+                else:
+                    query_path.write_text(f"select pg_sleep({sleep_time}), 1")
+                f.write(f"Q{i},{query_path}\n")
+        workload = Workload(PostgresConnTests.workspace, workload_path)
+
+        timing = self.pg_conn.time_workload_by_template(workload)
+        # Only Q0 (which stands for Q0, Q1, and Q2) and Q3 are run.
+        self.assertEqual(list(timing.query_timings), ["Q0", "Q3"])
+        self.assertTrue(abs(timing.total_runtime - 600_000) < 50_000)
+
+    def test_time_trace_workload(self) -> None:
+        trace_path = PostgresConnTests.workspace.dbgym_tmp_path / "trace.jsonl.gz"
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        write_trace(
+            trace_path,
+            (
+                (f"L{i}", "select pg_sleep(0.5)" if i == 0 else "select 1")
+                for i in range(1000)
+            ),
+        )
+        timing = self.pg_conn.time_trace_workload(
+            TraceWorkload(trace_path), query_timeout=0.2, log_interval=100
+        )
+        self.assertEqual(timing.num_queries, 1000)
+        self.assertEqual(timing.num_timed_out, 1)
+        self.assertTrue(timing.max_runtime >= 200_000)
+
+        # Modes which keep state per distinct query aren't supported.
+        for measurement_mode in [
+            MEASUREMENT_MODE_PREPARED,
+            MEASUREMENT_MODE_PG_STAT_STATEMENTS,
+        ]:
+            with self.assertRaises(AssertionError):
+                self.pg_conn.time_trace_workload(
+                    TraceWorkload(trace_path), measurement_mode=measurement_mode
+                )
+
+    def test_time_query_with_measurement_modes(self) -> None:
+        for measurement_mode in MEASUREMENT_MODES:
+            timing = self.pg_conn.time_query_detailed(
+                "select pg_sleep(0.5)", measurement_mode=measurement_mode
+            )
+            self.assertTrue(abs(timing.runtime - 500_000) < 100_000, measurement_mode)
+            self.assertFalse(timing.did_time_out)
+            if measurement_mode == MEASUREMENT_MODE_WALL:
+                self.assertIsNone(timing.planning_time)
+                self.assertIsNone(timing.execution_time)
+            else:
+                self.assertIsNotNone(timing.planning_time, measurement_mode)
+                self.assertIsNotNone(timing.execution_time, measurement_mode)
+
+    def test_time_query_with_measurement_modes_and_timeout(self) -> None:
+        for measurement_mode in MEASUREMENT_MODES:
+            timing = self.pg_conn.time_query_detailed(
+                "select pg_sleep(3)", timeout=1, measurement_mode=measurement_mode
+            )
+            self.assertTrue(timing.did_time_out, measurement_mode)
+            self.assertEqual(timing.runtime, 1_000_000)
+        # The connection should still be usable after a server-side cursor was canceled.
+        self.assertFalse(self.pg_conn.time_query_detailed("select 1").did_time_out)
+
+    def test_time_query_prepared(self) -> None:
+        query = "select * from lineitem limit 10"
+        timing = self.pg_conn.time_query_detailed(
+            query, measurement_mode=MEASUREMENT_MODE_PREPARED
+        )
+        self.assertIsNotNone(timing.planning_time)
+        self.assertEqual(timing.runtime, timing.execution_time)
+        self.assertEqual(len(self.pg_conn._prepared_statements), 1)
+        # The statement is only prepared once.
+        self.pg_conn.time_query_detailed(
+            query, measurement_mode=MEASUREMENT_MODE_PREPARED
+        )
+        self.assertEqual(len(self.pg_conn._prepared_statements), 1)
+
+        # Changing the configuration should invalidate the prepared statements.
+        self.pg_conn.apply_sysknobs({"random_page_cost": "1.1"})
+        self.assertEqual(len(self.pg_conn._prepared_statements), 0)
+        self.pg_conn.time_query_detailed(
+            query, measurement_mode=MEASUREMENT_MODE_PREPARED
+        )
+        self.pg_conn.psql("CREATE INDEX lineitem_l_orderkey ON lineitem (l_orderkey)")
+        self.assertEqual(len(self.pg_conn._prepared_statements), 0)
+
+    def test_apply_indexes(self) -> None:
+        results = self.pg_conn.apply_indexes(
+            [
+                "CREATE INDEX lineitem_l_orderkey ON lineitem (l_orderkey)",
+                "CREATE INDEX lineitem_l_partkey ON lineitem (l_partkey)",
+                "CREATE INDEX orders_o_custkey ON orders (o_custkey)",
+                "DROP INDEX lineitem_l_partkey",
+                "CREATE INDEX lineitem_l_suppkey ON lineitem (l_suppkey)",
+            ],
+            num_builders=2,
+        )
+        self.assertEqual(results, [(0, None)] * 5)
+        index_defs = "\n".join(self.pg_conn.get_index_defs())
+        self.assertIn("lineitem_l_orderkey", index_defs)
+        self.assertNotIn("lineitem_l_partkey", index_defs)
+        self.assertIn("orders_o_custkey", index_defs)
+        self.assertIn("lineitem_l_suppkey", index_defs)
+
+    def test_apply_indexes_with_timeout(self) -> None:
+        results = self.pg_conn.apply_indexes(
+            [
+                "CREATE INDEX lineitem_l_orderkey ON lineitem (l_orderkey)",
+                "CREATE INDEX lineitem_l_comment ON lineitem (l_comment)",
+            ],
+            timeout=0.001,
+        )
+        for status, stderr in results:
+            self.assertEqual(status, -1)
+            assert stderr is not None
+            self.assertIn("canceling statement", stderr)
+        index_defs = "\n".join(self.pg_conn.get_index_defs())
+        self.assertNotIn("lineitem_l_orderkey", index_defs)
+        self.assertNotIn("lineitem_l_comment", index_defs)
+
+    def test_evaluate_hypothetical_indexes(self) -> None:
+        workload = Workload(PostgresConnTests.workspace, self.metadata.workload_path)
+        result = self.pg_conn.evaluate_hypothetical_indexes(
+            [
+                "CREATE INDEX ON lineitem (l_shipdate)",
+                "CREATE INDEX ON lineitem (l_doesnotexist)",
+            ],
+            workload,
+        )
+        self.assertEqual(len(result.indexes), 2)
+        shipdate_index, invalid_index = result.indexes
+        self.assertIsNotNone(shipdate_index.estimated_size)
+        self.assertIsNotNone(invalid_index.error)
+        self.assertEqual(set(result.costs.keys()), set(workload.get_query_order()))
+        # The planner only uses an index if it makes the plan cheaper.
+        for qid in shipdate_index.used_by:
+            self.assertLessEqual(result.costs[qid], result.baseline_costs[qid])
+        # The hypothetical indexes are cleaned up.
+        row = self.pg_conn.conn().execute("SELECT count(*) FROM hypopg()").fetchone()
+        assert row is not None
+        self.assertEqual(row[0], 0)
+
     def test_time_query_with_explain(self) -> None:
         _, _, explain_data = self.pg_conn.time_query("select 1", add_explain=True)
         self.assertIsNotNone(explain_data)
@@ -0,0 +1,74 @@
+import unittest
+
+from gymlib.pg import (
+    DEFAULT_POSTGRES_PORT,
+    get_is_postgres_running,
+    get_running_postgres_ports,
+)
+from gymlib.pg_conn_pool import PostgresConnPool
+from gymlib.tests.gymlib_integtest_util import GymlibIntegtestManager
+from gymlib.workload import Workload
+from gymlib.workspace import DBGymWorkspace
+
+
+class PostgresConnPoolTests(unittest.TestCase):
+    workspace: DBGymWorkspace
+    NUM_INSTANCES = 2
+
+    @staticmethod
+    def setUpClass() -> None:
+        GymlibIntegtestManager.set_up_workspace()
+        # Reset _num_times_created_this_run since previous tests may have created a workspace.
+        DBGymWorkspace._num_times_created_this_run = 0
+        PostgresConnPoolTests.workspace = DBGymWorkspace(
+            GymlibIntegtestManager.get_workspace_path()
+        )
+
+    def setUp(self) -> None:
+        self.assertFalse(
+            get_is_postgres_running(),
+            "Make sure Postgres isn't running before starting the integration test. `pkill postgres` is one way "
+            + "to ensure this. Be careful about accidentally taking down other people's Postgres instances though.",
+        )
+        self.metadata = GymlibIntegtestManager.get_default_metadata()
+        self.pgports = [
+            DEFAULT_POSTGRES_PORT + i
+            for i in range(PostgresConnPoolTests.NUM_INSTANCES)
+        ]
+        self.pool = PostgresConnPool(
+            PostgresConnPoolTests.workspace,
+            self.pgports,
+            self.metadata.pristine_dbdata_snapshot_path,
+            self.metadata.dbdata_parent_path,
+            self.metadata.pgbin_path,
+            None,
+        )
+        self.pool.restore_pristine_snapshot()
+
+    def tearDown(self) -> None:
+        self.pool.shutdown_postgres()
+        self.assertFalse(get_is_postgres_running())
+
+    def test_starts_all_instances(self) -> None:
+        self.assertEqual(set(get_running_postgres_ports()), set(self.pgports))
+
+    def test_time_workload(self) -> None:
+        workload = Workload(
+            PostgresConnPoolTests.workspace, self.metadata.workload_path
+        )
+        total_runtime, num_timed_out = self.pool.time_workload(workload)
+        self.assertGreater(total_runtime, 0)
+        self.assertEqual(num_timed_out, 0)
+
+    def test_restart_with_changes_applies_to_all_instances(self) -> None:
+        self.pool.restart_with_changes({"enable_nestloop": "off"})
+        for pg_conn in self.pool.pg_conns:
+            self.assertEqual(pg_conn.get_system_knobs()["enable_nestloop"], "off")
+
+    def test_memory_guard(self) -> None:
+        with self.assertRaises(AssertionError):
+            self.pool.restart_with_changes({"shared_buffers": "1000000TB"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
 from gymlib.tests.gymlib_integtest_util import GymlibIntegtestManager
+from gymlib.timing import QueryTiming, WorkloadTiming
 from gymlib.tuning_artifacts import (
     DBMSConfigDelta,
     IndexesDelta,
@@ -86,6 +87,30 @@ class PostgresConnTests(unittest.TestCase):
         expected_metadata = GymlibIntegtestManager.get_default_metadata()
         self.assertEqual(metadata, expected_metadata)
 
+    def test_write_plans(self) -> None:
+        writer = TuningArtifactsWriter(
+            self.workspace,
+            GymlibIntegtestManager.get_default_metadata(),
+        )
+        reader = TuningArtifactsReader(writer.tuning_artifacts_path)
+        self.assertIsNone(reader.get_plan_store())
+
+        explain_data = {"Plan": {"Node Type": "Result"}, "Execution Time": 0.1}
+        writer.write_step(PostgresConnTests.make_config("a"))
+        writer.write_step(PostgresConnTests.make_config("b"))
+        writer.write_plans(
+            WorkloadTiming(
+                total_runtime=100,
+                num_timed_out=0,
+                query_timings={"Q1": QueryTiming(100, False, explain_data)},
+            )
+        )
+
+        plan_store = reader.get_plan_store()
+        assert plan_store is not None
+        # The plans belong to the latest step.
+        self.assertEqual(plan_store.get_explain_data(1, "Q1"), [explain_data])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,89 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from gymlib.adaptive_timeout import AdaptiveTimeoutPolicy
+
+
+class AdaptiveTimeoutPolicyTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd()
+            / "gymlib_package/gymlib/tests/test_adaptive_timeout_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_best_and_median(self) -> None:
+        policy = AdaptiveTimeoutPolicy()
+        self.assertIsNone(policy.get_best("Q1"))
+        self.assertIsNone(policy.get_median("Q1"))
+        for runtime in [3e6, 1e6, 2e6]:
+            policy.record("Q1", runtime, False)
+        self.assertEqual(policy.get_best("Q1"), 1e6)
+        self.assertEqual(policy.get_median("Q1"), 2e6)
+
+    def test_timed_out_runtimes_are_not_recorded(self) -> None:
+        policy = AdaptiveTimeoutPolicy()
+        policy.record("Q1", 5e6, True)
+        self.assertIsNone(policy.get_best("Q1"))
+
+    def test_timeout_is_multiple_of_best(self) -> None:
+        policy = AdaptiveTimeoutPolicy(multiplier=3, floor=0.1)
+        policy.record("Q1", 2e6, False)
+        policy.record("Q1", 1e6, False)
+        self.assertEqual(policy.get_timeout("Q1"), 3)
+
+    def test_floor_and_ceiling(self) -> None:
+        policy = AdaptiveTimeoutPolicy(multiplier=2, floor=1, ceiling=10)
+        # A 50ms query would get a 100ms timeout without the floor.
+        policy.record("Q6", 50_000, False)
+        self.assertEqual(policy.get_timeout("Q6"), 1)
+        # A 60s query would get a 120s timeout without the ceiling.
+        policy.record("Q18", 60e6, False)
+        self.assertEqual(policy.get_timeout("Q18"), 10)
+
+    def test_default_timeout_without_history(self) -> None:
+        self.assertEqual(AdaptiveTimeoutPolicy().get_timeout("Q1", 30), 30)
+        self.assertEqual(AdaptiveTimeoutPolicy().get_timeout("Q1"), 0)
+        # The ceiling still applies.
+        policy = AdaptiveTimeoutPolicy(ceiling=10)
+        self.assertEqual(policy.get_timeout("Q1", 30), 10)
+        self.assertEqual(policy.get_timeout("Q1"), 10)
+        self.assertEqual(policy.get_timeout("Q1", 5), 5)
+
+    def test_history_is_bounded(self) -> None:
+        policy = AdaptiveTimeoutPolicy(multiplier=2, history_size=2)
+        for runtime in [1e6, 3e6, 2e6]:
+            policy.record("Q1", runtime, False)
+        # The 1s runtime fell out of the window.
+        self.assertEqual(policy.get_best("Q1"), 2e6)
+        self.assertEqual(policy.get_timeout("Q1"), 4)
+
+    def test_save_and_load(self) -> None:
+        history_path = self.scratchspace_path / "timeout_history.json"
+        policy = AdaptiveTimeoutPolicy(history_path=history_path)
+        policy.record("Q1", 1e6, False)
+        policy.save()
+
+        loaded_policy = AdaptiveTimeoutPolicy(history_path=history_path)
+        self.assertEqual(loaded_policy.get_best("Q1"), 1e6)
+
+        # The window still applies to the loaded history.
+        loaded_policy = AdaptiveTimeoutPolicy(history_path=history_path, history_size=1)
+        loaded_policy.record("Q1", 2e6, False)
+        self.assertEqual(loaded_policy.get_best("Q1"), 2e6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import shutil
+import tarfile
+import unittest
+from pathlib import Path
+
+from gymlib.dbdata_archive import (
+    SNAPSHOT_FORMATS,
+    create_dbdata_snapshot,
+    detect_snapshot_format,
+    extract_dbdata_snapshot,
+)
+
+
+class DbdataArchiveTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_dbdata_archive_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.dbdata_path = self.scratchspace_path / "dbdata"
+        (self.dbdata_path / "base" / "1").mkdir(parents=True)
+        (self.dbdata_path / "base" / "1" / "1234").write_bytes(b"relation" * 1000)
+        (self.dbdata_path / "PG_VERSION").write_text("15\n")
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_roundtrip_all_formats(self) -> None:
+        for snapshot_format in SNAPSHOT_FORMATS:
+            if shutil.which(snapshot_format) is None:
+                continue
+
+            # Snapshots are always named .tgz, regardless of the format.
+            snapshot_path = self.scratchspace_path / f"{snapshot_format}.tgz"
+            create_dbdata_snapshot(self.dbdata_path, snapshot_path, snapshot_format)
+            self.assertEqual(
+                detect_snapshot_format(snapshot_path),
+                "zstd" if snapshot_format == "zstd" else "gzip",
+            )
+
+            extracted_path = self.scratchspace_path / f"extracted_{snapshot_format}"
+            extract_dbdata_snapshot(snapshot_path, extracted_path)
+            self.assertEqual(
+                (extracted_path / "base" / "1" / "1234").read_bytes(),
+                b"relation" * 1000,
+            )
+            self.assertEqual((extracted_path / "PG_VERSION").read_text(), "15\n")
+
+    def test_detect_uncompressed_tar(self) -> None:
+        snapshot_path = self.scratchspace_path / "dbdata.tar"
+        with tarfile.open(snapshot_path, "w") as tar:
+            tar.add(self.dbdata_path, arcname=".")
+        self.assertEqual(detect_snapshot_format(snapshot_path), "tar")
+
+        extracted_path = self.scratchspace_path / "extracted_tar"
+        extract_dbdata_snapshot(snapshot_path, extracted_path)
+        self.assertEqual((extracted_path / "PG_VERSION").read_text(), "15\n")
+
+    def test_detect_invalid_format(self) -> None:
+        snapshot_path = self.scratchspace_path / "dbdata.tgz"
+        snapshot_path.write_bytes(b"not a snapshot")
+        with self.assertRaises(AssertionError):
+            detect_snapshot_format(snapshot_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
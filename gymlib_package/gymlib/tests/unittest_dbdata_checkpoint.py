@@ -0,0 +1,190 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from gymlib.dbdata_checkpoint import BASE_LAYER, DeltaCheckpoint
+from gymlib.dbdata_restore import clone_dbdata
+
+
+class DeltaCheckpointTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd()
+            / "gymlib_package/gymlib/tests/test_dbdata_checkpoint_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+        self.base_dbdata_path = self.scratchspace_path / "golden_dbdata"
+        (self.base_dbdata_path / "base" / "1").mkdir(parents=True)
+        (self.base_dbdata_path / "base" / "1" / "1234").write_bytes(b"lineitem")
+        (self.base_dbdata_path / "base" / "1" / "5678").write_bytes(b"orders")
+        (self.base_dbdata_path / "pg_wal").mkdir()
+        (self.base_dbdata_path / "postgresql.conf").write_text("port=5432\n")
+        os.chmod(self.base_dbdata_path, 0o700)
+
+        self.dbdata_path = self.scratchspace_path / "dbdata5432"
+        clone_dbdata(self.base_dbdata_path, self.dbdata_path)
+        self.checkpoint = DeltaCheckpoint(
+            self.scratchspace_path / "checkpoint_dbdata5432",
+            self.base_dbdata_path,
+            "base_key",
+        )
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def save_checkpoint(self) -> None:
+        self.checkpoint.stage(self.dbdata_path)
+        self.checkpoint.commit()
+
+    def test_restore_without_checkpoint_restores_base(self) -> None:
+        (self.dbdata_path / "base" / "1" / "1234").write_bytes(b"modified")
+        self.checkpoint.restore(self.dbdata_path)
+        self.assertEqual(
+            (self.dbdata_path / "base" / "1" / "1234").read_bytes(), b"lineitem"
+        )
+
+    def test_only_changed_files_are_saved(self) -> None:
+        # Simulate creating an index and writing WAL.
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index")
+        (self.dbdata_path / "pg_wal" / "000000010000000000000001").write_bytes(b"wal")
+        self.save_checkpoint()
+
+        manifest = self.checkpoint.get_manifest()
+        self.assertEqual(manifest.num_layers, 1)
+        self.assertEqual(manifest.files["base/1/1234"].layer, BASE_LAYER)
+        self.assertEqual(manifest.files["base/1/9999"].layer, 0)
+        layer_path = self.checkpoint.checkpoint_path / "layer0"
+        self.assertEqual(
+            {
+                str(p.relative_to(layer_path))
+                for p in layer_path.rglob("*")
+                if p.is_file()
+            },
+            {"base/1/9999", "pg_wal/000000010000000000000001"},
+        )
+
+    def test_rewritten_file_with_same_contents_is_not_saved(self) -> None:
+        relation_path = self.dbdata_path / "base" / "1" / "1234"
+        relation_path.write_bytes(b"lineitem")
+        os.utime(relation_path, ns=(0, 0))
+        self.save_checkpoint()
+        self.assertEqual(
+            self.checkpoint.get_manifest().files["base/1/1234"].layer, BASE_LAYER
+        )
+
+    def test_restore_layers_deltas(self) -> None:
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index")
+        self.save_checkpoint()
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index v2")
+        (self.dbdata_path / "base" / "1" / "5678").unlink()
+        (self.dbdata_path / "base" / "2").mkdir()
+        (self.dbdata_path / "base" / "2" / "4321").write_bytes(b"new database")
+        self.save_checkpoint()
+
+        # Restoring should give the state of the second checkpoint no matter what dbdata looks like now.
+        shutil.rmtree(self.dbdata_path)
+        self.checkpoint.restore(self.dbdata_path)
+        self.assertEqual(
+            (self.dbdata_path / "base" / "1" / "1234").read_bytes(), b"lineitem"
+        )
+        self.assertEqual(
+            (self.dbdata_path / "base" / "1" / "9999").read_bytes(), b"index v2"
+        )
+        self.assertFalse((self.dbdata_path / "base" / "1" / "5678").exists())
+        self.assertEqual(
+            (self.dbdata_path / "base" / "2" / "4321").read_bytes(), b"new database"
+        )
+        self.assertTrue((self.dbdata_path / "pg_wal").is_dir())
+
+    def test_commit_deletes_old_versions(self) -> None:
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index")
+        (self.dbdata_path / "base" / "1" / "8888").write_bytes(b"other index")
+        self.save_checkpoint()
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index v2")
+        self.save_checkpoint()
+
+        layer0_path = self.checkpoint.checkpoint_path / "layer0"
+        # The first version of 9999 isn't used anymore but 8888 still is.
+        self.assertFalse((layer0_path / "base" / "1" / "9999").exists())
+        self.assertTrue((layer0_path / "base" / "1" / "8888").exists())
+
+        (self.dbdata_path / "base" / "1" / "8888").unlink()
+        self.save_checkpoint()
+        self.assertFalse(layer0_path.exists())
+
+    def test_layers_are_merged(self) -> None:
+        self.checkpoint = DeltaCheckpoint(
+            self.checkpoint.checkpoint_path,
+            self.base_dbdata_path,
+            "base_key",
+            max_layers=2,
+        )
+        for i in range(3):
+            (self.dbdata_path / "base" / "1" / f"{9000 + i}").write_bytes(
+                f"index {i}".encode()
+            )
+            self.save_checkpoint()
+
+        # The third commit left three layers with files in them, so they were merged.
+        manifest = self.checkpoint.get_manifest()
+        self.assertEqual(manifest.num_layers, 4)
+        self.assertEqual(
+            {manifest.files[f"base/1/{9000 + i}"].layer for i in range(3)}, {3}
+        )
+        self.assertEqual(
+            sorted(p.name for p in self.checkpoint.checkpoint_path.iterdir()),
+            ["layer3", "manifest.json"],
+        )
+
+        shutil.rmtree(self.dbdata_path)
+        self.checkpoint.restore(self.dbdata_path)
+        for i in range(3):
+            self.assertEqual(
+                (self.dbdata_path / "base" / "1" / f"{9000 + i}").read_bytes(),
+                f"index {i}".encode(),
+            )
+
+    def test_uncommitted_stage_is_not_restored(self) -> None:
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index")
+        self.save_checkpoint()
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index v2")
+        self.checkpoint.stage(self.dbdata_path)
+
+        self.checkpoint.restore(self.dbdata_path)
+        self.assertEqual(
+            (self.dbdata_path / "base" / "1" / "9999").read_bytes(), b"index"
+        )
+
+    def test_checkpoint_of_other_base_is_discarded(self) -> None:
+        (self.dbdata_path / "base" / "1" / "9999").write_bytes(b"index")
+        self.save_checkpoint()
+        self.assertEqual(
+            DeltaCheckpoint(
+                self.checkpoint.checkpoint_path, self.base_dbdata_path, "base_key"
+            ).get_manifest(),
+            self.checkpoint.get_manifest(),
+        )
+
+        # If the base changes (e.g. because the snapshot was regenerated), the checkpoint can't be
+        #   restored on top of it.
+        checkpoint = DeltaCheckpoint(
+            self.checkpoint.checkpoint_path, self.base_dbdata_path, "new_base_key"
+        )
+        self.assertFalse(checkpoint.has_checkpoint())
+        self.assertEqual(list(checkpoint.checkpoint_path.iterdir()), [])
+        checkpoint.restore(self.dbdata_path)
+        self.assertFalse((self.dbdata_path / "base" / "1" / "9999").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
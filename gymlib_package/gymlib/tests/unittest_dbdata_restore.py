@@ -0,0 +1,115 @@
+import os
+import shutil
+import tarfile
+import unittest
+from pathlib import Path
+
+from gymlib.dbdata_restore import (
+    clone_dbdata,
+    ensure_golden_dbdata,
+    get_golden_dbdata_path,
+)
+
+
+class DbdataRestoreTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_dbdata_restore_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+        # Make a tiny "dbdata" and snapshot it the same way `dbms postgres dbdata` does.
+        self.orig_dbdata_path = self.scratchspace_path / "orig_dbdata"
+        (self.orig_dbdata_path / "base" / "1").mkdir(parents=True)
+        (self.orig_dbdata_path / "base" / "1" / "1234").write_bytes(b"relation")
+        (self.orig_dbdata_path / "PG_VERSION").write_text("15\n")
+        os.chmod(self.orig_dbdata_path, 0o700)
+        self.snapshot_path = self.scratchspace_path / "dbdata.tgz"
+        with tarfile.open(self.snapshot_path, "w:gz") as tar:
+            tar.add(self.orig_dbdata_path, arcname=".")
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_golden_path_depends_on_snapshot(self) -> None:
+        golden_path = get_golden_dbdata_path(self.scratchspace_path, self.snapshot_path)
+        self.assertEqual(
+            golden_path,
+            get_golden_dbdata_path(self.scratchspace_path, self.snapshot_path),
+        )
+        # Regenerating the snapshot should give a different golden dbdata.
+        os.utime(self.snapshot_path, ns=(0, 0))
+        self.assertNotEqual(
+            golden_path,
+            get_golden_dbdata_path(self.scratchspace_path, self.snapshot_path),
+        )
+
+    def test_ensure_golden_dbdata_only_untars_once(self) -> None:
+        golden_path = get_golden_dbdata_path(self.scratchspace_path, self.snapshot_path)
+        ensure_golden_dbdata(self.snapshot_path, golden_path)
+        self.assertEqual((golden_path / "PG_VERSION").read_text(), "15\n")
+
+        # If the golden dbdata already exists, it should not be overwritten.
+        (golden_path / "PG_VERSION").write_text("16\n")
+        ensure_golden_dbdata(self.snapshot_path, golden_path)
+        self.assertEqual((golden_path / "PG_VERSION").read_text(), "16\n")
+
+    def test_ensure_golden_dbdata_removes_stale_versions(self) -> None:
+        old_golden_path = get_golden_dbdata_path(
+            self.scratchspace_path, self.snapshot_path
+        )
+        ensure_golden_dbdata(self.snapshot_path, old_golden_path)
+
+        # The golden dbdata of another snapshot shouldn't be removed.
+        other_snapshot_path = self.scratchspace_path / "other_dbdata.tgz"
+        shutil.copy(self.snapshot_path, other_snapshot_path)
+        other_golden_path = get_golden_dbdata_path(
+            self.scratchspace_path, other_snapshot_path
+        )
+        ensure_golden_dbdata(other_snapshot_path, other_golden_path)
+
+        # Regenerating the snapshot should remove the golden dbdata of its old version.
+        os.utime(self.snapshot_path, ns=(0, 0))
+        new_golden_path = get_golden_dbdata_path(
+            self.scratchspace_path, self.snapshot_path
+        )
+        ensure_golden_dbdata(self.snapshot_path, new_golden_path)
+        self.assertTrue(new_golden_path.exists())
+        self.assertTrue(other_golden_path.exists())
+        self.assertFalse(old_golden_path.exists())
+        self.assertFalse(
+            any(
+                path.name.startswith(old_golden_path.name)
+                for path in self.scratchspace_path.iterdir()
+            )
+        )
+
+    def test_clone_dbdata(self) -> None:
+        for use_reflink in [None, False]:
+            dbdata_path = self.scratchspace_path / "dbdata5432"
+            clone_dbdata(self.orig_dbdata_path, dbdata_path, use_reflink=use_reflink)
+
+            cloned_relation_path = dbdata_path / "base" / "1" / "1234"
+            orig_relation_path = self.orig_dbdata_path / "base" / "1" / "1234"
+            self.assertEqual(cloned_relation_path.read_bytes(), b"relation")
+            self.assertEqual(
+                cloned_relation_path.stat().st_mtime_ns,
+                orig_relation_path.stat().st_mtime_ns,
+            )
+            self.assertEqual(dbdata_path.stat().st_mode & 0o777, 0o700)
+
+            # Writing to the clone must not modify the golden dbdata.
+            cloned_relation_path.write_bytes(b"modified")
+            self.assertEqual(orig_relation_path.read_bytes(), b"relation")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from gymlib.hypothetical_indexes import (
+    HypotheticalIndexesResult,
+    get_index_names_in_plan,
+)
+
+
+class HypotheticalIndexesTests(unittest.TestCase):
+    def test_get_index_names_in_plan(self) -> None:
+        plan = {
+            "Node Type": "Nested Loop",
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "orders"},
+                {
+                    "Node Type": "Index Scan",
+                    "Relation Name": "lineitem",
+                    "Index Name": "<13543>btree_lineitem_l_orderkey",
+                },
+                {
+                    "Node Type": "Bitmap Heap Scan",
+                    "Plans": [
+                        {
+                            "Node Type": "Bitmap Index Scan",
+                            "Index Name": "customer_pkey",
+                        }
+                    ],
+                },
+            ],
+        }
+        self.assertEqual(
+            get_index_names_in_plan(plan),
+            {"<13543>btree_lineitem_l_orderkey", "customer_pkey"},
+        )
+        self.assertEqual(get_index_names_in_plan({"Node Type": "Result"}), set())
+
+    def test_get_cost_reductions(self) -> None:
+        result = HypotheticalIndexesResult(
+            baseline_costs={"Q1": 100, "Q2": 50}, costs={"Q1": 40, "Q2": 50}, indexes=[]
+        )
+        self.assertEqual(result.get_cost_reductions(), {"Q1": 60, "Q2": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from gymlib.pg import (
+    POSTMASTER_PID_FNAME,
+    conf_value_to_str,
+    divide_maintenance_resources,
+    get_changed_sysknobs,
+    get_created_index_name,
+    get_index_batches,
+    get_startup_errors,
+    pg_memory_to_bytes,
+    read_postmaster_pid_file,
+)
+
+
+class PgTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_pg_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_pg_memory_to_bytes_with_units(self) -> None:
+        self.assertEqual(pg_memory_to_bytes("4GB"), 4 * 1024**3)
+        self.assertEqual(pg_memory_to_bytes("512MB"), 512 * 1024**2)
+        self.assertEqual(pg_memory_to_bytes("64kB"), 64 * 1024)
+        self.assertEqual(pg_memory_to_bytes("100B"), 100)
+
+    def test_pg_memory_to_bytes_with_quotes_and_spaces(self) -> None:
+        self.assertEqual(pg_memory_to_bytes("'2 GB'"), 2 * 1024**3)
+
+    def test_pg_memory_to_bytes_without_unit(self) -> None:
+        # Unitless values are 8kB blocks by default.
+        self.assertEqual(pg_memory_to_bytes("16384"), 16384 * 8192)
+        self.assertEqual(pg_memory_to_bytes("1024", unitless_multiplier=1024), 1024**2)
+
+    def test_pg_memory_to_bytes_with_invalid_unit(self) -> None:
+        with self.assertRaises(AssertionError):
+            pg_memory_to_bytes("4XB")
+
+    def test_get_changed_sysknobs(self) -> None:
+        self.assertEqual(
+            get_changed_sysknobs(
+                {"work_mem": "4MB", "enable_nestloop": "off", "wal_buffers": "8MB"},
+                {"work_mem": "8MB", "enable_nestloop": "off", "random_page_cost": "1"},
+            ),
+            # wal_buffers was removed so it goes back to its default.
+            {"work_mem", "wal_buffers", "random_page_cost"},
+        )
+
+    def test_get_changed_sysknobs_with_no_changes(self) -> None:
+        self.assertEqual(
+            get_changed_sysknobs({"work_mem": "4MB"}, {"work_mem": "4MB"}), set()
+        )
+        self.assertEqual(get_changed_sysknobs({}, {}), set())
+
+    def test_conf_value_to_str(self) -> None:
+        self.assertEqual(conf_value_to_str("8MB"), "8MB")
+        self.assertEqual(conf_value_to_str("'8MB'"), "8MB")
+        self.assertEqual(conf_value_to_str(" 'it''s' "), "it's")
+        self.assertEqual(conf_value_to_str("'"), "'")
+
+    def test_read_postmaster_pid_file(self) -> None:
+        self.assertIsNone(read_postmaster_pid_file(self.scratchspace_path))
+
+        pid_file_path = self.scratchspace_path / POSTMASTER_PID_FNAME
+        # This is what the file looks like before the postmaster writes its status.
+        pid_file_lines = [
+            "12345",
+            "/path/to/dbdata",
+            "1700000000",
+            "5432",
+            "/tmp",
+            "localhost",
+            "  5432001         0",
+        ]
+        pid_file_path.write_text("\n".join(pid_file_lines) + "\n")
+        self.assertEqual(
+            read_postmaster_pid_file(self.scratchspace_path), (12345, None)
+        )
+
+        pid_file_path.write_text("\n".join(pid_file_lines + ["ready   "]) + "\n")
+        self.assertEqual(
+            read_postmaster_pid_file(self.scratchspace_path), (12345, "ready")
+        )
+
+    def test_read_postmaster_pid_file_that_is_being_written(self) -> None:
+        (self.scratchspace_path / POSTMASTER_PID_FNAME).write_text("")
+        self.assertIsNone(read_postmaster_pid_file(self.scratchspace_path))
+
+    def test_get_startup_errors(self) -> None:
+        pglog_text = "\n".join(
+            [
+                '2024-01-01 00:00:00.000 EST [1] LOG:  invalid value for parameter "shared_buffers": "1000000TB"',
+                '2024-01-01 00:00:00.000 EST [1] FATAL:  configuration file "postgresql.auto.conf" contains errors',
+                "2024-01-01 00:00:00.000 EST [1] LOG:  database system is shut down",
+            ]
+        )
+        self.assertEqual(
+            get_startup_errors(pglog_text),
+            [
+                '2024-01-01 00:00:00.000 EST [1] FATAL:  configuration file "postgresql.auto.conf" contains errors'
+            ],
+        )
+        self.assertEqual(
+            get_startup_errors(
+                "2024-01-01 00:00:00.000 EST [1] LOG:  database system is ready"
+            ),
+            [],
+        )
+
+    def test_get_index_batches(self) -> None:
+        self.assertEqual(
+            get_index_batches(
+                [
+                    "CREATE INDEX a ON lineitem (l_orderkey)",
+                    "create unique index b ON orders (o_orderkey)",
+                    "DROP INDEX c",
+                    "CREATE INDEX d ON lineitem (l_partkey)",
+                    "CREATE INDEX e ON lineitem (l_suppkey)",
+                ]
+            ),
+            [[0, 1], [2], [3, 4]],
+        )
+        self.assertEqual(get_index_batches([]), [])
+
+    def test_divide_maintenance_resources(self) -> None:
+        self.assertEqual(divide_maintenance_resources("4GB", 8, 4), ("1048576kB", 2))
+        # Unitless values of maintenance_work_mem are in kB.
+        self.assertEqual(divide_maintenance_resources("4096", 8, 2), ("2048kB", 4))
+        # Each builder gets at least the minimum maintenance_work_mem.
+        self.assertEqual(divide_maintenance_resources("1MB", 2, 4), ("1024kB", 0))
+
+    def test_get_created_index_name(self) -> None:
+        self.assertEqual(
+            get_created_index_name("CREATE INDEX Foo ON lineitem (l_orderkey)"), "foo"
+        )
+        self.assertEqual(
+            get_created_index_name(
+                'create unique index if not exists "Foo" on lineitem(l_orderkey)'
+            ),
+            "Foo",
+        )
+        self.assertEqual(
+            get_created_index_name(
+                "CREATE INDEX idx_1 ON public.lineitem USING btree (l_orderkey)"
+            ),
+            "idx_1",
+        )
+        self.assertIsNone(
+            get_created_index_name("CREATE INDEX ON lineitem (l_orderkey)")
+        )
+        self.assertIsNone(
+            get_created_index_name("CREATE INDEX CONCURRENTLY ON lineitem (l_orderkey)")
+        )
+        self.assertIsNone(get_created_index_name("DROP INDEX foo"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import shutil
+import unittest
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+from gymlib.pg_conn import PostgresConn
+from gymlib.pg_conn_pool import PostgresConnPool
+from gymlib.workload import WORKLOAD_BUNDLE_FNAME, Workload, write_workload_bundle
+from gymlib.workload_subset import WORKLOAD_WEIGHTS_FNAME
+from gymlib.workspace import DBGymWorkspace
+
+
+class PostgresConnPoolTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_pg_conn_pool_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        # Other tests assume that no workspace has been created yet.
+        DBGymWorkspace._num_times_created_this_run = 0
+
+    def test_time_workload_applies_weights(self) -> None:
+        workload_path = self.scratchspace_path / "workload"
+        workload_path.mkdir()
+        write_workload_bundle(
+            workload_path / WORKLOAD_BUNDLE_FNAME,
+            [("Q1", "SELECT 1;"), ("Q2", "SELECT 2;")],
+        )
+        with open(workload_path / WORKLOAD_WEIGHTS_FNAME, "w") as f:
+            json.dump({"Q1": 3, "Q2": 0.5}, f)
+        DBGymWorkspace._num_times_created_this_run = 0
+        workspace = DBGymWorkspace(self.scratchspace_path / "dbgym_workspace")
+        workload = Workload(workspace, workload_path)
+        # Creating the pool doesn't start Postgres, so we can fake running the queries.
+        pool = PostgresConnPool(
+            workspace,
+            [5432, 5433],
+            self.scratchspace_path / "dbdata.tgz",
+            self.scratchspace_path,
+            self.scratchspace_path / "pgbin",
+            None,
+        )
+        runtimes = {"SELECT 1;": 100.0, "SELECT 2;": 1000.0}
+
+        def time_query(
+            pg_conn: PostgresConn, query: str, *args: Any, **kwargs: Any
+        ) -> tuple[float, bool, None]:
+            return runtimes[query], query == "SELECT 2;", None
+
+        with patch.object(PostgresConn, "time_query", autospec=True) as mock:
+            mock.side_effect = time_query
+            self.assertEqual(pool.time_workload(workload), (3 * 100 + 0.5 * 1000, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
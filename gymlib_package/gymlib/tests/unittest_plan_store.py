@@ -0,0 +1,140 @@
+import copy
+import shutil
+import unittest
+from pathlib import Path
+from typing import Any
+
+from gymlib.plan_store import PlanStore
+from gymlib.timing import QueryTiming, WorkloadTiming
+
+
+def make_explain_data(
+    join_type: str, total_cost: float, execution_time: float
+) -> dict[str, Any]:
+    """
+    Returns an EXPLAIN (ANALYZE, FORMAT JSON) output of a join between two scans.
+    """
+    return {
+        "Plan": {
+            "Node Type": join_type,
+            "Join Type": "Inner",
+            "Startup Cost": 0.0,
+            "Total Cost": total_cost,
+            "Plan Rows": 10,
+            "Plan Width": 8,
+            "Actual Rows": 12,
+            "Actual Loops": 1,
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "orders",
+                    "Total Cost": total_cost / 2,
+                    "Actual Rows": 100,
+                    "Rows Removed by Filter": 5,
+                },
+                {
+                    "Node Type": "Index Scan",
+                    "Relation Name": "lineitem",
+                    "Index Name": "lineitem_pkey",
+                    "Total Cost": total_cost / 4,
+                    "Actual Rows": 400,
+                    "Shared Hit Blocks": 7,
+                },
+            ],
+        },
+        "Planning Time": 0.1,
+        "Execution Time": execution_time,
+    }
+
+
+class PlanStoreTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_plan_store_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+        self.store_path = self.scratchspace_path / "plan_store.db"
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_shapes_are_deduplicated(self) -> None:
+        plan_store = PlanStore(self.store_path)
+        # Only the estimates and actuals differ, so the shape is the same.
+        plan_hash = plan_store.add(0, "Q1", make_explain_data("Hash Join", 100, 5))
+        self.assertEqual(
+            plan_store.add(1, "Q1", make_explain_data("Hash Join", 200, 7)), plan_hash
+        )
+        self.assertEqual(plan_store.get_num_plans(), 1)
+        self.assertNotEqual(
+            plan_store.add(2, "Q1", make_explain_data("Merge Join", 100, 5)), plan_hash
+        )
+        self.assertEqual(plan_store.get_num_plans(), 2)
+
+    def test_shape_has_no_volatile_keys(self) -> None:
+        plan_store = PlanStore(self.store_path)
+        plan_hash = plan_store.add(0, "Q1", make_explain_data("Hash Join", 100, 5))
+        shape = plan_store.get_shape(plan_hash)
+        self.assertEqual(
+            shape,
+            {
+                "Node Type": "Hash Join",
+                "Join Type": "Inner",
+                "Plans": [
+                    {"Node Type": "Seq Scan", "Relation Name": "orders"},
+                    {
+                        "Node Type": "Index Scan",
+                        "Relation Name": "lineitem",
+                        "Index Name": "lineitem_pkey",
+                    },
+                ],
+            },
+        )
+
+    def test_get_explain_data(self) -> None:
+        plan_store = PlanStore(self.store_path)
+        explain_data = make_explain_data("Hash Join", 100, 5)
+        plan_store.add(0, "Q1", copy.deepcopy(explain_data))
+        self.assertEqual(plan_store.get_explain_data(0, "Q1"), [explain_data])
+        self.assertEqual(plan_store.get_explain_data(1, "Q1"), [])
+
+    def test_get_plan_change_steps(self) -> None:
+        plan_store = PlanStore(self.store_path)
+        for step, join_type in enumerate(
+            ["Hash Join", "Hash Join", "Merge Join", "Merge Join", "Hash Join"]
+        ):
+            plan_store.add(step, "Q1", make_explain_data(join_type, 100 + step, 5))
+            plan_store.add(step, "Q2", make_explain_data("Nested Loop", 100, 5))
+        self.assertEqual(plan_store.get_plan_change_steps("Q1"), [2, 4])
+        self.assertEqual(plan_store.get_plan_change_steps("Q2"), [])
+        self.assertEqual(plan_store.get_plan_change_steps("Q3"), [])
+
+    def test_persists_across_instances(self) -> None:
+        plan_store = PlanStore(self.store_path)
+        plan_store.add_workload_timing(
+            0,
+            WorkloadTiming(
+                total_runtime=5,
+                num_timed_out=0,
+                query_timings={
+                    "Q1": QueryTiming(5, False, make_explain_data("Hash Join", 100, 5)),
+                    # Queries without explain data are skipped.
+                    "Q2": QueryTiming(5, False, None),
+                },
+            ),
+        )
+        plan_store = PlanStore(self.store_path)
+        self.assertEqual(len(plan_store.get_plan_hashes("Q1")), 1)
+        self.assertEqual(plan_store.get_plan_hashes("Q2"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
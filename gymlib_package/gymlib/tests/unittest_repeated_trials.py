@@ -0,0 +1,213 @@
+import json
+import math
+import shutil
+import unittest
+from pathlib import Path
+from typing import Any, Callable
+from unittest.mock import patch
+
+from gymlib.pg_conn import PostgresConn
+from gymlib.repeated_trials import (
+    AGGREGATION_MEDIAN,
+    AGGREGATION_TRIMMED_MEAN,
+    RepeatedTrials,
+    get_median_confidence_interval,
+    get_min_trials_with_confidence_interval,
+    get_t_quantile,
+    get_trimmed_mean,
+    get_trimmed_mean_confidence_interval,
+)
+from gymlib.timing import QueryTiming
+from gymlib.workload import WORKLOAD_BUNDLE_FNAME, Workload, write_workload_bundle
+from gymlib.workload_subset import WORKLOAD_WEIGHTS_FNAME
+from gymlib.workspace import DBGymWorkspace
+
+
+def get_measure_fn(runtimes: list[float]) -> Callable[[], QueryTiming]:
+    """
+    Returns a function which "runs" a query whose runtimes are runtimes, repeating the last one
+    forever. A negative runtime means the query timed out.
+    """
+    remaining_runtimes = list(runtimes)
+
+    def measure_fn() -> QueryTiming:
+        runtime = (
+            remaining_runtimes.pop(0) if len(remaining_runtimes) > 1 else runtimes[-1]
+        )
+        if runtime < 0:
+            return QueryTiming(-runtime, True, None)
+        return QueryTiming(runtime, False, None)
+
+    return measure_fn
+
+
+class RepeatedTrialsTests(unittest.TestCase):
+    def test_get_trimmed_mean(self) -> None:
+        self.assertEqual(get_trimmed_mean([1, 2, 3, 4, 100], 0.2), 3)
+        self.assertEqual(get_trimmed_mean([1, 2, 3, 4, 100], 0), 22)
+
+    def test_get_t_quantile(self) -> None:
+        # These are the two-sided 95% critical values from a t table.
+        for df, expected in [(1, 12.706), (2, 4.303), (3, 3.182), (10, 2.228)]:
+            self.assertAlmostEqual(get_t_quantile(0.975, df), expected, delta=0.01)
+
+    def test_get_median_confidence_interval(self) -> None:
+        # At confidence=0.95, the interval of 20 values is between the 6th and 15th smallest.
+        self.assertEqual(
+            get_median_confidence_interval([float(i) for i in range(1, 21)], 0.95),
+            (6, 15),
+        )
+        # With 6 values, it's the whole range.
+        self.assertEqual(
+            get_median_confidence_interval([float(i) for i in range(1, 7)], 0.95),
+            (1, 6),
+        )
+        # With 5 values, even the whole range doesn't have 95% coverage.
+        self.assertEqual(
+            get_median_confidence_interval([float(i) for i in range(1, 6)], 0.95),
+            (-math.inf, math.inf),
+        )
+
+    def test_get_trimmed_mean_confidence_interval(self) -> None:
+        ci_low, ci_high = get_trimmed_mean_confidence_interval(
+            [10, 11, 12, 13, 100], 0.2, 0.95
+        )
+        # The outlier is winsorized so the interval stays around the trimmed mean (12).
+        self.assertTrue(ci_low < 12 < ci_high)
+        self.assertTrue(ci_high < 20)
+        self.assertEqual(
+            get_trimmed_mean_confidence_interval([10], 0.2, 0.95),
+            (-math.inf, math.inf),
+        )
+
+    def test_get_min_trials_with_confidence_interval(self) -> None:
+        for aggregation, trim_fraction, confidence in [
+            (AGGREGATION_MEDIAN, 0, 0.95),
+            (AGGREGATION_MEDIAN, 0, 0.99),
+            (AGGREGATION_TRIMMED_MEAN, 0.2, 0.95),
+        ]:
+            min_trials = get_min_trials_with_confidence_interval(
+                aggregation, trim_fraction, confidence
+            )
+            repeated_trials = RepeatedTrials(
+                aggregation=aggregation,
+                trim_fraction=trim_fraction,
+                confidence=confidence,
+            )
+            self.assertEqual(repeated_trials.min_trials, min_trials)
+            self.assertTrue(
+                math.isinf(
+                    repeated_trials.get_confidence_interval(
+                        list(range(min_trials - 1))
+                    )[1]
+                )
+            )
+            self.assertFalse(
+                math.isinf(
+                    repeated_trials.get_confidence_interval(list(range(min_trials)))[1]
+                )
+            )
+        self.assertEqual(
+            get_min_trials_with_confidence_interval(AGGREGATION_MEDIAN, 0, 0.95), 6
+        )
+
+    def test_stops_early_when_stable(self) -> None:
+        repeated_trials = RepeatedTrials(num_warmup=1, min_trials=6, max_trials=20)
+        timings = repeated_trials.run_trials({"stable": get_measure_fn([500, 100])})
+        # The warmup run is discarded.
+        self.assertEqual(timings["stable"].trials, [100] * 6)
+        self.assertEqual(timings["stable"].runtime, 100)
+        self.assertTrue(timings["stable"].converged)
+
+    def test_runs_more_trials_when_noisy(self) -> None:
+        repeated_trials = RepeatedTrials(num_warmup=0, min_trials=6, max_trials=10)
+        timings = repeated_trials.run_trials(
+            {
+                "stable": get_measure_fn([100]),
+                "noisy": get_measure_fn([100, 200, 50, 300, 80, 150, 120, 90, 250, 60]),
+            }
+        )
+        self.assertEqual(len(timings["stable"].trials), 6)
+        self.assertEqual(len(timings["noisy"].trials), 10)
+        self.assertFalse(timings["noisy"].converged)
+        # The timings are in the same order as measure_fns.
+        self.assertEqual(list(timings.keys()), ["stable", "noisy"])
+
+    def test_trimmed_mean(self) -> None:
+        repeated_trials = RepeatedTrials(
+            num_warmup=0,
+            min_trials=3,
+            max_trials=5,
+            aggregation=AGGREGATION_TRIMMED_MEAN,
+            trim_fraction=0.2,
+        )
+        timing = repeated_trials.summarize([100, 101, 99, 100, 1000])
+        self.assertAlmostEqual(timing.runtime, 100.333, delta=0.001)
+
+    def test_timed_out_query_stops(self) -> None:
+        repeated_trials = RepeatedTrials(num_warmup=1)
+        timings = repeated_trials.run_trials({"slow": get_measure_fn([-1e6])})
+        self.assertTrue(timings["slow"].did_time_out)
+        self.assertEqual(timings["slow"].runtime, 1e6)
+        self.assertEqual(timings["slow"].trials, [])
+
+
+class RepeatedTrialsWorkloadTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd()
+            / "gymlib_package/gymlib/tests/test_repeated_trials_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        # Other tests assume that no workspace has been created yet.
+        DBGymWorkspace._num_times_created_this_run = 0
+
+    def test_time_workload_applies_weights(self) -> None:
+        workload_path = self.scratchspace_path / "workload"
+        workload_path.mkdir()
+        write_workload_bundle(
+            workload_path / WORKLOAD_BUNDLE_FNAME,
+            [("Q1", "SELECT 1;"), ("Q2", "SELECT 2;")],
+        )
+        with open(workload_path / WORKLOAD_WEIGHTS_FNAME, "w") as f:
+            json.dump({"Q1": 3, "Q2": 0.5}, f)
+        DBGymWorkspace._num_times_created_this_run = 0
+        workspace = DBGymWorkspace(self.scratchspace_path / "dbgym_workspace")
+        workload = Workload(workspace, workload_path)
+        # Creating a PostgresConn doesn't start Postgres, so we can fake running the queries.
+        pg_conn = PostgresConn(
+            workspace,
+            5432,
+            self.scratchspace_path / "dbdata.tgz",
+            self.scratchspace_path,
+            self.scratchspace_path / "pgbin",
+            None,
+        )
+        runtimes = {"SELECT 1;": 100.0, "SELECT 2;": 1000.0}
+
+        def time_query_detailed(
+            pg_conn: PostgresConn, query: str, *args: Any, **kwargs: Any
+        ) -> QueryTiming:
+            return QueryTiming(runtimes[query], False, None)
+
+        repeated_trials = RepeatedTrials(num_warmup=0, min_trials=3, max_trials=3)
+        with patch.object(PostgresConn, "time_query_detailed", autospec=True) as mock:
+            mock.side_effect = time_query_detailed
+            timing = repeated_trials.time_workload(pg_conn, workload)
+        self.assertEqual(timing.total_runtime, 3 * 100 + 0.5 * 1000)
+        self.assertEqual(timing.num_timed_out, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+import shutil
+import sqlite3
+import time
+import unittest
+from pathlib import Path
+
+from gymlib.runtime_cache import (
+    RUNTIME_CACHE_SCHEMA_VERSION,
+    RuntimeCache,
+    canonicalize_index_def,
+    get_config_fingerprint,
+    get_query_key,
+)
+from gymlib.timing import QueryTiming
+
+
+class RuntimeCacheTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_runtime_cache_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+        self.cache_path = self.scratchspace_path / "runtime_cache.db"
+        self.fingerprint = get_config_fingerprint("snapshot", {}, [])
+        self.query_key = get_query_key("select 1", "", "wall")
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_migrates_old_schema(self) -> None:
+        # This is the schema from before explain_data, planning_time, and execution_time were added.
+        with sqlite3.connect(self.cache_path) as conn:
+            conn.execute(
+                "CREATE TABLE trials (config_fingerprint TEXT NOT NULL, query_key TEXT NOT NULL, "
+                + "runtime REAL NOT NULL, did_time_out INTEGER NOT NULL, timeout REAL NOT NULL, "
+                + "created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "INSERT INTO trials VALUES (?, ?, 100, 0, 0, ?)",
+                (self.fingerprint, self.query_key, time.time()),
+            )
+        conn.close()
+
+        cache = RuntimeCache(self.cache_path, num_trials=2)
+        cache.put(
+            self.fingerprint,
+            self.query_key,
+            QueryTiming(200, False, {"Plan": {}}, planning_time=5, execution_time=150),
+            0,
+        )
+        timing = cache.get(self.fingerprint, self.query_key, 0)
+        assert timing is not None
+        self.assertEqual(timing.num_trials, 2)
+        with sqlite3.connect(self.cache_path) as conn:
+            self.assertEqual(
+                conn.execute("PRAGMA user_version").fetchone()[0],
+                RUNTIME_CACHE_SCHEMA_VERSION,
+            )
+            # The new trial's values went into the right columns.
+            self.assertEqual(
+                conn.execute(
+                    "SELECT planning_time, execution_time FROM trials WHERE runtime = 200"
+                ).fetchone(),
+                (5, 150),
+            )
+        conn.close()
+        # Opening it again doesn't migrate it again.
+        RuntimeCache(self.cache_path)
+
+    def test_canonicalize_index_def(self) -> None:
+        self.assertEqual(
+            canonicalize_index_def("CREATE INDEX idx_1 ON public.t USING btree (a)"),
+            "CREATE INDEX ON public.t USING btree (a)",
+        )
+        self.assertEqual(
+            canonicalize_index_def(
+                "CREATE UNIQUE INDEX t_pkey ON public.t USING btree (a)"
+            ),
+            "CREATE UNIQUE INDEX ON public.t USING btree (a)",
+        )
+
+    def test_config_fingerprint_is_canonical(self) -> None:
+        self.assertEqual(
+            get_config_fingerprint(
+                "snapshot",
+                {"Work_Mem": "'64MB'", "enable_nestloop": "off"},
+                [
+                    "CREATE INDEX a_idx ON public.t USING btree (a)",
+                    "CREATE INDEX b_idx ON public.t USING btree (b)",
+                ],
+            ),
+            get_config_fingerprint(
+                "snapshot",
+                {"enable_nestloop": "off", "work_mem": "64MB"},
+                [
+                    "CREATE INDEX idx2 ON public.t USING btree (b)",
+                    "CREATE INDEX idx1 ON public.t USING btree (a)",
+                ],
+            ),
+        )
+
+    def test_config_fingerprint_differs(self) -> None:
+        fingerprint = get_config_fingerprint("snapshot", {"work_mem": "64MB"}, [])
+        self.assertNotEqual(
+            fingerprint, get_config_fingerprint("snapshot", {"work_mem": "32MB"}, [])
+        )
+        self.assertNotEqual(
+            fingerprint, get_config_fingerprint("other", {"work_mem": "64MB"}, [])
+        )
+        self.assertNotEqual(
+            fingerprint,
+            get_config_fingerprint(
+                "snapshot",
+                {"work_mem": "64MB"},
+                ["CREATE INDEX idx ON public.t USING btree (a)"],
+            ),
+        )
+
+    def test_config_fingerprint_includes_boot_config(self) -> None:
+        boot_config = {"early_stop": True, "seq_sample": True, "seq_sample_pct": 50}
+        fingerprint = get_config_fingerprint("snapshot", {}, [], boot_config)
+        self.assertNotEqual(fingerprint, get_config_fingerprint("snapshot", {}, []))
+        self.assertNotEqual(
+            fingerprint,
+            get_config_fingerprint(
+                "snapshot", {}, [], {**boot_config, "seq_sample_pct": 10}
+            ),
+        )
+        # The order of the keys doesn't matter.
+        self.assertEqual(
+            fingerprint,
+            get_config_fingerprint(
+                "snapshot", {}, [], dict(reversed(list(boot_config.items())))
+            ),
+        )
+
+    def test_config_fingerprint_includes_shared_preload_libraries(self) -> None:
+        fingerprint = get_config_fingerprint(
+            "snapshot", {}, [], shared_preload_libraries="boot,pg_stat_statements"
+        )
+        self.assertNotEqual(
+            fingerprint,
+            get_config_fingerprint("snapshot", {}, [], shared_preload_libraries="boot"),
+        )
+        # The order of the libraries doesn't matter.
+        self.assertEqual(
+            fingerprint,
+            get_config_fingerprint(
+                "snapshot", {}, [], shared_preload_libraries="pg_stat_statements, boot"
+            ),
+        )
+
+    def test_query_key_includes_hints_and_measurement_mode(self) -> None:
+        self.assertNotEqual(
+            get_query_key("select 1", "", "wall"),
+            get_query_key("select 1", "/*+ SeqScan(t) */ ", "wall"),
+        )
+        self.assertNotEqual(
+            get_query_key("select 1", "", "wall"),
+            get_query_key("select 1", "", "explain"),
+        )
+
+    def test_miss_then_hit(self) -> None:
+        cache = RuntimeCache(self.cache_path)
+        self.assertIsNone(cache.get(self.fingerprint, self.query_key, 0))
+        cache.put(
+            self.fingerprint, self.query_key, QueryTiming(100, False, {"Plan": {}}), 0
+        )
+        self.assertEqual(
+            cache.get(self.fingerprint, self.query_key, 0),
+            QueryTiming(100, False, {"Plan": {}}, cached=True, num_trials=1),
+        )
+
+    def test_planning_and_execution_time(self) -> None:
+        cache = RuntimeCache(self.cache_path)
+        cache.put(
+            self.fingerprint,
+            self.query_key,
+            QueryTiming(100, False, None, planning_time=30, execution_time=70),
+            0,
+        )
+        timing = cache.get(self.fingerprint, self.query_key, 0)
+        assert timing is not None
+        self.assertEqual(timing.planning_time, 30)
+        self.assertEqual(timing.execution_time, 70)
+
+    def test_persists_across_instances(self) -> None:
+        RuntimeCache(self.cache_path).put(
+            self.fingerprint, self.query_key, QueryTiming(100, False, None), 0
+        )
+        self.assertEqual(
+            RuntimeCache(self.cache_path).get(self.fingerprint, self.query_key, 0),
+            QueryTiming(100, False, None, cached=True, num_trials=1),
+        )
+
+    def test_num_trials(self) -> None:
+        cache = RuntimeCache(self.cache_path, num_trials=3)
+        for runtime in [300, 100]:
+            cache.put(
+                self.fingerprint, self.query_key, QueryTiming(runtime, False, None), 0
+            )
+            self.assertIsNone(cache.get(self.fingerprint, self.query_key, 0))
+        cache.put(self.fingerprint, self.query_key, QueryTiming(200, False, None), 0)
+        # The result is the median of the trials.
+        self.assertEqual(
+            cache.get(self.fingerprint, self.query_key, 0),
+            QueryTiming(200, False, None, cached=True, num_trials=3),
+        )
+
+    def test_max_age(self) -> None:
+        cache = RuntimeCache(self.cache_path, max_age=0.1)
+        cache.put(self.fingerprint, self.query_key, QueryTiming(100, False, None), 0)
+        self.assertIsNotNone(cache.get(self.fingerprint, self.query_key, 0))
+        time.sleep(0.2)
+        self.assertIsNone(cache.get(self.fingerprint, self.query_key, 0))
+
+    def test_timeouts(self) -> None:
+        cache = RuntimeCache(self.cache_path)
+        # This trial ran for 2s without a timeout.
+        cache.put(self.fingerprint, self.query_key, QueryTiming(2e6, False, None), 0)
+        self.assertEqual(
+            cache.get(self.fingerprint, self.query_key, 3),
+            QueryTiming(2e6, False, None, cached=True, num_trials=1),
+        )
+        # With a 1s timeout, the query would have timed out.
+        self.assertEqual(
+            cache.get(self.fingerprint, self.query_key, 1),
+            QueryTiming(1e6, True, None, cached=True, num_trials=1),
+        )
+
+    def test_timed_out_trials(self) -> None:
+        cache = RuntimeCache(self.cache_path)
+        cache.put(self.fingerprint, self.query_key, QueryTiming(2e6, True, None), 2)
+        # We know the query would time out with a shorter timeout...
+        self.assertEqual(
+            cache.get(self.fingerprint, self.query_key, 1),
+            QueryTiming(1e6, True, None, cached=True, num_trials=1),
+        )
+        # ...but we don't know how long it would take with a longer timeout.
+        self.assertIsNone(cache.get(self.fingerprint, self.query_key, 3))
+        self.assertIsNone(cache.get(self.fingerprint, self.query_key, 0))
+
+    def test_clear(self) -> None:
+        cache = RuntimeCache(self.cache_path)
+        cache.put(self.fingerprint, self.query_key, QueryTiming(100, False, None), 0)
+        cache.clear()
+        self.assertIsNone(cache.get(self.fingerprint, self.query_key, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
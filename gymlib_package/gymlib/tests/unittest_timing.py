@@ -0,0 +1,44 @@
+import unittest
+
+from gymlib.timing import QueryTiming, ThroughputTiming, TraceTiming, get_percentile
+
+
+class TimingTests(unittest.TestCase):
+    def test_get_percentile(self) -> None:
+        values = [float(value) for value in range(100, 0, -1)]
+        self.assertEqual(get_percentile(values, 50), 50)
+        self.assertEqual(get_percentile(values, 95), 95)
+        self.assertEqual(get_percentile(values, 99), 99)
+        self.assertEqual(get_percentile(values, 100), 100)
+
+    def test_get_percentile_of_few_values(self) -> None:
+        self.assertEqual(get_percentile([7], 50), 7)
+        self.assertEqual(get_percentile([7], 99), 7)
+        self.assertEqual(get_percentile([1, 2], 50), 1)
+        self.assertEqual(get_percentile([1, 2], 51), 2)
+
+    def test_throughput(self) -> None:
+        timing = ThroughputTiming(
+            duration=2, latencies={"Q1": [1, 2, 3], "Q2": [4]}, num_timed_out={"Q2": 1}
+        )
+        self.assertEqual(timing.get_num_completed(), 4)
+        self.assertEqual(timing.get_throughput(), 2)
+        self.assertEqual(
+            timing.get_latency_percentiles([50, 99]),
+            {"Q1": {50: 2, 99: 3}, "Q2": {50: 4, 99: 4}},
+        )
+
+    def test_trace_timing(self) -> None:
+        timing = TraceTiming()
+        self.assertEqual(timing.get_mean_runtime(), 0)
+        timing.add(QueryTiming(1000, False, None))
+        timing.add(QueryTiming(3000, True, None))
+        self.assertEqual(timing.num_queries, 2)
+        self.assertEqual(timing.total_runtime, 4000)
+        self.assertEqual(timing.max_runtime, 3000)
+        self.assertEqual(timing.num_timed_out, 1)
+        self.assertEqual(timing.get_mean_runtime(), 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
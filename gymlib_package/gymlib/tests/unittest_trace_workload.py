@@ -0,0 +1,78 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from gymlib.trace_workload import TraceWorkload, write_trace
+
+
+class TraceWorkloadTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_trace_workload_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_compressed_traces(self) -> None:
+        queries = [("Q1", "SELECT 1;"), ("Q2", "SELECT\n  2;"), ("Q3", "SELECT 1;")]
+        for fname in ["trace.jsonl", "trace.jsonl.gz", "trace.jsonl.bz2", "trace.xz"]:
+            trace_path = self.scratchspace_path / fname
+            write_trace(trace_path, queries)
+            trace = TraceWorkload(trace_path)
+            self.assertEqual(list(trace), queries)
+            # The trace can be iterated over more than once.
+            self.assertEqual(list(trace), queries)
+
+    def test_compression_is_used(self) -> None:
+        queries = [(f"Q{i}", "SELECT * FROM lineitem;") for i in range(1000)]
+        write_trace(self.scratchspace_path / "trace.jsonl", queries)
+        write_trace(self.scratchspace_path / "trace.jsonl.gz", queries)
+        self.assertLess(
+            (self.scratchspace_path / "trace.jsonl.gz").stat().st_size,
+            (self.scratchspace_path / "trace.jsonl").stat().st_size / 10,
+        )
+
+    def test_default_qids(self) -> None:
+        trace_path = self.scratchspace_path / "trace.jsonl"
+        trace_path.write_text(
+            '{"query": "SELECT 1;"}\n\n{"qid": "Q3", "query": "SELECT 3;"}\n'
+        )
+        self.assertEqual(
+            list(TraceWorkload(trace_path)), [("L1", "SELECT 1;"), ("Q3", "SELECT 3;")]
+        )
+
+    def test_interning(self) -> None:
+        trace_path = self.scratchspace_path / "trace.jsonl"
+        write_trace(
+            trace_path,
+            [
+                ("Q1", "SELECT 1;"),
+                ("Q2", "SELECT 2;"),
+                ("Q3", "SELECT 1;"),
+                ("Q4", "SELECT 2;"),
+            ],
+        )
+        queries = [query for _, query in TraceWorkload(trace_path)]
+        self.assertIs(queries[0], queries[2])
+        self.assertIs(queries[1], queries[3])
+
+        # Only the first max_interned_queries texts are interned.
+        queries = [
+            query for _, query in TraceWorkload(trace_path, max_interned_queries=1)
+        ]
+        self.assertIs(queries[0], queries[2])
+        self.assertIsNot(queries[1], queries[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import json
+import shutil
+import unittest
+from pathlib import Path
+
+from gymlib.workload import (
+    WORKLOAD_BUNDLE_FNAME,
+    Workload,
+    parse_workload_bundle,
+    write_workload_bundle,
+)
+from gymlib.workload_subset import WORKLOAD_WEIGHTS_FNAME
+from gymlib.workload_templates import (
+    WORKLOAD_TEMPLATES_FNAME,
+    WorkloadTemplates,
+    write_workload_templates,
+)
+from gymlib.workspace import DBGymWorkspace
+
+
+class WorkloadBundleTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "gymlib_package/gymlib/tests/test_workload_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        # Other tests assume that no workspace has been created yet.
+        DBGymWorkspace._num_times_created_this_run = 0
+
+    def test_write_and_parse(self) -> None:
+        queries = [
+            ("S1-Q1", "SELECT 1;"),
+            ("S1-Q2", "SELECT 'ünïcode';"),
+            ("S2-Q1", "SELECT 1;"),
+            ("S2-Q2", "SELECT 2;"),
+        ]
+        bundle_path = self.scratchspace_path / WORKLOAD_BUNDLE_FNAME
+        write_workload_bundle(bundle_path, queries)
+        with open(bundle_path, "rb") as f:
+            data = f.read()
+        parsed_queries = parse_workload_bundle(data)
+        self.assertEqual(parsed_queries, queries)
+
+        # Identical queries are only stored once.
+        self.assertEqual(data.count(b"SELECT 1;"), 1)
+        self.assertIs(parsed_queries[0][1], parsed_queries[2][1])
+
+    def test_workload_loads_bundle(self) -> None:
+        queries = [("Q1", "SELECT 1;"), ("Q2", "SELECT 2;")]
+        workload_path = self.scratchspace_path / "workload"
+        workload_path.mkdir()
+        with open(workload_path / "order.txt", "w") as f:
+            for qid, query in queries:
+                query_path = self.scratchspace_path / f"{qid}.sql"
+                query_path.write_text(query)
+                f.write(f"{qid},{query_path}\n")
+
+        DBGymWorkspace._num_times_created_this_run = 0
+        workspace = DBGymWorkspace(self.scratchspace_path / "dbgym_workspace")
+        workload_from_order = Workload(workspace, workload_path)
+        write_workload_bundle(workload_path / WORKLOAD_BUNDLE_FNAME, queries)
+        # We remove the query files to check that the bundle is used.
+        for qid, _ in queries:
+            (self.scratchspace_path / f"{qid}.sql").unlink()
+        workload_from_bundle = Workload(workspace, workload_path)
+
+        self.assertEqual(workload_from_bundle.get_query_order(), ["Q1", "Q2"])
+        self.assertEqual(
+            workload_from_bundle.get_queries_in_order(),
+            workload_from_order.get_queries_in_order(),
+        )
+
+    def test_get_templates(self) -> None:
+        queries = [("S1-Q1", "SELECT 1;"), ("S2-Q1", "SELECT 2;")]
+        workload_path = self.scratchspace_path / "workload"
+        workload_path.mkdir()
+        write_workload_bundle(workload_path / WORKLOAD_BUNDLE_FNAME, queries)
+        DBGymWorkspace._num_times_created_this_run = 0
+        workspace = DBGymWorkspace(self.scratchspace_path / "dbgym_workspace")
+
+        # Without a templates file, the templates are computed.
+        templates = Workload(workspace, workload_path).get_templates()
+        self.assertEqual(templates.get_weights(), {"S1-Q1": 2})
+
+        # With one, they're read from it.
+        write_workload_templates(
+            workload_path / WORKLOAD_TEMPLATES_FNAME,
+            WorkloadTemplates({"a": ["S1-Q1"], "b": ["S2-Q1"]}),
+        )
+        templates = Workload(workspace, workload_path).get_templates()
+        self.assertEqual(templates.get_weights(), {"S1-Q1": 1, "S2-Q1": 1})
+
+    def test_get_weights(self) -> None:
+        queries = [("Q1", "SELECT 1;"), ("Q2", "SELECT 2;")]
+        workload_path = self.scratchspace_path / "workload"
+        workload_path.mkdir()
+        write_workload_bundle(workload_path / WORKLOAD_BUNDLE_FNAME, queries)
+        DBGymWorkspace._num_times_created_this_run = 0
+        workspace = DBGymWorkspace(self.scratchspace_path / "dbgym_workspace")
+
+        # Without a weights file, every query has a weight of 1.
+        self.assertEqual(
+            Workload(workspace, workload_path).get_weights(), {"Q1": 1, "Q2": 1}
+        )
+
+        with open(workload_path / WORKLOAD_WEIGHTS_FNAME, "w") as f:
+            json.dump({"Q1": 2.5, "Q2": 1}, f)
+        workload = Workload(workspace, workload_path)
+        self.assertEqual(workload.get_weights(), {"Q1": 2.5, "Q2": 1})
+
+        # The weights are only read once.
+        (workload_path / WORKLOAD_WEIGHTS_FNAME).unlink()
+        self.assertEqual(workload.get_weights(), {"Q1": 2.5, "Q2": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
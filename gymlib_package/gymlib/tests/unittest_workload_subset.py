@@ -0,0 +1,86 @@
+import unittest
+
+from gymlib.workload_subset import (
+    get_feature_vectors,
+    get_plan_features,
+    get_subset_error,
+    get_weighted_runtime,
+    select_subset,
+)
+
+
+class WorkloadSubsetTests(unittest.TestCase):
+    def test_get_plan_features(self) -> None:
+        plan = {
+            "Node Type": "Hash Join",
+            "Plans": [
+                {"Node Type": "Seq Scan"},
+                {"Node Type": "Hash", "Plans": [{"Node Type": "Seq Scan"}]},
+            ],
+        }
+        self.assertEqual(
+            get_plan_features(plan), {"Hash Join": 1, "Seq Scan": 2, "Hash": 1}
+        )
+
+    def test_get_feature_vectors(self) -> None:
+        vectors = get_feature_vectors(
+            {"Q1": 100, "Q2": 100, "Q3": 100},
+            {"Q1": {"Seq Scan": 1}, "Q2": {"Seq Scan": 3}},
+        )
+        # The runtimes are all the same, so that dimension doesn't matter. Q3 has no plan (e.g.
+        #   because it timed out), so it has no nodes.
+        self.assertEqual([vector[0] for vector in vectors.values()], [0, 0, 0])
+        self.assertAlmostEqual(
+            sum(vector[1] for vector in vectors.values()), 0, places=9
+        )
+        self.assertLess(vectors["Q3"][1], vectors["Q1"][1])
+        self.assertLess(vectors["Q1"][1], vectors["Q2"][1])
+
+    def test_select_subset(self) -> None:
+        # There are two kinds of queries: fast index scans and slow hash joins.
+        baseline_runtimes = {
+            "Q1": 10.0,
+            "Q2": 1000.0,
+            "Q3": 12.0,
+            "Q4": 1100.0,
+            "Q5": 11.0,
+        }
+        index_scan = {"Index Scan": 1.0}
+        hash_join = {"Hash Join": 1.0, "Hash": 1.0, "Seq Scan": 2.0}
+        plan_features = {
+            "Q1": index_scan,
+            "Q2": hash_join,
+            "Q3": index_scan,
+            "Q4": hash_join,
+            "Q5": index_scan,
+        }
+        weights = select_subset(baseline_runtimes, plan_features, 2)
+        self.assertEqual(list(weights), ["Q2", "Q5"])
+        # The weighted runtime matches the total runtime at the baseline.
+        self.assertAlmostEqual(
+            get_weighted_runtime(weights, baseline_runtimes),
+            sum(baseline_runtimes.values()),
+        )
+        self.assertAlmostEqual(get_subset_error(weights, baseline_runtimes), 0)
+
+        # If a configuration makes all hash joins twice as slow, the subset tracks it.
+        runtimes = {
+            qid: runtime * (2 if plan_features[qid] == hash_join else 1)
+            for qid, runtime in baseline_runtimes.items()
+        }
+        self.assertAlmostEqual(get_subset_error(weights, runtimes), 0)
+
+    def test_select_all_queries(self) -> None:
+        baseline_runtimes = {"Q1": 10.0, "Q2": 0.0}
+        weights = select_subset(baseline_runtimes, {}, 2)
+        # With k equal to the number of queries, each query stands for itself.
+        self.assertEqual(weights, {"Q1": 1, "Q2": 1})
+
+    def test_get_subset_error(self) -> None:
+        self.assertEqual(
+            get_subset_error({"Q1": 2}, {"Q1": 30, "Q2": 20, "Q3": 50}), 0.4
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from gymlib.workload_templates import (
+    WorkloadTemplates,
+    get_query_fingerprint,
+    group_by_template,
+    parse_workload_templates,
+    write_workload_templates,
+)
+
+
+class WorkloadTemplatesTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd()
+            / "gymlib_package/gymlib/tests/test_workload_templates_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_get_query_fingerprint(self) -> None:
+        # These are like TPC-H Q1 with two different seeds.
+        self.assertEqual(
+            get_query_fingerprint(
+                "-- seed 1\nselect * from lineitem where l_shipdate <= date '1998-12-01' - interval '90' day;"
+            ),
+            get_query_fingerprint(
+                "select *\nfrom lineitem\nwhere l_shipdate <= date '1998-12-01' - interval '61' day;"
+            ),
+        )
+        self.assertNotEqual(
+            get_query_fingerprint("select * from lineitem where l_quantity < 10;"),
+            get_query_fingerprint("select * from lineitem where l_discount < 10;"),
+        )
+        # Queries which can't be parsed are only grouped with identical queries.
+        self.assertEqual(
+            get_query_fingerprint("selec 1"), get_query_fingerprint("selec 1")
+        )
+        self.assertNotEqual(
+            get_query_fingerprint("selec 1"), get_query_fingerprint("selec 2")
+        )
+
+    def test_group_by_template(self) -> None:
+        templates = group_by_template(
+            [
+                ("S1-Q1", "select * from orders where o_orderkey = 1;"),
+                ("S1-Q2", "select count(*) from lineitem;"),
+                ("S2-Q1", "select * from orders where o_orderkey = 2;"),
+                ("S2-Q2", "select count(*) from lineitem;"),
+                ("S3-Q1", "select * from orders where o_orderkey = 3;"),
+            ]
+        )
+        self.assertEqual(
+            list(templates.template_qids.values()),
+            [["S1-Q1", "S2-Q1", "S3-Q1"], ["S1-Q2", "S2-Q2"]],
+        )
+        self.assertEqual(templates.get_representative_qids(), ["S1-Q1", "S1-Q2"])
+        self.assertEqual(templates.get_weights(), {"S1-Q1": 3, "S1-Q2": 2})
+
+    def test_write_and_parse(self) -> None:
+        templates_path = self.scratchspace_path / "templates.json"
+        for is_template_safe in [True, False]:
+            templates = WorkloadTemplates(
+                {"a": ["Q1", "Q3"], "b": ["Q2"]}, is_template_safe
+            )
+            write_workload_templates(templates_path, templates)
+            self.assertEqual(
+                parse_workload_templates(templates_path.read_text()), templates
+            )
+
+        # Files which don't say whether they're safe aren't trusted.
+        templates_path.write_text('{"template_qids": {"a": ["Q1"]}}')
+        self.assertFalse(
+            parse_workload_templates(templates_path.read_text()).is_template_safe
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+"""
+time_workload() measures the latency of a single stream of queries. This file measures throughput
+instead: K clients run a workload's queries concurrently against the same instance for a fixed
+duration. It uses asyncio so that a single Python thread can drive many clients.
+
+There are two ways to drive the clients:
+ - Closed loop (arrival_rate=None): each client sends its next query as soon as its previous one
+   finishes, so the load adapts to how fast the database is.
+ - Open loop (arrival_rate set): queries arrive at a fixed rate no matter how fast the database is.
+   A query which arrives while all clients are busy waits for one and the wait is part of its
+   latency. Otherwise, a slow database would simply be sent fewer queries, which would hide how
+   slow it is.
+
+See PostgresConn.time_workload_throughput() for the usual entry point.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+import psycopg
+from gymlib.timing import ThroughputTiming
+from psycopg.errors import QueryCanceled
+
+
+def run_throughput(
+    kv_connstr: str,
+    queries: list[tuple[str, str]],
+    num_clients: int,
+    duration: float,
+    arrival_rate: Optional[float] = None,
+    query_timeout: float = 0,
+) -> ThroughputTiming:
+    """
+    Runs the (qid, query) pairs in queries round robin with num_clients clients for duration
+    seconds and returns the latencies of all queries which completed.
+
+    arrival_rate is in queries per second and is only set in open loop. query_timeout is in
+    seconds and, following Postgres's convention, 0 means "no timeout".
+
+    This starts its own event loop, so it can't be called from inside a running one. Await
+    run_throughput_async() in that case.
+    """
+    return asyncio.run(
+        run_throughput_async(
+            kv_connstr, queries, num_clients, duration, arrival_rate, query_timeout
+        )
+    )
+
+
+async def run_throughput_async(
+    kv_connstr: str,
+    queries: list[tuple[str, str]],
+    num_clients: int,
+    duration: float,
+    arrival_rate: Optional[float] = None,
+    query_timeout: float = 0,
+) -> ThroughputTiming:
+    assert len(queries) > 0, "queries must not be empty."
+    assert num_clients >= 1, f"num_clients ({num_clients}) must be at least 1."
+    assert duration > 0, f"duration ({duration}) must be positive."
+    assert (
+        arrival_rate is None or arrival_rate > 0
+    ), f"arrival_rate ({arrival_rate}) must be positive."
+    assert (
+        query_timeout >= 0
+    ), f'Setting query_timeout to 0 indicates "disable timeout". However, setting query_timeout ({query_timeout}) < 0 is a bug.'
+
+    # We connect before starting the clock so that connecting isn't part of the measurement.
+    conns = await asyncio.gather(
+        *[
+            psycopg.AsyncConnection.connect(
+                kv_connstr, autocommit=True, prepare_threshold=None
+            )
+            for _ in range(num_clients)
+        ]
+    )
+    try:
+        for conn in conns:
+            # Unlike time_query(), the timeout never changes, so we set it once per session.
+            await conn.execute(f"SET statement_timeout = {query_timeout * 1000}")
+
+        timing = ThroughputTiming(duration=0)
+        start_time = time.time()
+        deadline = start_time + duration
+        if arrival_rate is None:
+            await asyncio.gather(
+                *[
+                    _run_closed_loop_client(
+                        conn,
+                        queries,
+                        # We stagger the clients so that they don't all run the same query at the
+                        #   same time.
+                        i * len(queries) // num_clients,
+                        deadline,
+                        timing,
+                    )
+                    for i, conn in enumerate(conns)
+                ]
+            )
+        else:
+            await _run_open_loop(
+                conns, queries, arrival_rate, start_time, deadline, timing
+            )
+        timing.duration = time.time() - start_time
+    finally:
+        for conn in conns:
+            await conn.close()
+
+    logging.debug(
+        f"Completed {timing.get_num_completed()} queries in {timing.duration}s with {num_clients} clients"
+    )
+    return timing
+
+
+async def _run_query(
+    conn: psycopg.AsyncConnection[Any],
+    qid: str,
+    query: str,
+    start_time: float,
+    timing: ThroughputTiming,
+) -> None:
+    """
+    Runs query and records its latency relative to start_time (which may be before the query was
+    sent in open loop).
+    """
+    try:
+        await conn.execute(query)
+    except QueryCanceled:
+        timing.num_timed_out[qid] = timing.num_timed_out.get(qid, 0) + 1
+        return
+    timing.latencies.setdefault(qid, []).append((time.time() - start_time) * 1e6)
+
+
+async def _run_closed_loop_client(
+    conn: psycopg.AsyncConnection[Any],
+    queries: list[tuple[str, str]],
+    start_index: int,
+    deadline: float,
+    timing: ThroughputTiming,
+) -> None:
+    i = start_index
+    while time.time() < deadline:
+        qid, query = queries[i % len(queries)]
+        await _run_query(conn, qid, query, time.time(), timing)
+        i += 1
+
+
+async def _run_open_loop(
+    conns: list[psycopg.AsyncConnection[Any]],
+    queries: list[tuple[str, str]],
+    arrival_rate: float,
+    start_time: float,
+    deadline: float,
+    timing: ThroughputTiming,
+) -> None:
+    idle_conns: asyncio.Queue[psycopg.AsyncConnection[Any]] = asyncio.Queue()
+    for conn in conns:
+        idle_conns.put_nowait(conn)
+
+    async def handle_arrival(qid: str, query: str, arrival_time: float) -> None:
+        conn = await idle_conns.get()
+        try:
+            # If the database can't keep up, there may be a backlog of queries when the duration is
+            #   up. We drop them instead of running them so that the run ends on time.
+            if time.time() >= deadline:
+                timing.num_dropped += 1
+                return
+            await _run_query(conn, qid, query, arrival_time, timing)
+        finally:
+            idle_conns.put_nowait(conn)
+
+    tasks = []
+    i = 0
+    while True:
+        # We compute each arrival time from the start instead of sleeping 1 / arrival_rate between
+        #   arrivals so that delays in waking up don't accumulate.
+        arrival_time = start_time + i / arrival_rate
+        if arrival_time >= deadline:
+            break
+        await asyncio.sleep(max(arrival_time - time.time(), 0))
+        qid, query = queries[i % len(queries)]
+        tasks.append(asyncio.create_task(handle_arrival(qid, query, arrival_time)))
+        i += 1
+    await asyncio.gather(*tasks)
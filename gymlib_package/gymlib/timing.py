@@ -0,0 +1,151 @@
+"""
+The results of timing queries and workloads. They're in their own file so that both PostgresConn
+and RuntimeCache can use them.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+@dataclass
+class QueryTiming:
+    # In microseconds. If the query timed out, this is the timeout.
+    runtime: float
+    did_time_out: bool
+    explain_data: Optional[dict[str, Any]]
+    # Whether the result came from the RuntimeCache instead of executing the query.
+    cached: bool = False
+    # The number of measurements the result is based on (see RuntimeCache).
+    num_trials: int = 1
+    # In microseconds. These are only known in some measurement modes and are None otherwise
+    #   (including when the query timed out).
+    planning_time: Optional[float] = None
+    execution_time: Optional[float] = None
+
+
+@dataclass
+class WorkloadTiming:
+    # In microseconds. Each query is weighted by its weight in the workload (see
+    #   Workload.get_weights()).
+    total_runtime: float
+    num_timed_out: int
+    # Keyed by qid, in the order of the workload.
+    query_timings: dict[str, QueryTiming] = field(default_factory=dict)
+    # Whether the workload_budget was exceeded, in which case the result is partial.
+    budget_exceeded: bool = False
+    # The queries which didn't complete because the budget was exceeded, in the order of the
+    #   workload. If a query was cancelled, it's the first one. The time it ran before being
+    #   cancelled is included in total_runtime but it's not in query_timings.
+    skipped_qids: list[str] = field(default_factory=list)
+
+    def get_num_cached(self) -> int:
+        return sum(1 for timing in self.query_timings.values() if timing.cached)
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    """
+    Returns the nearest-rank percentile of values, which is always one of the values.
+    """
+    assert len(values) > 0, "values must not be empty."
+    assert 0 < percentile <= 100, f"percentile ({percentile}) must be in (0, 100]."
+    sorted_values = sorted(values)
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class ThroughputTiming:
+    # In seconds. This is the time from when the first query was sent until the last one finished.
+    duration: float
+    # In microseconds, keyed by qid. Only queries which completed are included.
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    # Keyed by qid. Only qids with at least one timed out query are included.
+    num_timed_out: dict[str, int] = field(default_factory=dict)
+    # In open loop, the queries which arrived but didn't get a client before the duration was up.
+    num_dropped: int = 0
+
+    def get_num_completed(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    def get_throughput(self) -> float:
+        """
+        Returns the number of completed queries per second.
+        """
+        return self.get_num_completed() / self.duration if self.duration > 0 else 0
+
+    def get_latency_percentiles(
+        self, percentiles: list[float] = [50, 95, 99]
+    ) -> dict[str, dict[float, float]]:
+        """
+        Returns the latency percentiles (in microseconds) of each qid, e.g. {"Q1": {50: ..., 95: ...,
+        99: ...}}.
+        """
+        return {
+            qid: {
+                percentile: get_percentile(latencies, percentile)
+                for percentile in percentiles
+            }
+            for qid, latencies in self.latencies.items()
+        }
+
+
+@dataclass
+class TrialsTiming:
+    # In microseconds. This is the median or trimmed mean of the trials (see RepeatedTrials). If
+    #   the query timed out, this is the timeout.
+    runtime: float
+    did_time_out: bool
+    # In microseconds, excluding the warmup runs.
+    trials: list[float]
+    # In microseconds. This is the confidence interval of runtime. It's (-inf, inf) if there are
+    #   too few trials to compute it.
+    ci_low: float
+    ci_high: float
+    # Whether we stopped because the confidence interval was narrow enough (or because the query
+    #   timed out) rather than because we ran out of trials.
+    converged: bool
+
+    def get_relative_ci_width(self) -> float:
+        if self.ci_high == self.ci_low:
+            return 0
+        if self.runtime <= 0:
+            return math.inf
+        return (self.ci_high - self.ci_low) / self.runtime
+
+
+@dataclass
+class WorkloadTrialsTiming:
+    # In microseconds. This is the sum of the runtimes of all queries, each weighted by its weight
+    #   in the workload (see Workload.get_weights()).
+    total_runtime: float
+    num_timed_out: int
+    # Keyed by qid, in the order of the workload.
+    query_timings: dict[str, TrialsTiming] = field(default_factory=dict)
+
+    def get_num_trials(self) -> int:
+        return sum(len(timing.trials) for timing in self.query_timings.values())
+
+
+@dataclass
+class TraceTiming:
+    """
+    The aggregates of timing a TraceWorkload. Unlike WorkloadTiming, it doesn't keep the timing of
+    each query since a trace can have millions of them.
+    """
+
+    num_queries: int = 0
+    # In microseconds.
+    total_runtime: float = 0
+    max_runtime: float = 0
+    num_timed_out: int = 0
+
+    def add(self, query_timing: QueryTiming) -> None:
+        self.num_queries += 1
+        self.total_runtime += query_timing.runtime
+        self.max_runtime = max(self.max_runtime, query_timing.runtime)
+        if query_timing.did_time_out:
+            self.num_timed_out += 1
+
+    def get_mean_runtime(self) -> float:
+        return self.total_runtime / self.num_queries if self.num_queries > 0 else 0
@@ -0,0 +1,86 @@
+"""
+Workload keeps every query in memory, which is fine for benchmarks like JOB (113 queries) but not
+for production query logs with millions of entries. This file implements a workload which instead
+streams its queries from a trace file, which can be compressed. See
+PostgresConn.time_trace_workload() for how to time it.
+
+A trace has one JSON object per line of the form {"qid": ..., "query": ...}. The qid is optional
+and defaults to "L<line number>" (1-indexed) since query logs usually don't have IDs. The
+compression is detected from the suffix (see TRACE_OPENERS).
+"""
+
+import bz2
+import gzip
+import json
+import lzma
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator
+
+TRACE_OPENERS: dict[str, Callable[..., IO[Any]]] = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+# Interning makes the repeated texts of a trace share memory. Traces can also have millions of
+#   distinct texts though, so we stop interning new texts after this many.
+DEFAULT_MAX_INTERNED_QUERIES = 10000
+
+
+def open_trace(trace_path: Path, mode: str) -> IO[Any]:
+    """
+    Opens a trace in text mode (mode is "r" or "w"), compressing it based on its suffix.
+    """
+    assert mode in ["r", "w"], f'mode ({mode}) must be "r" or "w".'
+    opener = TRACE_OPENERS.get(trace_path.suffix, open)
+    f: IO[Any] = opener(trace_path, mode + "t")
+    return f
+
+
+def write_trace(trace_path: Path, queries: Iterable[tuple[str, str]]) -> None:
+    """
+    Writes the (qid, query) pairs in queries to a trace.
+    """
+    with open_trace(trace_path, "w") as f:
+        for qid, query in queries:
+            f.write(json.dumps({"qid": qid, "query": query}) + "\n")
+
+
+class TraceWorkload:
+    """
+    Iterating over a TraceWorkload yields its (qid, query) pairs in order. The trace is read again
+    on each iteration, so only the interned texts are kept in memory between iterations.
+    """
+
+    def __init__(
+        self,
+        trace_path: Path,
+        max_interned_queries: int = DEFAULT_MAX_INTERNED_QUERIES,
+    ) -> None:
+        # Unlike Workload, we don't save the trace to the run since copying a trace which may be
+        #   several GB would defeat the purpose.
+        assert trace_path.exists(), f"trace_path ({trace_path}) does not exist."
+        assert (
+            max_interned_queries >= 0
+        ), f"max_interned_queries ({max_interned_queries}) must be non-negative."
+        self.trace_path = trace_path
+        self.max_interned_queries = max_interned_queries
+        self._interned_queries: dict[str, str] = {}
+
+    def _intern(self, query: str) -> str:
+        interned_query = self._interned_queries.get(query)
+        if interned_query is not None:
+            return interned_query
+        if len(self._interned_queries) < self.max_interned_queries:
+            self._interned_queries[query] = query
+        return query
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        with open_trace(self.trace_path, "r") as f:
+            for line_num, line in enumerate(f, start=1):
+                if line.strip() == "":
+                    continue
+                entry = json.loads(line)
+                assert (
+                    "query" in entry
+                ), f'Line {line_num} of {self.trace_path} has no "query".'
+                yield entry.get("qid", f"L{line_num}"), self._intern(entry["query"])
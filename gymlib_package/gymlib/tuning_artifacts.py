@@ -1,8 +1,10 @@
 import json
 from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, NewType
+from typing import Any, NewType, Optional
 
+from gymlib.plan_store import PlanStore
+from gymlib.timing import WorkloadTiming
 from gymlib.workspace import DBGymWorkspace, is_fully_resolved
 
 # PostgresConn doesn't use these types because PostgresConn is used internally by tuning agents
@@ -76,6 +78,10 @@ def get_metadata_path(tuning_artifacts_path: Path) -> Path:
     return tuning_artifacts_path / "metadata.json"
 
 
+def get_plan_store_path(tuning_artifacts_path: Path) -> Path:
+    return tuning_artifacts_path / "plan_store.db"
+
+
 class TuningArtifactsWriter:
     def __init__(
         self, dbgym_workspace: DBGymWorkspace, metadata: TuningMetadata
@@ -88,6 +94,8 @@ class TuningArtifactsWriter:
         self.tuning_artifacts_path.mkdir(parents=False, exist_ok=False)
         assert is_fully_resolved(self.tuning_artifacts_path)
         self.next_step_num = 0
+        # This is only created once write_plans() is called since not all agents collect plans.
+        self._plan_store: Optional[PlanStore] = None
 
         # Write metadata file
         with get_metadata_path(self.tuning_artifacts_path).open("w") as f:
@@ -104,6 +112,20 @@ class TuningArtifactsWriter:
         ) as f:
             json.dump(asdict(dbms_cfg_delta), f)
 
+    def write_plans(self, timing: WorkloadTiming) -> None:
+        """
+        Saves the plans in timing (e.g. from time_workload_detailed(measurement_mode="explain")) as
+        the plans of the latest step written with write_step().
+        """
+        assert (
+            self.next_step_num > 0
+        ), "write_step() must be called before write_plans()."
+        if self._plan_store is None:
+            self._plan_store = PlanStore(
+                get_plan_store_path(self.tuning_artifacts_path)
+            )
+        self._plan_store.add_workload_timing(self.next_step_num - 1, timing)
+
 
 class TuningArtifactsReader:
     def __init__(self, tuning_artifacts_path: Path) -> None:
@@ -138,5 +160,13 @@ class TuningArtifactsReader:
                 qknobs=data["qknobs"],
             )
 
+    def get_plan_store(self) -> Optional[PlanStore]:
+        """
+        Returns the plans written with TuningArtifactsWriter.write_plans(), or None if there are
+        none.
+        """
+        plan_store_path = get_plan_store_path(self.tuning_artifacts_path)
+        return PlanStore(plan_store_path) if plan_store_path.exists() else None
+
     def get_all_deltas_in_order(self) -> list[DBMSConfigDelta]:
         return [self.get_delta_at_step(step_num) for step_num in range(self.num_steps)]
@@ -1,9 +1,85 @@
+import json
+import struct
 from pathlib import Path
+from typing import Optional
 
+from gymlib.workload_subset import WORKLOAD_WEIGHTS_FNAME
+from gymlib.workload_templates import (
+    WORKLOAD_TEMPLATES_FNAME,
+    WorkloadTemplates,
+    group_by_template,
+    parse_workload_templates,
+)
 from gymlib.workspace import DBGymWorkspace, is_fully_resolved
 
+# A workload bundle packs the order, the qids, and the query texts of a workload into a single file
+#   so that loading it doesn't have to open (and save) every query file. The file is:
+#    - WORKLOAD_BUNDLE_MAGIC.
+#    - The length in bytes of the index, as an unsigned 64-bit little-endian integer.
+#    - The index, which is JSON of the form {"order": [[qid, text_num], ...], "texts": [[offset,
+#      length], ...]}. The offsets and lengths are in bytes relative to the start of the texts.
+#    - The texts, encoded in UTF-8. Identical texts are only stored once.
+WORKLOAD_BUNDLE_FNAME = "workload.bundle"
+WORKLOAD_BUNDLE_MAGIC = b"dbgym-workload-bundle-v1\n"
+WORKLOAD_BUNDLE_INDEX_LENGTH_FORMAT = "<Q"
+
+
+def write_workload_bundle(bundle_path: Path, queries: list[tuple[str, str]]) -> None:
+    """
+    Writes the (qid, query) pairs in queries, in order, to a workload bundle.
+    """
+    text_nums: dict[str, int] = {}
+    texts: list[bytes] = []
+    text_offsets: list[tuple[int, int]] = []
+    order: list[tuple[str, int]] = []
+    offset = 0
+    for qid, query in queries:
+        if query not in text_nums:
+            text = query.encode()
+            text_nums[query] = len(texts)
+            texts.append(text)
+            text_offsets.append((offset, len(text)))
+            offset += len(text)
+        order.append((qid, text_nums[query]))
+
+    index = json.dumps({"order": order, "texts": text_offsets}).encode()
+    with open(bundle_path, "wb") as f:
+        f.write(WORKLOAD_BUNDLE_MAGIC)
+        f.write(struct.pack(WORKLOAD_BUNDLE_INDEX_LENGTH_FORMAT, len(index)))
+        f.write(index)
+        f.write(b"".join(texts))
+
+
+def parse_workload_bundle(data: bytes) -> list[tuple[str, str]]:
+    """
+    The inverse of write_workload_bundle(), where data is the contents of the bundle. Identical
+    queries are the same str object.
+    """
+    assert data.startswith(
+        WORKLOAD_BUNDLE_MAGIC
+    ), "data is not a workload bundle (or is from an incompatible version)."
+    index_start = len(WORKLOAD_BUNDLE_MAGIC) + struct.calcsize(
+        WORKLOAD_BUNDLE_INDEX_LENGTH_FORMAT
+    )
+    (index_length,) = struct.unpack_from(
+        WORKLOAD_BUNDLE_INDEX_LENGTH_FORMAT, data, len(WORKLOAD_BUNDLE_MAGIC)
+    )
+    texts_start = index_start + index_length
+    index = json.loads(data[index_start:texts_start])
+    texts = [
+        data[texts_start + offset : texts_start + offset + length].decode()
+        for offset, length in index["texts"]
+    ]
+    return [(qid, texts[text_num]) for qid, text_num in index["order"]]
+
 
 class Workload:
+    """
+    A workload is a directory with an order.txt, where each line is "qid,path to the query", or
+    with a workload bundle (see WORKLOAD_BUNDLE_FNAME). If it has both, the bundle is used since
+    it's much faster to load.
+    """
+
     def __init__(self, dbgym_workspace: DBGymWorkspace, workload_path: Path) -> None:
         self.dbgym_workspace = dbgym_workspace
         self.workload_path = workload_path
@@ -11,7 +87,18 @@ class Workload:
 
         self.queries: dict[str, str] = {}
         order_path = self.workload_path / "order.txt"
+        bundle_path = self.workload_path / WORKLOAD_BUNDLE_FNAME
         self.query_order: list[str] = []
+        self._templates: Optional[WorkloadTemplates] = None
+        self._weights: Optional[dict[str, float]] = None
+
+        if bundle_path.exists():
+            with self.dbgym_workspace.open_and_save(bundle_path, "rb") as f:
+                queries = parse_workload_bundle(f.read())
+            for qid, query in queries:
+                self.queries[qid] = query
+                self.query_order.append(qid)
+            return
 
         assert order_path.exists()
 
@@ -33,3 +120,35 @@ class Workload:
 
     def get_queries_in_order(self) -> list[str]:
         return [self.queries[qid] for qid in self.query_order]
+
+    def get_weights(self) -> dict[str, float]:
+        """
+        Returns the weight of each qid. The runtime of the workload it stands for is the weighted
+        sum of the runtimes of its queries. Only subset workloads (see gymlib.workload_subset) have
+        weights, so every qid has a weight of 1 otherwise.
+        """
+        if self._weights is None:
+            weights_path = self.workload_path / WORKLOAD_WEIGHTS_FNAME
+            if weights_path.exists():
+                with self.dbgym_workspace.open_and_save(weights_path) as f:
+                    self._weights = json.load(f)
+            else:
+                self._weights = {qid: 1.0 for qid in self.query_order}
+        return self._weights
+
+    def get_templates(self) -> WorkloadTemplates:
+        """
+        Returns the qids of the workload grouped by template (see gymlib.workload_templates). They
+        are read from the workload directory if it has them and computed otherwise. Computed
+        templates are assumed to be safe since no benchmark marked them as unsafe.
+        """
+        if self._templates is None:
+            templates_path = self.workload_path / WORKLOAD_TEMPLATES_FNAME
+            if templates_path.exists():
+                with self.dbgym_workspace.open_and_save(templates_path) as f:
+                    self._templates = parse_workload_templates(f.read())
+            else:
+                self._templates = group_by_template(
+                    [(qid, self.queries[qid]) for qid in self.query_order]
+                )
+        return self._templates
@@ -0,0 +1,152 @@
+"""
+Evaluating a configuration on a full workload is expensive, so agents may want to train on a small
+proxy workload instead. This file picks k representative queries of a workload and a weight for
+each so that the weighted runtime of the representatives tracks the runtime of the full workload.
+
+Each query is described by its baseline runtime and by its plan (the number of nodes of each type,
+from time_query(add_explain=True)). Queries with similar runtimes and plans likely react similarly
+to configuration changes, so we cluster the queries with k-medoids and use each medoid as the
+representative of its cluster. The weight of a medoid is the baseline runtime of its cluster
+divided by its own baseline runtime, so the weighted runtime matches the full workload exactly at
+the baseline. How well it tracks other configurations has to be measured (see
+orchestrate.workload_subset).
+
+See Workload.get_weights() for how a subset workload stores its weights. PostgresConn.time_workload(),
+PostgresConnPool.time_workload(), and RepeatedTrials.time_workload() all apply them, so timing a
+subset workload gives the weighted estimate whose error is measured.
+"""
+
+import math
+import statistics
+from typing import Any
+
+WORKLOAD_WEIGHTS_FNAME = "weights.json"
+MAX_KMEDOIDS_ITERATIONS = 100
+
+
+def get_plan_features(plan: dict[str, Any]) -> dict[str, float]:
+    """
+    Returns the number of nodes of each type in a plan node (as in the "Plan" key of EXPLAIN
+    (FORMAT JSON)) and its descendants.
+    """
+    features: dict[str, float] = {plan["Node Type"]: 1}
+    for child in plan.get("Plans", []):
+        for node_type, count in get_plan_features(child).items():
+            features[node_type] = features.get(node_type, 0) + count
+    return features
+
+
+def get_feature_vectors(
+    baseline_runtimes: dict[str, float], plan_features: dict[str, dict[str, float]]
+) -> dict[str, list[float]]:
+    """
+    Returns the feature vector of each qid, which is the log of its baseline runtime followed by
+    its plan features. Each dimension is standardized so that no dimension dominates the distances.
+    """
+    feature_names = sorted(
+        {name for features in plan_features.values() for name in features}
+    )
+    vectors = {
+        qid: [math.log1p(runtime)]
+        + [plan_features.get(qid, {}).get(name, 0) for name in feature_names]
+        for qid, runtime in baseline_runtimes.items()
+    }
+    num_dims = 1 + len(feature_names)
+    for dim in range(num_dims):
+        values = [vector[dim] for vector in vectors.values()]
+        mean = statistics.mean(values)
+        stdev = statistics.pstdev(values)
+        for vector in vectors.values():
+            vector[dim] = (vector[dim] - mean) / stdev if stdev > 0 else 0
+    return vectors
+
+
+def select_subset(
+    baseline_runtimes: dict[str, float],
+    plan_features: dict[str, dict[str, float]],
+    k: int,
+) -> dict[str, float]:
+    """
+    Returns the weight of each of the k representative qids, in the order of baseline_runtimes.
+    """
+    assert (
+        1 <= k <= len(baseline_runtimes)
+    ), f"k ({k}) must be between 1 and the number of queries ({len(baseline_runtimes)})."
+    vectors = get_feature_vectors(baseline_runtimes, plan_features)
+    qids = list(baseline_runtimes)
+
+    # We start from the slowest query since it contributes the most to the total runtime and add
+    #   the query farthest from the medoids so far until we have k of them.
+    medoids = [max(qids, key=lambda qid: baseline_runtimes[qid])]
+    while len(medoids) < k:
+        medoids.append(
+            max(
+                (qid for qid in qids if qid not in medoids),
+                key=lambda qid: min(
+                    math.dist(vectors[qid], vectors[medoid]) for medoid in medoids
+                ),
+            )
+        )
+
+    for _ in range(MAX_KMEDOIDS_ITERATIONS):
+        clusters = _assign_clusters(qids, medoids, vectors)
+        new_medoids = [
+            min(
+                cluster,
+                key=lambda candidate: sum(
+                    math.dist(vectors[candidate], vectors[qid]) for qid in cluster
+                ),
+            )
+            for cluster in clusters.values()
+        ]
+        if set(new_medoids) == set(medoids):
+            break
+        medoids = new_medoids
+
+    weights = {}
+    for medoid, cluster in _assign_clusters(qids, medoids, vectors).items():
+        cluster_runtime = sum(baseline_runtimes[qid] for qid in cluster)
+        # A medoid with a runtime of 0 can't be scaled up to its cluster, so we count each query of
+        #   the cluster once instead.
+        weights[medoid] = (
+            cluster_runtime / baseline_runtimes[medoid]
+            if baseline_runtimes[medoid] > 0
+            else len(cluster)
+        )
+    return {qid: weights[qid] for qid in qids if qid in weights}
+
+
+def _assign_clusters(
+    qids: list[str], medoids: list[str], vectors: dict[str, list[float]]
+) -> dict[str, list[str]]:
+    """
+    Returns the qids closest to each medoid. Each medoid is in its own cluster.
+    """
+    clusters: dict[str, list[str]] = {medoid: [] for medoid in medoids}
+    for qid in qids:
+        closest_medoid = (
+            qid
+            if qid in clusters
+            else min(
+                medoids,
+                key=lambda medoid: math.dist(vectors[qid], vectors[medoid]),
+            )
+        )
+        clusters[closest_medoid].append(qid)
+    return clusters
+
+
+def get_weighted_runtime(
+    weights: dict[str, float], runtimes: dict[str, float]
+) -> float:
+    return sum(weight * runtimes[qid] for qid, weight in weights.items())
+
+
+def get_subset_error(weights: dict[str, float], runtimes: dict[str, float]) -> float:
+    """
+    Returns the relative error of the weighted runtime of the subset compared to the total runtime
+    of all queries in runtimes.
+    """
+    total_runtime = sum(runtimes.values())
+    assert total_runtime > 0, "The total runtime must be positive."
+    return abs(get_weighted_runtime(weights, runtimes) - total_runtime) / total_runtime
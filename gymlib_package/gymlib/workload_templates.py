@@ -0,0 +1,83 @@
+"""
+Workloads with many seeds (e.g. TPC-H with --seed-start and --seed-end) are mostly the same
+templates with different constants. This file groups the queries of a workload by template using
+pglast's fingerprints, which ignore constants (as well as comments, whitespace, and the length of
+IN lists). Since queries of the same template usually have similar runtimes, timing one
+representative of each template and weighting it by the size of its template (see
+PostgresConn.time_workload_by_template()) estimates the runtime of the whole workload at a fraction
+of the cost. This is only valid if the constants don't change the runtime much, which isn't the case
+for JOB (see WorkloadTemplates.is_template_safe).
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import pglast
+
+WORKLOAD_TEMPLATES_FNAME = "templates.json"
+
+
+def get_query_fingerprint(query: str) -> str:
+    """
+    Returns the fingerprint of query's template. Queries which pglast can't parse are their own
+    template.
+    """
+    try:
+        return str(pglast.fingerprint(query))
+    except pglast.parser.ParseError as e:
+        logging.warning(f"Using the hash of the text as the fingerprint since {e}")
+        return hashlib.sha256(query.encode()).hexdigest()
+
+
+@dataclass
+class WorkloadTemplates:
+    # The qids of each template, keyed by fingerprint. Both the templates and their qids are in the
+    #   order of the workload.
+    template_qids: dict[str, list[str]]
+    # Whether timing one qid per template is a valid estimate of the workload. The benchmark decides
+    #   this when it generates the workload. It's False for JOB, where 1a to 1d share a template but
+    #   their runtimes differ by orders of magnitude.
+    is_template_safe: bool = True
+
+    def get_representative_qids(self) -> list[str]:
+        """
+        Returns the first qid of each template.
+        """
+        return [qids[0] for qids in self.template_qids.values()]
+
+    def get_weights(self) -> dict[str, int]:
+        """
+        Returns the number of qids in the template of each representative qid.
+        """
+        return {qids[0]: len(qids) for qids in self.template_qids.values()}
+
+
+def group_by_template(
+    queries: list[tuple[str, str]], is_template_safe: bool = True
+) -> WorkloadTemplates:
+    """
+    Groups the (qid, query) pairs in queries by the fingerprint of the query.
+    """
+    template_qids: dict[str, list[str]] = {}
+    for qid, query in queries:
+        template_qids.setdefault(get_query_fingerprint(query), []).append(qid)
+    return WorkloadTemplates(template_qids, is_template_safe)
+
+
+def write_workload_templates(
+    templates_path: Path, templates: WorkloadTemplates
+) -> None:
+    with open(templates_path, "w") as f:
+        json.dump(asdict(templates), f)
+
+
+def parse_workload_templates(data: str) -> WorkloadTemplates:
+    templates = json.loads(data)
+    # Files written before is_template_safe existed don't say whether they're safe (JOB's aren't),
+    #   so we don't trust them. Regenerating the workload fixes this.
+    return WorkloadTemplates(
+        templates["template_qids"], templates.get("is_template_safe", False)
+    )
@@ -19,6 +19,7 @@ TMP_DNAME = "tmp"
 RUNS_DNAME = "task_runs"
 DBGYM_APP_NAME = "dbgym"
 LATEST_RUN_FNAME = "latest_run"
+RUNTIME_CACHE_FNAME = "runtime_cache.db"
 
 
 def is_linkname(name: str) -> bool:
@@ -48,6 +49,10 @@ def get_runs_path_from_workspace_path(workspace_path: Path) -> Path:
     return workspace_path / RUNS_DNAME
 
 
+def get_runtime_cache_path_from_workspace_path(workspace_path: Path) -> Path:
+    return workspace_path / RUNTIME_CACHE_FNAME
+
+
 def get_latest_run_path_from_workspace_path(workspace_path: Path) -> Path:
     return get_runs_path_from_workspace_path(workspace_path) / name_to_linkname(
         LATEST_RUN_FNAME
@@ -1,7 +1,21 @@
+from pathlib import Path
+from typing import Optional
+
 import click
-from gymlib.workspace import DBGymWorkspace
+from gymlib.infra_paths import DEFAULT_SCALE_FACTOR
+from gymlib.workspace import DBGymWorkspace, fully_resolve_path
 
 from orchestrate.clean import clean_workspace, count_files_in_workspace
+from orchestrate.replay import replay_detailed
+from orchestrate.timing_overhead_benchmark import (
+    DEFAULT_NUM_BENCHMARK_QUERIES,
+    timing_overhead_benchmark,
+)
+from orchestrate.workload_subset import (
+    DEFAULT_SUBSET_QUERY_TIMEOUT,
+    get_subset_workload_suffix,
+    select_workload_subset,
+)
 
 
 @click.group(name="manage")
@@ -30,5 +44,108 @@ def manage_count(dbgym_workspace: DBGymWorkspace) -> None:
     )
 
 
+@click.command(
+    "timing-overhead-benchmark",
+    help="Measure the client-side overhead per query of PostgresConn.time_query() with a statement timeout.",
+)
+@click.pass_obj
+@click.argument("benchmark_name", type=str)
+@click.option("--scale-factor", type=float, default=DEFAULT_SCALE_FACTOR)
+@click.option(
+    "--num-queries",
+    type=int,
+    default=DEFAULT_NUM_BENCHMARK_QUERIES,
+    help="The number of queries to time for each way of setting the timeout.",
+)
+def manage_timing_overhead_benchmark(
+    dbgym_workspace: DBGymWorkspace,
+    benchmark_name: str,
+    scale_factor: float,
+    num_queries: int,
+) -> None:
+    results = timing_overhead_benchmark(
+        dbgym_workspace, benchmark_name, scale_factor, num_queries
+    )
+    print(
+        f"Unpipelined: {results['unpipelined_us_per_query']:.1f}us/query. Pipelined: {results['pipelined_us_per_query']:.1f}us/query."
+    )
+
+
+@click.command(
+    "replay",
+    help="Re-measure the workload at each step of a tuning run, logging the result of each step as it goes.",
+)
+@click.pass_obj
+@click.argument("tuning_artifacts_path", type=Path)
+@click.option(
+    "--num-instances",
+    type=int,
+    default=1,
+    help="The number of Postgres instances to replay the steps with in parallel.",
+)
+@click.option(
+    "--resume",
+    "resume_log_path",
+    type=Path,
+    default=None,
+    help="The replay log of an interrupted replay. Only the steps which aren't in it are replayed.",
+)
+def manage_replay(
+    dbgym_workspace: DBGymWorkspace,
+    tuning_artifacts_path: Path,
+    num_instances: int,
+    resume_log_path: Optional[Path],
+) -> None:
+    result = replay_detailed(
+        dbgym_workspace,
+        fully_resolve_path(tuning_artifacts_path),
+        num_instances,
+        None if resume_log_path is None else fully_resolve_path(resume_log_path),
+    )
+    for step, (total_runtime, num_timed_out) in enumerate(result.step_timings):
+        print(f"Step {step}: {total_runtime / 1e6:.3f}s, {num_timed_out} timed out")
+    print(f"The replay log is at {result.log_path}")
+
+
+@click.command(
+    "workload-subset",
+    help="Pick a weighted subset of a workload's queries whose runtime tracks the full workload's and write it as a new workload.",
+)
+@click.pass_obj
+@click.argument("benchmark_name", type=str)
+@click.argument("workload_suffix", type=str)
+@click.argument("k", type=int)
+@click.option("--scale-factor", type=float, default=DEFAULT_SCALE_FACTOR)
+@click.option(
+    "--query-timeout",
+    type=float,
+    default=DEFAULT_SUBSET_QUERY_TIMEOUT,
+    help="The timeout (in seconds) of each query while measuring the workload.",
+)
+def manage_workload_subset(
+    dbgym_workspace: DBGymWorkspace,
+    benchmark_name: str,
+    workload_suffix: str,
+    k: int,
+    scale_factor: float,
+    query_timeout: float,
+) -> None:
+    report = select_workload_subset(
+        dbgym_workspace,
+        benchmark_name,
+        scale_factor,
+        workload_suffix,
+        k,
+        query_timeout,
+    )
+    print(
+        f"Wrote the workload with suffix {get_subset_workload_suffix(workload_suffix, k)}. "
+        + f"Mean error: {report.get_mean_error():.1%}. Max error: {report.get_max_error():.1%}."
+    )
+
+
 manage_group.add_command(manage_clean)
 manage_group.add_command(manage_count)
+manage_group.add_command(manage_timing_overhead_benchmark)
+manage_group.add_command(manage_replay)
+manage_group.add_command(manage_workload_subset)
@@ -1,53 +1,437 @@
+import json
+import logging
+import os
+import statistics
+import threading
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Any, Optional
 
-from gymlib.pg import DEFAULT_POSTGRES_PORT
-from gymlib.pg_conn import PostgresConn
-from gymlib.tuning_artifacts import TuningArtifactsReader
+from gymlib.pg import DEFAULT_POSTGRES_PORT, get_created_index_name
+from gymlib.pg_conn import (
+    SYSKNOBS_APPLIED_NOOP,
+    SYSKNOBS_APPLIED_RELOAD,
+    SYSKNOBS_APPLIED_RESTART,
+    PostgresConn,
+)
+from gymlib.pg_conn_pool import check_shared_buffers_fit_in_memory
+from gymlib.tuning_artifacts import DBMSConfigDelta, TuningArtifactsReader
 from gymlib.workload import Workload
-from gymlib.workspace import DBGymWorkspace
+from gymlib.workspace import DBGymWorkspace, fully_resolve_path
+
+
+@dataclass
+class ReplayStats:
+    # The number of times the system knobs were applied in each way (see
+    #   PostgresConn.apply_sysknobs()). Each instance restarts once to start Postgres.
+    num_restarts: int = 0
+    num_reloads: int = 0
+    num_noops: int = 0
+    # The number of index statements which were skipped because their index already existed.
+    num_skipped_indexes: int = 0
+    # In seconds. This includes the restart which starts Postgres before the first step.
+    restart_times: list[float] = field(default_factory=list)
+    reload_times: list[float] = field(default_factory=list)
+
+    def get_time_saved(self) -> float:
+        """
+        Returns an estimate (in seconds) of the time saved compared to restarting Postgres in every
+        step, assuming every restart would've taken the average time of the restarts we did.
+
+        It doesn't include the time saved by skipping indexes since we don't know how long they
+        would've taken to build.
+        """
+        if len(self.restart_times) == 0:
+            return 0
+        mean_restart_time = statistics.mean(self.restart_times)
+        return (self.num_noops + self.num_reloads) * mean_restart_time - sum(
+            self.reload_times
+        )
+
+    def add(self, other: "ReplayStats") -> None:
+        self.num_restarts += other.num_restarts
+        self.num_reloads += other.num_reloads
+        self.num_noops += other.num_noops
+        self.num_skipped_indexes += other.num_skipped_indexes
+        self.restart_times.extend(other.restart_times)
+        self.reload_times.extend(other.reload_times)
+
+
+@dataclass
+class ReplayResult:
+    # The total runtime and the number of timed out queries of each step, starting with the
+    #   initial configuration.
+    step_timings: list[tuple[float, int]]
+    stats: ReplayStats
+    # The ReplayLog of this replay, which can be passed to replay(resume_log_path=...).
+    log_path: Path
+
+
+@dataclass
+class ReplayStepResult:
+    step: int
+    # In microseconds.
+    total_runtime: float
+    num_timed_out: int
+    # Keyed by qid, in the order of the workload.
+    query_runtimes: dict[str, float]
+
+
+@dataclass
+class ReplayLogHeader:
+    # What the replay was of. Both are fully resolved.
+    tuning_artifacts_path: str
+    workload_path: str
+
+
+# Each replay in a run gets its own log. The first one is REPLAY_LOG_FNAME and later ones are
+#   numbered (see get_replay_log_path()).
+REPLAY_LOG_FNAME = "replay_log.jsonl"
+REPLAY_LOG_HEADER_KEY = "header"
+
+
+def get_replay_log_path(run_path: Path) -> Path:
+    """
+    Returns the path of a new replay log in run_path.
+    """
+    log_path = run_path / REPLAY_LOG_FNAME
+    i = 1
+    while log_path.exists():
+        log_path = run_path / f"{Path(REPLAY_LOG_FNAME).stem}_{i}.jsonl"
+        i += 1
+    return log_path
+
+
+class ReplayLog:
+    """
+    The results of a replay, with one line of JSON per step after a ReplayLogHeader line. Each step
+    is appended (and fsync'd) as soon as it's measured, so a replay which crashes (e.g. because
+    Postgres fails to start) only loses the step it was on. The steps may be out of order if the
+    replay is parallel.
+    """
+
+    def __init__(self, log_path: Path) -> None:
+        self.log_path = log_path
+        # The instances of a parallel replay append from different threads.
+        self._lock = threading.Lock()
+
+    def write_header(self, header: ReplayLogHeader) -> None:
+        assert not self.log_path.exists(), f"{self.log_path} already exists."
+        self._append_line({REPLAY_LOG_HEADER_KEY: asdict(header)})
+
+    def append(self, step_result: ReplayStepResult) -> None:
+        self._append_line(asdict(step_result))
+
+    def _append_line(self, data: dict[str, Any]) -> None:
+        with self._lock, open(self.log_path, "a") as f:
+            f.write(json.dumps(data) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_lines(self) -> list[dict[str, Any]]:
+        """
+        If the replay crashed in the middle of appending a step, the last line is incomplete. We
+        ignore it since that step has to be measured again anyway.
+        """
+        if not self.log_path.exists():
+            return []
+        with open(self.log_path, "r") as f:
+            lines = f.read().splitlines()
+        data = []
+        for i, line in enumerate(lines):
+            try:
+                data.append(json.loads(line))
+            except json.JSONDecodeError:
+                assert (
+                    i == len(lines) - 1
+                ), f"Line {i + 1} of {self.log_path} is corrupt. Only the last line may be incomplete."
+                logging.warning(f"Ignoring the incomplete last line of {self.log_path}")
+        return data
+
+    def read_header(self) -> Optional[ReplayLogHeader]:
+        lines = self._read_lines()
+        if len(lines) == 0 or REPLAY_LOG_HEADER_KEY not in lines[0]:
+            return None
+        return ReplayLogHeader(**lines[0][REPLAY_LOG_HEADER_KEY])
+
+    def read(self) -> dict[int, ReplayStepResult]:
+        """
+        Returns the result of each step in the log, keyed by step.
+        """
+        return {
+            step_result.step: step_result
+            for step_result in (
+                ReplayStepResult(**line)
+                for line in self._read_lines()
+                if REPLAY_LOG_HEADER_KEY not in line
+            )
+        }
+
+
+def get_index_sqls_to_run(
+    index_sqls: list[str], existing_index_names: set[str]
+) -> list[str]:
+    """
+    Returns the statements in index_sqls which have to be run, skipping the CREATE INDEX statements
+    whose index name already exists. Those would fail anyway, so skipping them doesn't change the
+    result.
+
+    Once there's a statement other than CREATE INDEX (e.g. DROP INDEX), we stop skipping since we
+    don't track how it changes which indexes exist.
+    """
+    index_names = set(existing_index_names)
+    sqls_to_run = []
+    for i, sql in enumerate(index_sqls):
+        index_name = get_created_index_name(sql)
+        if index_name is None:
+            sqls_to_run.extend(index_sqls[i:])
+            break
+        if index_name in index_names:
+            logging.debug(f"Skipping {sql} since {index_name} already exists")
+            continue
+        index_names.add(index_name)
+        sqls_to_run.append(sql)
+    return sqls_to_run
+
+
+def get_step_slices(num_steps: int, num_slices: int) -> list[range]:
+    """
+    Splits the steps into num_slices contiguous slices whose sizes differ by at most one.
+    """
+    assert num_slices >= 1, f"num_slices ({num_slices}) must be at least 1."
+    num_slices = min(num_slices, num_steps)
+    slices = []
+    start = 0
+    for i in range(num_slices):
+        size = num_steps // num_slices + (1 if i < num_steps % num_slices else 0)
+        slices.append(range(start, start + size))
+        start += size
+    return slices
 
 
 def replay(
-    dbgym_workspace: DBGymWorkspace, tuning_artifacts_path: Path
+    dbgym_workspace: DBGymWorkspace,
+    tuning_artifacts_path: Path,
+    num_instances: int = 1,
+    resume_log_path: Optional[Path] = None,
 ) -> list[tuple[float, int]]:
     """
     Returns the total runtime and the number of timed out queries for each step.
 
     The first step will use no configuration changes.
+
+    With num_instances > 1, the steps are replayed in parallel. With resume_log_path, only the
+    steps which aren't in that log are replayed (see replay_detailed()).
+    """
+    return replay_detailed(
+        dbgym_workspace, tuning_artifacts_path, num_instances, resume_log_path
+    ).step_timings
+
+
+def replay_detailed(
+    dbgym_workspace: DBGymWorkspace,
+    tuning_artifacts_path: Path,
+    num_instances: int = 1,
+    resume_log_path: Optional[Path] = None,
+) -> ReplayResult:
     """
-    replay_data: list[tuple[float, int]] = []
+    The same as replay() but also returns stats about how the configuration was applied.
 
+    Since each delta is a change from the prior configuration, we track the cumulative system
+    knobs and only change what's different. If no knob changed, Postgres isn't touched at all and
+    if all the changed knobs can be reloaded, it's reloaded instead of restarted. Index statements
+    whose index already exists are skipped.
+
+    The configuration at each step only depends on the deltas before it, so the steps can be
+    replayed in parallel. With num_instances > 1, the steps are split into contiguous slices, each
+    of which is replayed by its own Postgres instance (on ports DEFAULT_POSTGRES_PORT,
+    DEFAULT_POSTGRES_PORT + 1, ...). Each instance starts from the pristine snapshot and
+    fast-forwards to the configuration of the first step of its slice. Keep in mind that the
+    instances compete for the machine's resources, so the runtimes may be higher than those of a
+    sequential replay.
+
+    The result of each step is appended to a new ReplayLog in the run directory as soon as it's
+    measured. If a replay crashes, pass its log as resume_log_path to replay only the steps it
+    didn't finish. The log must be of the same tuning artifacts and workload. Their configuration is rebuilt by fast-forwarding like above. The steps which
+    were already finished are copied into the new log so that it's complete.
+    """
     reader = TuningArtifactsReader(tuning_artifacts_path)
-    pg_conn = PostgresConn(
-        dbgym_workspace,
-        DEFAULT_POSTGRES_PORT,
-        reader.get_metadata().pristine_dbdata_snapshot_path,
-        reader.get_metadata().dbdata_parent_path,
-        reader.get_metadata().pgbin_path,
-        None,
+    metadata = reader.get_metadata()
+    deltas = reader.get_all_deltas_in_order()
+    workload = Workload(dbgym_workspace, metadata.workload_path)
+    # There's one more step than there are deltas since the first step uses the initial
+    #   configuration.
+    num_steps = len(deltas) + 1
+
+    header = ReplayLogHeader(
+        str(fully_resolve_path(tuning_artifacts_path)), str(workload.workload_path)
+    )
+    step_results: dict[int, ReplayStepResult] = {}
+    if resume_log_path is not None:
+        resume_log = ReplayLog(resume_log_path)
+        resume_header = resume_log.read_header()
+        assert (
+            resume_header == header
+        ), f"{resume_log_path} is a replay of {resume_header}, not of {header}."
+        step_results = resume_log.read()
+        assert all(
+            0 <= step < num_steps for step in step_results
+        ), f"{resume_log_path} has steps which aren't in {tuning_artifacts_path}."
+
+    replay_log = ReplayLog(get_replay_log_path(dbgym_workspace.dbgym_this_run_path))
+    replay_log.write_header(header)
+    if resume_log_path is not None:
+        for step in sorted(step_results):
+            replay_log.append(step_results[step])
+        logging.info(
+            f"Resuming replay with {len(step_results)} of {num_steps} steps already finished"
+        )
+
+    remaining_steps = [step for step in range(num_steps) if step not in step_results]
+    step_slices = [
+        remaining_steps[step_slice.start : step_slice.stop]
+        for step_slice in get_step_slices(len(remaining_steps), num_instances)
+    ]
+    if len(step_slices) > 1:
+        sysknobs: dict[str, str] = {}
+        for delta in deltas:
+            sysknobs.update(delta.sysknobs)
+            check_shared_buffers_fit_in_memory(sysknobs, len(step_slices))
+
+    def replay_slice(i: int) -> tuple[list[ReplayStepResult], ReplayStats]:
+        pg_conn = PostgresConn(
+            dbgym_workspace,
+            DEFAULT_POSTGRES_PORT + i,
+            metadata.pristine_dbdata_snapshot_path,
+            metadata.dbdata_parent_path,
+            metadata.pgbin_path,
+            None,
+        )
+        return _replay_steps(pg_conn, workload, deltas, step_slices[i], replay_log)
+
+    stats = ReplayStats()
+    if len(step_slices) > 0:
+        with ThreadPoolExecutor(max_workers=len(step_slices)) as executor:
+            slice_results = list(executor.map(replay_slice, range(len(step_slices))))
+        for slice_step_results, slice_stats in slice_results:
+            for step_result in slice_step_results:
+                step_results[step_result.step] = step_result
+            stats.add(slice_stats)
+
+    result = ReplayResult(
+        [
+            (step_results[step].total_runtime, step_results[step].num_timed_out)
+            for step in range(num_steps)
+        ],
+        stats,
+        replay_log.log_path,
     )
-    workload = Workload(
-        dbgym_workspace,
-        reader.get_metadata().workload_path,
+    logging.info(
+        f"Replay did {result.stats.num_restarts} restarts, {result.stats.num_reloads} reloads, and {result.stats.num_noops} no-ops, "
+        + f"and skipped {result.stats.num_skipped_indexes} indexes, saving about {result.stats.get_time_saved():.1f}s"
     )
+    return result
 
-    pg_conn.restore_pristine_snapshot()
-    pg_conn.restart_postgres()
+
+def _replay_steps(
+    pg_conn: PostgresConn,
+    workload: Workload,
+    deltas: list[DBMSConfigDelta],
+    steps: list[int],
+    replay_log: ReplayLog,
+) -> tuple[list[ReplayStepResult], ReplayStats]:
+    """
+    Replays steps (in increasing order), where step i is the configuration after applying
+    deltas[:i]. The steps in between those in steps (e.g. the ones a resumed replay already
+    finished) are applied but not measured.
+    """
+    step_results = []
+    stats = ReplayStats()
+    sysknobs: dict[str, str] = {}
     qknobs: defaultdict[str, list[str]] = defaultdict(list)
-    replay_data.append(pg_conn.time_workload(workload, qknobs))
 
-    for delta in reader.get_all_deltas_in_order():
-        pg_conn.restart_with_changes(delta.sysknobs)
+    # We fast-forward to the configuration of the first step with a single restart.
+    for delta in deltas[: steps[0]]:
+        sysknobs.update(delta.sysknobs)
+    pg_conn.restore_pristine_snapshot()
+    _apply_sysknobs(pg_conn, sysknobs, stats)
+    for delta in deltas[: steps[0]]:
+        _apply_indexes(pg_conn, delta.indexes, stats)
+        _add_qknobs(qknobs, delta.qknobs)
+    step_results.append(_measure_step(pg_conn, workload, qknobs, steps[0], replay_log))
+
+    steps_set = set(steps)
+    for step in range(steps[0] + 1, steps[-1] + 1):
+        delta = deltas[step - 1]
+        sysknobs.update(delta.sysknobs)
+        _apply_sysknobs(pg_conn, sysknobs, stats)
+        _apply_indexes(pg_conn, delta.indexes, stats)
+        _add_qknobs(qknobs, delta.qknobs)
+        if step in steps_set:
+            step_results.append(
+                _measure_step(pg_conn, workload, qknobs, step, replay_log)
+            )
+
+    pg_conn.shutdown_postgres()
+    return step_results, stats
 
-        for index in delta.indexes:
-            pg_conn.psql(index)
 
-        for query, knobs in delta.qknobs.items():
-            # TODO: account for deleting a knob if we are representing knobs as deltas.
-            qknobs[query].extend(knobs)
+def _measure_step(
+    pg_conn: PostgresConn,
+    workload: Workload,
+    qknobs: dict[str, list[str]],
+    step: int,
+    replay_log: ReplayLog,
+) -> ReplayStepResult:
+    timing = pg_conn.time_workload_detailed(workload, qknobs)
+    step_result = ReplayStepResult(
+        step,
+        timing.total_runtime,
+        timing.num_timed_out,
+        {
+            qid: query_timing.runtime
+            for qid, query_timing in timing.query_timings.items()
+        },
+    )
+    replay_log.append(step_result)
+    return step_result
 
-        replay_data.append(pg_conn.time_workload(workload, qknobs))
 
-    pg_conn.shutdown_postgres()
-    return replay_data
+def _apply_sysknobs(
+    pg_conn: PostgresConn, sysknobs: dict[str, str], stats: ReplayStats
+) -> None:
+    start_time = time.time()
+    applied = pg_conn.apply_sysknobs(sysknobs)
+    if applied == SYSKNOBS_APPLIED_RESTART:
+        stats.num_restarts += 1
+        stats.restart_times.append(time.time() - start_time)
+    elif applied == SYSKNOBS_APPLIED_RELOAD:
+        stats.num_reloads += 1
+        stats.reload_times.append(time.time() - start_time)
+    else:
+        assert applied == SYSKNOBS_APPLIED_NOOP
+        stats.num_noops += 1
+
+
+def _apply_indexes(
+    pg_conn: PostgresConn, index_sqls: list[str], stats: ReplayStats
+) -> None:
+    existing_index_names = {
+        index_name
+        for index_name in map(get_created_index_name, pg_conn.get_index_defs())
+        if index_name is not None
+    }
+    index_sqls_to_run = get_index_sqls_to_run(index_sqls, existing_index_names)
+    stats.num_skipped_indexes += len(index_sqls) - len(index_sqls_to_run)
+    pg_conn.apply_indexes(index_sqls_to_run)
+
+
+def _add_qknobs(
+    qknobs: defaultdict[str, list[str]], qknobs_delta: dict[str, list[str]]
+) -> None:
+    for query, knobs in qknobs_delta.items():
+        # TODO: account for deleting a knob if we are representing knobs as deltas.
+        qknobs[query].extend(knobs)
@@ -11,7 +11,7 @@ from gymlib.tuning_artifacts import (
 from gymlib.workspace import DBGymWorkspace
 
 from benchmark.tpch.constants import DEFAULT_TPCH_SEED
-from orchestrate.replay import replay
+from orchestrate.replay import ReplayLog, ReplayLogHeader, replay, replay_detailed
 
 
 class ReplayTests(unittest.TestCase):
@@ -20,7 +20,9 @@ class ReplayTests(unittest.TestCase):
     @staticmethod
     def setUpClass() -> None:
         GymlibIntegtestManager.set_up_workspace()
-        # Reset _num_times_created_this_run since previous tests may have created a workspace.
+
+    def setUp(self) -> None:
+        # We re-create a workspace for each test because each test will create its own TuningArtifactsWriter.
         DBGymWorkspace._num_times_created_this_run = 0
         ReplayTests.workspace = DBGymWorkspace(
             GymlibIntegtestManager.get_workspace_path()
@@ -63,6 +65,123 @@ class ReplayTests(unittest.TestCase):
         self.assertEqual(replay_data[0][1], 0)
         self.assertEqual(replay_data[1][1], 0)
 
+    def test_replay_skips_redundant_changes(self) -> None:
+        writer = TuningArtifactsWriter(
+            ReplayTests.workspace,
+            GymlibIntegtestManager.get_default_metadata(),
+        )
+        index = "CREATE INDEX idx_orders_custkey ON orders(o_custkey)"
+        # The first step restarts, the second changes nothing, and the third only changes a knob
+        #   which can be reloaded.
+        for sysknobs in [{"shared_buffers": "2GB"}, {}, {"work_mem": "64MB"}]:
+            writer.write_step(
+                DBMSConfigDelta(
+                    indexes=IndexesDelta([index]),
+                    sysknobs=SysKnobsDelta(sysknobs),
+                    qknobs=QueryKnobsDelta({}),
+                )
+            )
+        result = replay_detailed(ReplayTests.workspace, writer.tuning_artifacts_path)
+
+        self.assertEqual(len(result.step_timings), 4)
+        # The first restart starts Postgres.
+        self.assertEqual(result.stats.num_restarts, 2)
+        self.assertEqual(result.stats.num_noops, 1)
+        self.assertEqual(result.stats.num_reloads, 1)
+        self.assertEqual(result.stats.num_skipped_indexes, 2)
+        self.assertGreater(result.stats.get_time_saved(), 0)
+
+    def test_parallel_replay(self) -> None:
+        writer = TuningArtifactsWriter(
+            ReplayTests.workspace,
+            GymlibIntegtestManager.get_default_metadata(),
+        )
+        for i, sysknobs in enumerate(
+            [{"shared_buffers": "1GB"}, {"work_mem": "64MB"}, {"shared_buffers": "2GB"}]
+        ):
+            writer.write_step(
+                DBMSConfigDelta(
+                    indexes=IndexesDelta(
+                        [f"CREATE INDEX idx_orders_{i} ON orders(o_custkey)"]
+                    ),
+                    sysknobs=SysKnobsDelta(sysknobs),
+                    qknobs=QueryKnobsDelta({}),
+                )
+            )
+        result = replay_detailed(
+            ReplayTests.workspace, writer.tuning_artifacts_path, num_instances=2
+        )
+
+        self.assertEqual(len(result.step_timings), 4)
+        for _, num_timed_out in result.step_timings:
+            self.assertEqual(num_timed_out, 0)
+        # The instances each start once, and the first one also restarts for the first delta. The
+        #   second one fast-forwards to the third step and then restarts for the last delta.
+        self.assertEqual(result.stats.num_restarts, 4)
+
+    def test_resume_replay(self) -> None:
+        writer = TuningArtifactsWriter(
+            ReplayTests.workspace,
+            GymlibIntegtestManager.get_default_metadata(),
+        )
+        for i in range(3):
+            writer.write_step(
+                DBMSConfigDelta(
+                    indexes=IndexesDelta(
+                        [f"CREATE INDEX idx_orders_{i} ON orders(o_custkey)"]
+                    ),
+                    sysknobs=SysKnobsDelta({}),
+                    qknobs=QueryKnobsDelta({}),
+                )
+            )
+        result = replay_detailed(ReplayTests.workspace, writer.tuning_artifacts_path)
+        step_results = ReplayLog(result.log_path).read()
+        self.assertEqual(sorted(step_results), [0, 1, 2, 3])
+
+        # We simulate a replay which crashed while measuring the third step. Its log is in the
+        #   directory of the crashed run, like a real one would be.
+        crashed_log_path = (
+            ReplayTests.workspace.dbgym_this_run_path / "crashed_replay_log.jsonl"
+        )
+        crashed_log = ReplayLog(crashed_log_path)
+        header = ReplayLog(result.log_path).read_header()
+        assert header is not None
+        crashed_log.write_header(header)
+        crashed_log.append(step_results[0])
+        crashed_log.append(step_results[1])
+
+        # Resuming happens in a new run.
+        self.setUp()
+        resumed_result = replay_detailed(
+            ReplayTests.workspace,
+            writer.tuning_artifacts_path,
+            resume_log_path=crashed_log_path,
+        )
+        self.assertEqual(len(resumed_result.step_timings), 4)
+        # The finished steps aren't measured again.
+        self.assertEqual(resumed_result.step_timings[:2], result.step_timings[:2])
+        self.assertEqual(
+            sorted(ReplayLog(resumed_result.log_path).read()), [0, 1, 2, 3]
+        )
+        # The resumed replay only starts Postgres once.
+        self.assertEqual(resumed_result.stats.num_restarts, 1)
+
+        # A log of other tuning artifacts can't be resumed from.
+        other_log_path = (
+            ReplayTests.workspace.dbgym_this_run_path / "other_replay_log.jsonl"
+        )
+        other_log = ReplayLog(other_log_path)
+        other_log.write_header(
+            ReplayLogHeader("/other_tuning_artifacts", header.workload_path)
+        )
+        other_log.append(step_results[0])
+        with self.assertRaises(AssertionError):
+            replay_detailed(
+                ReplayTests.workspace,
+                writer.tuning_artifacts_path,
+                resume_log_path=other_log_path,
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
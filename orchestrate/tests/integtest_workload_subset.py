@@ -0,0 +1,61 @@
+import unittest
+
+from gymlib.infra_paths import get_workload_suffix, get_workload_symlink_path
+from gymlib.tests.gymlib_integtest_util import GymlibIntegtestManager
+from gymlib.workload import Workload
+from gymlib.workspace import DBGymWorkspace, fully_resolve_path
+
+from benchmark.tpch.constants import DEFAULT_TPCH_SEED
+from orchestrate.workload_subset import (
+    get_subset_workload_suffix,
+    select_workload_subset,
+)
+
+
+class WorkloadSubsetTests(unittest.TestCase):
+    workspace: DBGymWorkspace
+
+    @staticmethod
+    def setUpClass() -> None:
+        GymlibIntegtestManager.set_up_workspace()
+        # Reset _num_times_created_this_run since previous tests may have created a workspace.
+        DBGymWorkspace._num_times_created_this_run = 0
+        WorkloadSubsetTests.workspace = DBGymWorkspace(
+            GymlibIntegtestManager.get_workspace_path()
+        )
+
+    def test_select_workload_subset(self) -> None:
+        workload_suffix = get_workload_suffix(
+            GymlibIntegtestManager.BENCHMARK,
+            seed_start=DEFAULT_TPCH_SEED,
+            seed_end=DEFAULT_TPCH_SEED,
+            query_subset="all",
+        )
+        report = select_workload_subset(
+            WorkloadSubsetTests.workspace,
+            GymlibIntegtestManager.BENCHMARK,
+            GymlibIntegtestManager.SCALE_FACTOR,
+            workload_suffix,
+            5,
+        )
+        self.assertEqual(len(report.weights), 5)
+        self.assertTrue(all(error >= 0 for error in report.validation_errors))
+
+        # The subset is a regular workload.
+        subset_workload = Workload(
+            WorkloadSubsetTests.workspace,
+            fully_resolve_path(
+                get_workload_symlink_path(
+                    GymlibIntegtestManager.get_workspace_path(),
+                    GymlibIntegtestManager.BENCHMARK,
+                    GymlibIntegtestManager.SCALE_FACTOR,
+                    get_subset_workload_suffix(workload_suffix, 5),
+                )
+            ),
+        )
+        self.assertEqual(subset_workload.get_query_order(), list(report.weights))
+        self.assertEqual(subset_workload.get_weights(), report.weights)
+
+
+if __name__ == "__main__":
+    unittest.main()
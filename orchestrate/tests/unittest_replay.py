@@ -0,0 +1,132 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from orchestrate.replay import (
+    REPLAY_LOG_FNAME,
+    ReplayLog,
+    ReplayLogHeader,
+    ReplayStats,
+    ReplayStepResult,
+    get_index_sqls_to_run,
+    get_replay_log_path,
+    get_step_slices,
+)
+
+
+class ReplayTests(unittest.TestCase):
+    def test_get_index_sqls_to_run(self) -> None:
+        self.assertEqual(
+            get_index_sqls_to_run(
+                [
+                    "CREATE INDEX a ON lineitem (l_orderkey)",
+                    "CREATE INDEX b ON lineitem (l_partkey)",
+                    # This one is a duplicate of a statement in the same delta.
+                    "CREATE INDEX b ON lineitem (l_partkey)",
+                    # Unnamed indexes are never skipped.
+                    "CREATE INDEX ON lineitem (l_orderkey)",
+                ],
+                {"a"},
+            ),
+            [
+                "CREATE INDEX b ON lineitem (l_partkey)",
+                "CREATE INDEX ON lineitem (l_orderkey)",
+            ],
+        )
+
+    def test_get_index_sqls_to_run_stops_skipping_after_drop(self) -> None:
+        self.assertEqual(
+            get_index_sqls_to_run(
+                [
+                    "CREATE INDEX a ON lineitem (l_orderkey)",
+                    "DROP INDEX a",
+                    "CREATE INDEX a ON lineitem (l_partkey)",
+                ],
+                {"a"},
+            ),
+            ["DROP INDEX a", "CREATE INDEX a ON lineitem (l_partkey)"],
+        )
+
+    def test_get_step_slices(self) -> None:
+        self.assertEqual(
+            get_step_slices(10, 3), [range(0, 4), range(4, 7), range(7, 10)]
+        )
+        self.assertEqual(get_step_slices(4, 1), [range(0, 4)])
+        # There are never more slices than steps.
+        self.assertEqual(get_step_slices(2, 4), [range(0, 1), range(1, 2)])
+
+    def test_get_time_saved(self) -> None:
+        stats = ReplayStats(
+            num_restarts=1,
+            num_reloads=1,
+            num_noops=2,
+            restart_times=[2, 4],
+            reload_times=[0.5],
+        )
+        # The 2 no-ops and the reload each save a 3s restart but the reload took 0.5s.
+        self.assertEqual(stats.get_time_saved(), 8.5)
+        self.assertEqual(ReplayStats().get_time_saved(), 0)
+
+
+class ReplayLogTests(unittest.TestCase):
+    scratchspace_path: Path = Path()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.scratchspace_path = (
+            Path.cwd() / "orchestrate/tests/test_replay_log_scratchspace/"
+        )
+
+    def setUp(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+        self.scratchspace_path.mkdir(parents=True)
+
+    def tearDown(self) -> None:
+        if self.scratchspace_path.exists():
+            shutil.rmtree(self.scratchspace_path)
+
+    def test_append_and_read(self) -> None:
+        replay_log = ReplayLog(self.scratchspace_path / "replay_log.jsonl")
+        self.assertEqual(replay_log.read(), {})
+        step_results = [
+            ReplayStepResult(1, 30.0, 1, {"Q1": 10.0, "Q2": 20.0}),
+            # A parallel replay may append the steps out of order.
+            ReplayStepResult(0, 60.0, 0, {"Q1": 25.0, "Q2": 35.0}),
+        ]
+        for step_result in step_results:
+            replay_log.append(step_result)
+        self.assertEqual(replay_log.read(), {0: step_results[1], 1: step_results[0]})
+
+    def test_header(self) -> None:
+        replay_log = ReplayLog(self.scratchspace_path / "replay_log.jsonl")
+        self.assertIsNone(replay_log.read_header())
+        header = ReplayLogHeader("/tuning_artifacts", "/workload")
+        replay_log.write_header(header)
+        step_result = ReplayStepResult(0, 60.0, 0, {"Q1": 25.0, "Q2": 35.0})
+        replay_log.append(step_result)
+        self.assertEqual(replay_log.read_header(), header)
+        self.assertEqual(replay_log.read(), {0: step_result})
+
+    def test_get_replay_log_path(self) -> None:
+        log_path = get_replay_log_path(self.scratchspace_path)
+        self.assertEqual(log_path, self.scratchspace_path / REPLAY_LOG_FNAME)
+        log_path.touch()
+        # A second replay in the same run gets its own log.
+        self.assertEqual(
+            get_replay_log_path(self.scratchspace_path),
+            self.scratchspace_path / "replay_log_1.jsonl",
+        )
+
+    def test_read_ignores_incomplete_last_line(self) -> None:
+        replay_log = ReplayLog(self.scratchspace_path / "replay_log.jsonl")
+        step_result = ReplayStepResult(0, 60.0, 0, {"Q1": 25.0, "Q2": 35.0})
+        replay_log.append(step_result)
+        # This is what a crash in the middle of appending looks like.
+        with open(replay_log.log_path, "a") as f:
+            f.write('{"step": 1, "total_runt')
+        self.assertEqual(replay_log.read(), {0: step_result})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import logging
+import time
+from typing import Callable
+
+from gymlib.infra_paths import get_dbdata_tgz_symlink_path, get_pgbin_symlink_path
+from gymlib.pg import DEFAULT_POSTGRES_PORT
+from gymlib.pg_conn import PostgresConn
+from gymlib.workspace import (
+    DBGymWorkspace,
+    fully_resolve_path,
+    get_tmp_path_from_workspace_path,
+)
+
+DEFAULT_NUM_BENCHMARK_QUERIES = 10000
+# The query is trivial so that the measurement is dominated by the client overhead.
+BENCHMARK_QUERY = "SELECT 1"
+BENCHMARK_TIMEOUT = 10
+NUM_WARMUP_QUERIES = 100
+
+
+def benchmark_timing_overhead(
+    pg_conn: PostgresConn, num_queries: int = DEFAULT_NUM_BENCHMARK_QUERIES
+) -> dict[str, float]:
+    """
+    Returns the mean client-side time per query (in microseconds) of running a trivial query with a
+    statement timeout in two ways:
+     - "unpipelined" sends BEGIN, SET LOCAL statement_timeout, the query, and COMMIT in one round
+       trip each.
+     - "pipelined" sends them all in a single pipeline, which is what time_query() does.
+    Both go through the same code, so the difference between them is only due to the pipeline.
+    """
+
+    def time_unpipelined() -> None:
+        pg_conn._execute_with_timeout(
+            BENCHMARK_QUERY, BENCHMARK_TIMEOUT, use_pipeline=False
+        )
+
+    def time_pipelined() -> None:
+        pg_conn._execute_with_timeout(
+            BENCHMARK_QUERY, BENCHMARK_TIMEOUT, use_pipeline=True
+        )
+
+    def get_mean_time(fn: Callable[[], None]) -> float:
+        for _ in range(NUM_WARMUP_QUERIES):
+            fn()
+        start_time = time.time()
+        for _ in range(num_queries):
+            fn()
+        return (time.time() - start_time) * 1e6 / num_queries
+
+    results = {
+        "unpipelined_us_per_query": get_mean_time(time_unpipelined),
+        "pipelined_us_per_query": get_mean_time(time_pipelined),
+    }
+    results["speedup"] = (
+        results["unpipelined_us_per_query"] / results["pipelined_us_per_query"]
+    )
+    return results
+
+
+def timing_overhead_benchmark(
+    dbgym_workspace: DBGymWorkspace,
+    benchmark_name: str,
+    scale_factor: float,
+    num_queries: int,
+) -> dict[str, float]:
+    """
+    Runs benchmark_timing_overhead() on a fresh instance restored from the pristine snapshot and
+    writes the results to timing_overhead_benchmark.json in the run directory.
+    """
+    pg_conn = PostgresConn(
+        dbgym_workspace,
+        DEFAULT_POSTGRES_PORT,
+        fully_resolve_path(
+            get_dbdata_tgz_symlink_path(
+                dbgym_workspace.dbgym_workspace_path, benchmark_name, scale_factor
+            )
+        ),
+        get_tmp_path_from_workspace_path(dbgym_workspace.dbgym_workspace_path),
+        fully_resolve_path(
+            get_pgbin_symlink_path(dbgym_workspace.dbgym_workspace_path)
+        ),
+        None,
+    )
+    pg_conn.restore_pristine_snapshot()
+    try:
+        results = benchmark_timing_overhead(pg_conn, num_queries)
+    finally:
+        pg_conn.shutdown_postgres()
+
+    results_path = (
+        dbgym_workspace.dbgym_this_run_path / "timing_overhead_benchmark.json"
+    )
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=4)
+    logging.info(f"Wrote timing overhead benchmark results to {results_path}")
+    return results
@@ -0,0 +1,170 @@
+import json
+import logging
+import statistics
+from dataclasses import asdict, dataclass
+
+from gymlib.infra_paths import (
+    get_dbdata_tgz_symlink_path,
+    get_pgbin_symlink_path,
+    get_workload_dirname,
+    get_workload_symlink_path,
+)
+from gymlib.pg import DEFAULT_POSTGRES_PORT
+from gymlib.pg_conn import PostgresConn
+from gymlib.workload import WORKLOAD_BUNDLE_FNAME, Workload, write_workload_bundle
+from gymlib.workload_subset import (
+    WORKLOAD_WEIGHTS_FNAME,
+    get_plan_features,
+    get_subset_error,
+    select_subset,
+)
+from gymlib.workspace import (
+    DBGymWorkspace,
+    fully_resolve_path,
+    get_tmp_path_from_workspace_path,
+)
+
+SUBSET_REPORT_FNAME = "subset_report.json"
+DEFAULT_SUBSET_QUERY_TIMEOUT = 60
+# The subset is chosen with the baseline configuration. We then measure its error with these
+#   query knobs (applied to every query), which change the plans in different ways.
+DEFAULT_VALIDATION_QKNOBS = [
+    ["Set(enable_hashjoin off)"],
+    ["Set(enable_nestloop off)"],
+    ["Set(enable_indexscan off)", "Set(enable_bitmapscan off)"],
+    ["Set(enable_hashagg off)"],
+]
+
+
+@dataclass
+class SubsetReport:
+    # The weight of each qid in the subset, in the order of the workload.
+    weights: dict[str, float]
+    # The relative error of the weighted runtime of the subset with each of the validation query
+    #   knobs. The error is 0 with the baseline configuration by construction.
+    validation_qknobs: list[list[str]]
+    validation_errors: list[float]
+
+    def get_mean_error(self) -> float:
+        return statistics.mean(self.validation_errors)
+
+    def get_max_error(self) -> float:
+        return max(self.validation_errors)
+
+
+def get_subset_workload_suffix(workload_suffix: str, k: int) -> str:
+    return f"{workload_suffix}_subset{k}"
+
+
+def select_workload_subset(
+    dbgym_workspace: DBGymWorkspace,
+    benchmark_name: str,
+    scale_factor: float,
+    workload_suffix: str,
+    k: int,
+    query_timeout: float = DEFAULT_SUBSET_QUERY_TIMEOUT,
+    validation_qknobs: list[list[str]] = DEFAULT_VALIDATION_QKNOBS,
+) -> SubsetReport:
+    """
+    Picks k representative queries of the workload (see gymlib.workload_subset) and writes them as
+    a workload whose suffix is get_subset_workload_suffix(workload_suffix, k). The weights are in
+    the workload's WORKLOAD_WEIGHTS_FNAME and the report (including the measured error) is in its
+    SUBSET_REPORT_FNAME.
+
+    A query which times out counts as taking query_timeout seconds.
+    """
+    assert len(validation_qknobs) > 0, "validation_qknobs must not be empty."
+    expected_subset_symlink_path = get_workload_symlink_path(
+        dbgym_workspace.dbgym_workspace_path,
+        benchmark_name,
+        scale_factor,
+        get_subset_workload_suffix(workload_suffix, k),
+    )
+    workload = Workload(
+        dbgym_workspace,
+        fully_resolve_path(
+            get_workload_symlink_path(
+                dbgym_workspace.dbgym_workspace_path,
+                benchmark_name,
+                scale_factor,
+                workload_suffix,
+            )
+        ),
+    )
+    pg_conn = PostgresConn(
+        dbgym_workspace,
+        DEFAULT_POSTGRES_PORT,
+        fully_resolve_path(
+            get_dbdata_tgz_symlink_path(
+                dbgym_workspace.dbgym_workspace_path, benchmark_name, scale_factor
+            )
+        ),
+        get_tmp_path_from_workspace_path(dbgym_workspace.dbgym_workspace_path),
+        fully_resolve_path(
+            get_pgbin_symlink_path(dbgym_workspace.dbgym_workspace_path)
+        ),
+        None,
+    )
+    pg_conn.restore_pristine_snapshot()
+    try:
+        baseline_runtimes = {}
+        plan_features = {}
+        for qid in workload.get_query_order():
+            timing = pg_conn.time_query_detailed(
+                workload.get_query(qid), add_explain=True, timeout=query_timeout
+            )
+            baseline_runtimes[qid] = timing.runtime
+            # There's no plan if the query timed out.
+            if timing.explain_data is not None:
+                plan_features[qid] = get_plan_features(timing.explain_data["Plan"])
+        weights = select_subset(baseline_runtimes, plan_features, k)
+
+        validation_errors = []
+        for query_knobs in validation_qknobs:
+            runtimes = {
+                qid: pg_conn.time_query_detailed(
+                    workload.get_query(qid), query_knobs, timeout=query_timeout
+                ).runtime
+                for qid in workload.get_query_order()
+            }
+            validation_errors.append(get_subset_error(weights, runtimes))
+            logging.info(
+                f"The subset has an error of {validation_errors[-1]:.1%} with {query_knobs}"
+            )
+    finally:
+        pg_conn.shutdown_postgres()
+
+    report = SubsetReport(weights, validation_qknobs, validation_errors)
+    subset_path = dbgym_workspace.dbgym_this_run_path / get_workload_dirname(
+        benchmark_name, scale_factor, get_subset_workload_suffix(workload_suffix, k)
+    )
+    subset_path.mkdir(parents=False, exist_ok=False)
+    with open(subset_path / "order.txt", "w") as f:
+        for qid in weights:
+            query_path = subset_path / f"{qid}.sql"
+            with open(query_path, "w") as qf:
+                qf.write(workload.get_query(qid))
+            f.write(f"{qid},{fully_resolve_path(query_path)}\n")
+    write_workload_bundle(
+        subset_path / WORKLOAD_BUNDLE_FNAME,
+        [(qid, workload.get_query(qid)) for qid in weights],
+    )
+    with open(subset_path / WORKLOAD_WEIGHTS_FNAME, "w") as f:
+        json.dump(weights, f, indent=4)
+    with open(subset_path / SUBSET_REPORT_FNAME, "w") as f:
+        json.dump(
+            {
+                **asdict(report),
+                "mean_error": report.get_mean_error(),
+                "max_error": report.get_max_error(),
+            },
+            f,
+            indent=4,
+        )
+
+    subset_symlink_path = dbgym_workspace.link_result(subset_path)
+    assert subset_symlink_path == expected_subset_symlink_path
+    logging.info(
+        f"Generated {subset_symlink_path} with a mean error of {report.get_mean_error():.1%} and a max error of {report.get_max_error():.1%}"
+    )
+    return report